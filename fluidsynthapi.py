@@ -0,0 +1,3738 @@
+#!/usr/bin/python
+#
+# Kevin Seifert - GPL 2015
+# 
+# The FluidSynth api, without a gui.  fluidsynthgui.py wraps it with wx,
+# fluidsynthcli.py runs it from the command line.  this module never
+# imports wx, so it loads fast on a box without a display.
+# 
+# See README.txt for more details.
+# 
+# Classes defined below:
+# 
+#   FluidSynthReply - a reply to a command that is still in flight.
+# 
+#   FluidSynthReader - buffered reader for the fluidsynth socket.
+# 
+#   FluidSynthBatch - collects commands, and writes them to the socket at once.
+# 
+#   FluidSynthStats - counters and latency histograms for each command.
+# 
+#   FluidSynthStatsServer - serves FluidSynthStats as text over http.
+# 
+#   FluidSynthTracer - keeps the last socket io events in memory, for 
+#                   debugging.
+# 
+#   FluidSynthTcpTransport - the fluidsynth shell over a tcp socket.
+# 
+#   FluidSynthPipeTransport - the fluidsynth shell over stdin/stdout of the
+#                   fluidsynth process.
+# 
+#   FluidSynthApi - this is the core api that interfaces with fluidsynth
+#                   using the socket api.
+# 
+#   FluidSynthPool - several fluidsynth engines, with the MIDI channels 
+#                   shared out between them.
+# 
+#   FluidSynthFuture - the result of a call that runs on a worker thread.
+# 
+#   AsyncFluidSynthApi - runs FluidSynthApi calls on a worker thread, so the
+#                   caller never blocks on the socket.
+# 
+#   FluidSynthThrottle - sends parameter updates at a limited rate, the
+#                   latest value always wins.
+# 
+#   FluidSynthResidency - keeps recently used fonts loaded, up to a memory
+#                   budget.
+# 
+#   FluidSynthSettings - the synth settings this client wrote or read, so
+#                   reading them costs no round trip.
+# 
+#   SoundFontFile - reads the preset list of a .sf2 file, without loading
+#                   the samples.
+# 
+#   SoundFontCatalog - remembers the presets of every .sf2 file seen, on disk.
+# 
+#   SoundFontScanner - walks a library of sound fonts in parallel.
+# 
+#   TrigramIndex - search-as-you-type index over a list of names.
+# 
+#   PresetIndex - searches preset names across every sound font in the
+#                   catalog.
+# 
+#   FluidSynthSession - the channels and levels saved by the gui 
+#                   (data.json), to restore them.
+# 
+# Note on whitespace: 
+#    I'm using tabs for indentation, with my tab width set at 4 spaces.
+
+
+import sys 
+import os 
+import re
+import time
+import socket
+import subprocess
+import traceback
+import optparse
+import signal
+import json
+import threading
+import collections
+import random
+import Queue
+import mmap
+import struct
+import sqlite3
+import BaseHTTPServer
+import itertools
+import select
+
+# optional: os.scandir (python 3.5+) or the scandir package.
+# scandir returns the file type with each name, which saves a stat call
+# per file.  this matters on network mounts.
+try:
+	from os import scandir
+except ImportError:
+	try:
+		from scandir import scandir
+	except ImportError:
+		scandir = None
+
+
+# a reply to a blocking command that is still in flight.
+# replies come back in the order the commands were sent. reading a reply
+# first reads every reply that was requested before it.
+class FluidSynthReply:
+
+	def __init__(self, api, sentinel):
+		self.api = api                 # the api that owns the socket.
+		self.sentinel = sentinel       # text that marks the end of this reply.
+		self.data = None               # the data packet, once read.
+		self.verb = None               # command name (only kept for stats).
+		self.sent = 0                  # time the command was sent (only kept for stats).
+
+
+	# has the data packet been read from the socket?
+	def done(self):
+		return self.data != None
+
+
+	# wait for the data packet
+	def result(self):
+		if not self.done():
+			self.api.collect(self)
+		return self.data
+
+
+# end class
+
+
+# buffered reader for the fluidsynth socket.
+# received data is appended to one buffer, and only the new data (plus
+# enough overlap for a marker split across two chunks) is searched for the
+# end marker.  so reading a reply costs linear time in the size of the reply,
+# even for large replies like `inst` on a big GM bank.
+class FluidSynthReader:
+
+	def __init__(self, sock, buffersize=4096):
+		self.sock = sock               # connected socket (or transport).
+		self.buffersize = buffersize   # max bytes per recv().
+		self.buffer = bytearray()      # received data not returned yet.
+		self.max_reads = 1000000       # avoid infinite loop
+
+
+	# read up to the marker, return everything before it.
+	# the marker is removed, data after the marker stays in the buffer.
+	# raises on timeout or closed connection (data stays in the buffer).
+	def readUntil(self, marker):
+		buf = self.buffer
+		start = 0 # no marker before this position
+		i=0
+		while i<self.max_reads:
+			i+=1
+			pos = buf.find(marker, start)
+			if pos > -1:
+				data = str(buf[0:pos])
+				del buf[0:pos+len(marker)]
+				return data
+
+			# NOTE: the tail may hold a fragment of the marker
+			start = max(0, len(buf) - len(marker) + 1)
+			part = self.sock.recv(self.buffersize)
+			if part == '':
+				raise Exception('connection closed')
+			buf += part
+
+		raise Exception('too many reads')
+
+
+	# return everything in the buffer, and empty it
+	def drain(self):
+		data = str(self.buffer)
+		del self.buffer[:]
+		return data
+
+
+# end class
+
+
+# collects commands, and writes them to the socket at once.
+# use with the `with` statement:
+#
+#    with api.batch() as batch:
+#        api.setReverb(True)          # non-blocking commands are buffered
+#        reply = batch.cmd('fonts')   # blocking commands return a reply
+#    data = batch.results()           # read all replies in one pass
+#
+# a blocking api call inside the batch (like loadSoundFont) writes the
+# commands collected so far, before it waits for the response.
+# batches only collect commands sent from the thread that opened them.
+class FluidSynthBatch:
+
+	def __init__(self, api):
+		self.api = api                 # the api that owns the socket.
+		self.replies = []              # replies requested with cmd().
+
+
+	def __enter__(self):
+		self.api.beginBatch()
+		return self
+
+
+	def __exit__(self, type, value, traceback):
+		self.api.endBatch()
+		return False
+
+
+	# send command in the batch, do not wait for the response.
+	#   returns: FluidSynthReply
+	def cmd(self, packet):
+		reply = self.api.cmdPipelined(packet)
+		self.replies.append(reply)
+		return reply
+
+
+	# read all replies requested with cmd(), in order.
+	#   returns: list of data packets
+	def results(self):
+		return [reply.result() for reply in self.replies]
+
+
+# end class
+
+
+# counters for the socket api: commands by name, bytes in and out, 
+# timeouts, and a latency histogram for each blocking command.
+# the latency is from send until the reply is read.
+# stats are off unless --stats or --stats-port is used, and then the api
+# only pays for a few counter updates per command.
+#
+#    stats = api.getStats()
+#    stats['commands']['load']['p95']
+#    0.412
+class FluidSynthStats:
+
+	# upper bounds of the histogram buckets, in seconds
+	buckets = [.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, 
+		.1, .25, .5, 1, 2.5, 5, 10, float('inf')]
+
+	def __init__(self):
+		self.started = time.time()     # when counting started.
+		self.counts = {}               # command: number sent.
+		self.histograms = {}           # command: count per bucket (blocking only).
+		self.latency = {}              # command: total seconds (blocking only).
+		self.bytesOut = 0              # bytes written to the socket.
+		self.bytesIn = 0               # bytes read from the socket.
+		self.timeouts = 0              # reads that timed out.
+		self.sentinelMisses = 0        # replies read without their sentinel.
+		self.lock = threading.Lock()
+
+
+	# command name, for example 'load' for 'load "/home/a.sf2"'
+	def getVerb(self, packet):
+		parts = packet.split(None, 1)
+		if len(parts) == 0:
+			return ''
+		return parts[0]
+
+
+	# count a command.
+	# returns the command name
+	def countCommand(self, packet):
+		verb = self.getVerb(packet)
+		with self.lock:
+			self.counts[verb] = self.counts.get(verb, 0) + 1
+		return verb
+
+
+	# add the time a blocking command took
+	def countLatency(self, verb, seconds):
+		i = 0
+		while seconds > self.buckets[i]:
+			i += 1
+		with self.lock:
+			histogram = self.histograms.get(verb)
+			if histogram == None:
+				histogram = self.histograms[verb] = [0] * len(self.buckets)
+			histogram[i] += 1
+			self.latency[verb] = self.latency.get(verb, 0) + seconds
+
+
+	# note: the api sends and reads from many threads (gui, worker, 
+	# throttle, proxy), so every counter is updated under the lock
+	def countBytesOut(self, size):
+		with self.lock:
+			self.bytesOut += size
+
+
+	def countBytesIn(self, size):
+		with self.lock:
+			self.bytesIn += size
+
+
+	def countTimeout(self):
+		with self.lock:
+			self.timeouts += 1
+
+
+	def countSentinelMiss(self):
+		with self.lock:
+			self.sentinelMisses += 1
+
+
+	# latency that p (0 to 1) of the commands were faster than.
+	# this is the upper bound of the histogram bucket, in seconds.
+	def getPercentile(self, histogram, p):
+		total = sum(histogram)
+		if total == 0:
+			return 0
+		seen = 0
+		for i in range(len(histogram)):
+			seen += histogram[i]
+			if seen >= p * total:
+				return self.buckets[i]
+		return self.buckets[-1]
+
+
+	# all counters as a dict
+	def getStats(self):
+		with self.lock:
+			commands = {}
+			for verb in self.counts:
+				histogram = self.histograms.get(verb, [0] * len(self.buckets))
+				replies = sum(histogram)
+				commands[verb] = {
+					'count': self.counts[verb],
+					'replies': replies,
+					'mean': self.latency.get(verb, 0) / replies if replies else 0,
+					'p50': self.getPercentile(histogram, .50),
+					'p95': self.getPercentile(histogram, .95),
+					'p99': self.getPercentile(histogram, .99),
+					'histogram': list(histogram),
+				}
+			return {
+				'uptime': time.time() - self.started,
+				'bytesOut': self.bytesOut,
+				'bytesIn': self.bytesIn,
+				'timeouts': self.timeouts,
+				'sentinelMisses': self.sentinelMisses,
+				'commands': commands,
+			}
+
+
+	# summary table, for example:
+	#
+	# command         count    replies    mean ms     p50 ms     p95 ms     p99 ms
+	# load                4          4    212.310    250.000    500.000    500.000
+	def getText(self):
+		stats = self.getStats()
+		lines = ['command         count    replies    mean ms     p50 ms     p95 ms     p99 ms']
+		for verb in sorted(stats['commands']):
+			command = stats['commands'][verb]
+			lines.append('%-12s %8d %10d %10.3f %10.3f %10.3f %10.3f' % (verb,
+				command['count'], command['replies'], command['mean'] * 1000,
+				command['p50'] * 1000, command['p95'] * 1000, command['p99'] * 1000))
+		lines.append('bytes out: %d  bytes in: %d  timeouts: %d  sentinel misses: %d' % (
+			stats['bytesOut'], stats['bytesIn'], stats['timeouts'], stats['sentinelMisses']))
+		return '\n'.join(lines) + '\n'
+
+
+	# prometheus text format, for a metrics scraper
+	def getMetrics(self):
+		stats = self.getStats()
+		lines = []
+		for key in ['bytesOut', 'bytesIn', 'timeouts', 'sentinelMisses']:
+			lines.append('fluidsynth_%s_total %d' % (key, stats[key]))
+		for verb in sorted(stats['commands']):
+			command = stats['commands'][verb]
+			label = 'command="%s"' % verb.replace('"', '')
+			lines.append('fluidsynth_commands_total{%s} %d' % (label, command['count']))
+			seen = 0
+			for i in range(len(self.buckets)):
+				seen += command['histogram'][i]
+				bound = '+Inf' if i == len(self.buckets)-1 else repr(self.buckets[i])
+				lines.append('fluidsynth_latency_seconds_bucket{%s,le="%s"} %d' % (label, bound, seen))
+			lines.append('fluidsynth_latency_seconds_sum{%s} %f' % (label, command['mean'] * command['replies']))
+			lines.append('fluidsynth_latency_seconds_count{%s} %d' % (label, command['replies']))
+		return '\n'.join(lines) + '\n'
+
+
+# end class
+
+
+# serves FluidSynthStats over http on localhost, so a metrics scraper 
+# (or curl) can poll it:
+#
+#    curl http://localhost:9801/         summary table
+#    curl http://localhost:9801/metrics  prometheus text format
+class FluidSynthStatsServer(threading.Thread):
+
+	def __init__(self, stats, port):
+		threading.Thread.__init__(self, name='fluidsynth-stats')
+		self.daemon = True
+
+		class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+			def do_GET(handler):
+				if handler.path.startswith('/metrics'):
+					body = stats.getMetrics()
+				else:
+					body = stats.getText()
+				handler.send_response(200)
+				handler.send_header('Content-Type', 'text/plain; charset=utf-8')
+				handler.send_header('Content-Length', str(len(body)))
+				handler.end_headers()
+				handler.wfile.write(body)
+
+			def log_message(handler, format, *args):
+				pass # quiet
+
+		self.server = BaseHTTPServer.HTTPServer(('localhost', port), Handler)
+		self.port = self.server.server_address[1]
+
+
+	def run(self):
+		self.server.serve_forever()
+
+
+	def close(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+
+# end class
+
+
+# keeps the last `size` socket io events in a ring buffer.
+# an event is stored as (time, kind, data), with no formatting or copying,
+# so tracing is cheap enough to leave on while playing.  the text is only
+# made when the buffer is dumped: on request (kill -USR1), or when a reply
+# is lost (see FluidSynthApi.readUntil).
+#
+# next() on itertools.count and a list store are each atomic in CPython,
+# so threads can trace without taking a lock.  a reader may see a slot 
+# that is being overwritten, which only costs one event in a dump.
+#
+#    tracer = FluidSynthTracer(4096)
+#    tracer.trace('send', 'fonts\n')
+#    tracer.dump()
+class FluidSynthTracer:
+
+	def __init__(self, size=4096):
+		self.size = size               # max events kept.
+		self.events = [None] * size    # (time, kind, data). position is count % size.
+		self.counter = itertools.count() # number of events traced.
+		self.started = time.time()
+
+
+	# record an event.  data is kept as is, and formatted later
+	def trace(self, kind, data):
+		self.events[next(self.counter) % self.size] = (time.time(), kind, data)
+
+
+	# events in the order they were traced, oldest first
+	def getEvents(self):
+		events = [event for event in self.events if event != None]
+		events.sort(key=lambda event: event[0])
+		return events
+
+
+	# write the events as text, for example:
+	#
+	#      12.401722 send  'load "/home/Music/sf2/Brass 4.SF2"\n'
+	#
+	# maxLength: data longer than this is cut (0 = no limit)
+	def dump(self, out=None, maxLength=200):
+		if out == None:
+			out = sys.stderr
+		events = self.getEvents()
+		out.write('--- trace: last %d events ---\n' % len(events))
+		for (when, kind, data) in events:
+			text = repr(data)
+			if maxLength > 0 and len(data) > maxLength:
+				text = repr(data[:maxLength]) + '... (' + str(len(data)) + ' bytes)'
+			out.write('%14.6f %-5s %s\n' % (when - self.started, kind, text))
+		out.write('--- end trace ---\n')
+		out.flush()
+
+
+# end class
+
+
+# transports
+# FluidSynthApi talks to the fluidsynth shell through a transport.  every
+# transport has the same methods as a socket: sendall(data), recv(size) 
+# and close().  recv returns '' when the engine is gone, and raises 
+# socket.timeout if nothing arrives in time.
+
+
+# the fluidsynth shell over tcp (fluidsynth -s, port 9800).
+# the api writes many small commands and waits for the reply, so Nagle's
+# algorithm is turned off: otherwise a small write that follows another
+# small write waits for the ack of the first (up to 40 ms on linux).
+#
+#    transport = FluidSynthTcpTransport('localhost', 9800)
+#    transport.connect()
+class FluidSynthTcpTransport:
+
+	def __init__(self, host='localhost', port=9800, timeout=8, noDelay=True,
+			keepAlive=True, bufferSize=256*1024):
+		self.host = host               # fluidsynth hostname.
+		self.port = port               # fluidsynth socket port.
+		self.timeout = timeout         # read timeout in seconds.
+		self.noDelay = noDelay         # send small writes right away (TCP_NODELAY).
+		self.keepAlive = keepAlive     # notice a dead engine on an idle connection.
+		self.bufferSize = bufferSize   # kernel send/receive buffers (0 = os default).
+		self.sock = None
+
+
+	def connect(self):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		try:
+			if self.noDelay:
+				sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			if self.keepAlive:
+				sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+			if self.bufferSize > 0:
+				sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.bufferSize)
+				sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.bufferSize)
+			sock.connect((self.host, self.port))
+		except:
+			sock.close()
+			raise
+		sock.settimeout(self.timeout)
+		self.sock = sock
+
+
+	def sendall(self, data):
+		self.sock.sendall(data)
+
+
+	def recv(self, size):
+		return self.sock.recv(size)
+
+
+	def close(self):
+		try:
+			self.sock.shutdown(socket.SHUT_RDWR)
+		except Exception as e:
+			pass # connection already dropped
+		self.sock.close()
+
+
+	def getName(self):
+		return 'tcp ' + self.host + ':' + str(self.port)
+
+
+# end class
+
+
+# the fluidsynth shell over the stdin/stdout pipes of the fluidsynth process
+# (started without -i).  no port is needed, and no other client can take the
+# shell.  the interactive shell prints a prompt before each command, the
+# prompts are removed from the output here.
+#
+#    process = subprocess.Popen(['fluidsynth', '-l'], stdin=subprocess.PIPE, 
+#        stdout=subprocess.PIPE)
+#    transport = FluidSynthPipeTransport(process)
+class FluidSynthPipeTransport:
+
+	def __init__(self, process, timeout=8, prompt='> '):
+		self.process = process         # subprocess.Popen, with stdin and stdout pipes.
+		self.timeout = timeout         # read timeout in seconds.
+		self.prompt = prompt           # printed by the shell before each command.
+		self.lineStart = True          # is the next byte at the start of a line?
+		self.held = ''                 # start of a line that may be a prompt.
+		self.eof = False               # has the process closed its output?
+
+
+	def sendall(self, data):
+		self.process.stdin.write(data)
+		self.process.stdin.flush()
+
+
+	# read up to size bytes, without the prompts.
+	# note: reads the file descriptor, not the file object, so the read
+	# returns as soon as some data is there.
+	def recv(self, size):
+		fd = self.process.stdout.fileno()
+		while True:
+			(readable, writable, failed) = select.select([fd], [], [], self.timeout)
+			if len(readable) == 0:
+				raise socket.timeout('timed out')
+			data = os.read(fd, size)
+			if data == '':
+				# engine exited.  return what was held once, then '' 
+				self.eof = True
+				data = self.held
+				self.held = ''
+				return data
+			data = self.stripPrompts(data)
+			if data != '':
+				return data
+
+
+	# remove prompts at the start of lines.  a line start that could still
+	# become a prompt is held until the next read.
+	def stripPrompts(self, data):
+		if self.prompt == '':
+			return data
+		out = []
+		data = self.held + data
+		self.held = ''
+		pos = 0
+		while pos < len(data):
+			if self.lineStart:
+				rest = data[pos:pos+len(self.prompt)]
+				if rest == self.prompt:
+					pos += len(self.prompt) # prompt, drop it
+					continue
+				if self.prompt.startswith(rest):
+					self.held = rest # wait for more data
+					break
+				self.lineStart = False
+			end = data.find('\n', pos)
+			if end < 0:
+				out.append(data[pos:])
+				break
+			out.append(data[pos:end+1])
+			pos = end + 1
+			self.lineStart = True
+		return ''.join(out)
+
+
+	def close(self):
+		try:
+			self.process.stdin.close()
+		except Exception as e:
+			pass
+
+
+	def getName(self):
+		return 'pipe to pid ' + str(self.process.pid)
+
+
+# end class
+
+
+# API
+# this is the api that writes data to and read data from the command line interface.
+# this communicates with fluidsynth over the socket 9800.
+class FluidSynthApi:
+
+	# connect: False to connect later, with start()
+	def __init__(self,options,args,connect=True):
+
+		print('init FluidSynth api...')
+
+		# cli
+		self.options = options         # key/value pairs.
+		self.args = args               # bare args.
+
+		# memory/font management
+		# note: fonts on the 16 channels are always kept.  other fonts stay
+		#       loaded while they fit in the memory budget (see --font-memory),
+		#       least recently used fonts are unloaded first.
+		self.fontFilesLoaded={}        # font_id: font_file.
+		self.residency = FluidSynthResidency(options.fontMemory * 1024 * 1024)
+		self.settings = FluidSynthSettings(options.settingsMaxAge) # get answered locally.
+		self.fontsInUse=[-1] * 16      # font_id. position is channel.
+		self.instrumentsInUse=['']*16  # instrument_name. position is channel.
+		self.selectedChannel = 1       # 1-based. all new instruments load here.
+		self.activeChannel = 1         # 1-based. last used channel.
+		self.activeSoundFontId = -1    # last font loaded.
+		self.activeSoundFontFile = ''  # last SoundFont loaded.
+		self.activeInstrument = ''     # last instrument loaded.
+
+		# socket io settings
+		self.transportName = options.transport # 'tcp' or 'pipe'.
+		self.host = options.host       # fluidsynth hostname.
+		self.port = options.port       # fluidsynth socket port.
+		self.noDelay = True            # tcp: send small writes right away.
+		self.buffersize=65536          # max bytes per read.
+		self.readtimeout=8             # read timeout in seconds (blocking IO only).
+		self.fluidsynth = None         # the fluidsynth system process.
+		self.transport = None          # connection to the fluidsynth shell.
+		self.connected = False         # is the transport connected?
+		self.fluidsynthOutput = collections.deque(maxlen=50) # last lines printed by the process.
+		self.fluidsynthBanner = threading.Event() # set when the process prints its banner.
+		self.startTimeout = 10         # max seconds for a spawned fluidsynth to listen.
+		self.startupTime = None        # seconds until fluidsynth was ready.
+		self.lastCpuSample = None      # (time, cpu seconds) of the process, see getCpuLoad.
+		self.eof = '.'                 # arbitrary text to mark the end of stream.
+		self.debug = options.debug     # enable verbose logging to stdout.
+		self.tracer = None             # FluidSynthTracer of socket io (None = off).
+
+		if options.trace:
+			self.tracer = FluidSynthTracer(options.traceSize)
+
+		# pipelined io
+		# every blocking command is closed by its own sentinel, so many
+		# commands can be in flight on the socket at once.
+		self.sessionId = '%06x' % random.randrange(0x1000000) # nonce for this client.
+		self.sentinelId = 0            # counter, makes each sentinel unique.
+		self.pending = collections.deque() # replies in flight, in send order.
+		self.reader = None             # buffered reader for the socket.
+		self.sendLock = threading.RLock() # keep a command and its sentinel together.
+		self.readLock = threading.RLock() # only one thread drains the socket.
+		self.local = threading.local() # per thread batch of unsent commands.
+		self.restoreWindow = 3         # loads in flight in restoreChannels.
+		self.stats = None              # FluidSynthStats (None = off).
+
+		if options.stats or options.statsPort:
+			self.stats = FluidSynthStats()
+
+		# see `man fluidsynth` for explanation of cli options
+		#
+		# -C, --chorus
+		#    Turn the chorus on or off [0|1|yes|no, default = on]
+		# -i, --no-shell
+		#    Don't read commands from the shell [default = yes]
+		# -g, --gain
+		#    Set the master gain [0 < gain < 10, default = 0.2]
+		# -j, --connect-jack-outputs
+		#    Attempt to connect the jack outputs to the physical ports
+		# -p, --portname=[label]
+		#    Set MIDI port name (alsa_seq, coremidi drivers)
+		# -s, --server
+		#    Start FluidSynth as a server process
+		# -R, --reverb
+		#    Turn the reverb on or off [0|1|yes|no, default = on]
+		self.fluidsynthCmd = 'fluidsynth -sli -g 5 -C 0 -R 0 -p FluidSynth-GUI'
+
+		# with --transport pipe, the shell is read from stdin (no -i), 
+		# and no server is needed (no -s)
+		self.fluidsynthPipeCmd = 'fluidsynth -l -g 5 -C 0 -R 0 -p FluidSynth-GUI'
+
+
+		# cli option overrides
+		if ( options.fluidsynthCmd != '' ):
+			self.fluidsynthCmd = options.fluidsynthCmd
+			self.fluidsynthPipeCmd = options.fluidsynthCmd
+
+		if connect:
+			self.start()
+
+
+	# connect to fluidsynth (starting it if needed), then run the command
+	# line args.  this may take seconds if fluidsynth has to start.
+	# returns True if connected
+	def start(self):
+
+		# a new engine may have other settings
+		self.settings.invalidate()
+
+		# set up/test server
+		if not self.initFluidSynth():
+			return False
+
+		# process command line args passed to fluid synth
+		if len(self.args) > 0:
+			with self.batch():
+				for arg in self.args:
+					self.cmd(arg,True)
+
+		return True
+
+
+	def __del__(self):
+		self.closeFluidSynth()
+
+
+	#######################################################################
+	# socket api
+	#######################################################################
+
+	# test/initialize connection to fluidsynth
+	def initFluidSynth(self):
+		if self.transportName == 'pipe':
+			return self.initFluidSynthPipe()
+
+		try:
+			self.connect()
+			# looks good
+			return True
+
+		except Exception as e:
+			print('error: FluidSynth not running?')
+			print('could not connect to socket: ' + str(self.port))
+			print(e)
+
+		try:
+			# try starting fluidsynth command line process
+			print('trying to start fluidsynth ...')
+			print(self.fluidsynthCmd)
+			start = time.time()
+			cmd = self.fluidsynthCmd.split()
+			self.fluidsynth = subprocess.Popen(cmd, shell=False, 
+				stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+			self.watchFluidSynthOutput(self.fluidsynth.stdout)
+			self.watchFluidSynthOutput(self.fluidsynth.stderr)
+
+			if self.waitForFluidSynth(start):
+				self.startupTime = time.time() - start
+				print('fluidsynth ready in %.3f s' % self.startupTime)
+				return True
+
+		except Exception as e:
+			print('error: fluidsynth could not start')
+			print(e)
+
+		print('error: giving up. :(')
+		print('you may try stopping any fluidsynth that is currently running.')
+		print('for example, on linux:')
+		print('    killall fluidsynth')
+		print('    killall -s 9 fluidsynth')
+		return False
+
+
+	# start fluidsynth, and talk to its shell over stdin/stdout
+	# (see FluidSynthPipeTransport).
+	# returns True if the shell answers
+	def initFluidSynthPipe(self):
+		try:
+			print('starting fluidsynth (pipe) ...')
+			print(self.fluidsynthPipeCmd)
+			start = time.time()
+			cmd = self.fluidsynthPipeCmd.split()
+			self.fluidsynth = subprocess.Popen(cmd, shell=False, bufsize=0,
+				stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+			self.watchFluidSynthOutput(self.fluidsynth.stderr)
+			self.transport = FluidSynthPipeTransport(self.fluidsynth, self.startTimeout)
+			self.reader = FluidSynthReader(self.transport, self.buffersize)
+			self.connected = True
+
+			# the banner is printed before the first reply, skip it.
+			# this also waits until the shell reads commands.
+			self.read()
+			self.transport.timeout = self.readtimeout
+			if self.transport.eof or self.fluidsynth.poll() != None:
+				self.connected = False
+				time.sleep(.05) # let the process exit, and the output thread catch up
+				print('error: fluidsynth exited with code ' + str(self.fluidsynth.poll()))
+				for line in self.fluidsynthOutput:
+					print('    ' + line)
+				return False
+
+			self.startupTime = time.time() - start
+			print('connected to ' + self.transport.getName())
+			print('fluidsynth ready in %.3f s' % self.startupTime)
+			return True
+
+		except Exception as e:
+			self.connected = False
+			print('error: fluidsynth could not start')
+			print(e)
+
+		return False
+
+
+	# keep reading what the process prints, so it never blocks on a full 
+	# pipe.  the last lines are kept, to explain a failed start.
+	def watchFluidSynthOutput(self, stream):
+		def run():
+			for line in iter(stream.readline, ''):
+				self.fluidsynthOutput.append(line.rstrip())
+				if line.startswith('FluidSynth'):
+					self.fluidsynthBanner.set() # for example: FluidSynth version 1.1.9
+		thread = threading.Thread(target=run, name='fluidsynth-output')
+		thread.daemon = True
+		thread.start()
+
+
+	# wait until the spawned process accepts connections.
+	# the port is polled with a short backoff, and polled again as soon as
+	# the banner is printed.  stops right away if the process exits.
+	# returns True if connected
+	def waitForFluidSynth(self, start):
+		delay = .01
+		while time.time() - start < self.startTimeout:
+			try:
+				self.connect()
+				return True
+			except socket.error as e:
+				pass
+
+			if self.fluidsynth.poll() != None:
+				time.sleep(.05) # let the output threads catch up
+				print('error: fluidsynth exited with code ' + str(self.fluidsynth.returncode))
+				for line in self.fluidsynthOutput:
+					print('    ' + line)
+				return False
+
+			banner = self.fluidsynthBanner.is_set()
+			self.fluidsynthBanner.wait(delay)
+			if not banner and self.fluidsynthBanner.is_set():
+				delay = .01 # process is up, the port should open soon
+			else:
+				delay = min(delay * 2, .2)
+
+		print('error: fluidsynth did not listen on port ' + str(self.port) + 
+			' within ' + str(self.startTimeout) + ' s')
+		for line in self.fluidsynthOutput:
+			print('    ' + line)
+		return False
+
+
+	# cleanup
+	def closeFluidSynth(self):
+		self.close()
+		try:
+			self.fluidsynth.kill()
+		except:
+			print('fluidsynth will be left running')
+
+
+	# create socket connection.
+	# NOTE: do NOT connect on every request (like HTTP).
+	# fluidsynth seems to only be able to spawn a small number of total sockets.
+	# reuse the same socket connection for all io, or you will run out of 
+	# fluidsynth threads.  to share one fluidsynth between programs, see
+	# fluidsynthproxy.py
+	def connect(self):
+		transport = FluidSynthTcpTransport(self.host, self.port, 
+			self.readtimeout, self.noDelay)
+		transport.connect()
+		self.transport = transport
+		self.reader = FluidSynthReader(self.transport, self.buffersize)
+		self.connected = True
+		print('connected to port: ' + str(self.port))
+
+
+	# cleanup sockets when finished
+	def close(self):
+		if self.transport == None:
+			return
+		self.connected = False
+		self.transport.close()
+		print('closed')
+
+
+	# send data to fluidsynth socket
+	# inside a batch, the data is buffered until the batch is flushed.
+	def send(self, packet):
+		if self.stats != None:
+			self.stats.countBytesOut(len(packet))
+		if self.getBatchDepth() > 0:
+			self.local.batchPackets.append(packet)
+			return
+
+		if not self.connected:
+			raise Exception('not connected to fluidsynth')
+
+		with self.sendLock:
+			if self.tracer != None:
+				self.tracer.trace('send', packet)
+			self.transport.sendall(packet)
+
+
+	# create a unique text to mark the end of the next reply.
+	# for example: .3fa2b1.17
+	def newSentinel(self):
+		self.sentinelId += 1
+		return self.eof + self.sessionId + '.' + str(self.sentinelId)
+
+
+	# inject EOF marker into output.
+	# everything the engine prints before the marker belongs to the reply.
+	#   returns: FluidSynthReply (not read yet)
+	def expect(self):
+		with self.sendLock:
+			sentinel = self.newSentinel()
+			reply = FluidSynthReply(self, sentinel)
+			# add blank line and eof marker, to tag the end of the stream
+			self.send('echo ""\necho ' + sentinel + '\n')
+			if self.getBatchDepth() > 0:
+				# reply is pending once the batch is written
+				self.local.batchReplies.append(reply)
+			else:
+				self.pending.append(reply)
+			return reply
+
+
+	# start collecting commands (see FluidSynthBatch)
+	#   returns: FluidSynthBatch
+	def batch(self):
+		return FluidSynthBatch(self)
+
+
+	# how many batches are open on this thread?
+	def getBatchDepth(self):
+		return getattr(self.local, 'batchDepth', 0)
+
+
+	def beginBatch(self):
+		if self.getBatchDepth() == 0:
+			self.local.batchPackets = []
+			self.local.batchReplies = []
+			self.local.batchDepth = 0
+		self.local.batchDepth += 1
+
+
+	# the outermost batch writes everything it collected
+	def endBatch(self):
+		if self.getBatchDepth() == 1:
+			self.flushBatch()
+		self.local.batchDepth -= 1
+
+
+	# write the commands collected by this thread's batch in one sendall
+	def flushBatch(self):
+		if self.getBatchDepth() == 0 or len(self.local.batchPackets) == 0:
+			return
+
+		if not self.connected:
+			self.local.batchPackets = []
+			self.local.batchReplies = []
+			raise Exception('not connected to fluidsynth')
+
+		with self.sendLock:
+			packet = ''.join(self.local.batchPackets)
+			if self.tracer != None:
+				self.tracer.trace('send', packet)
+			self.transport.sendall(packet)
+			self.pending.extend(self.local.batchReplies)
+			self.local.batchPackets = []
+			self.local.batchReplies = []
+
+
+	# drain replies from the socket, in the order they were requested,
+	# until the given reply is complete.
+	def collect(self, reply):
+		self.flushBatch() # reply may still be in a batch
+		with self.readLock:
+			while not reply.done():
+				head = self.pending[0]
+				head.data = self.readUntil(head.sentinel)
+				self.pending.popleft()
+				if self.stats != None and head.verb != None:
+					self.stats.countLatency(head.verb, time.time() - head.sent)
+
+
+	# read data from fluidsynth socket, up to the sentinel.
+	# anything received after the sentinel is kept for the next reply.
+	def readUntil(self, sentinel):
+		# NOTE: the blank line guarantees the sentinel starts on a new line
+		eof = '\n' + sentinel + '\n'
+		try:
+			data = self.reader.readUntil(eof)
+			if self.stats != None:
+				self.stats.countBytesIn(len(data) + len(eof))
+			if self.tracer != None:
+				self.tracer.trace('read', data)
+			return data
+
+		except Exception as e:
+			print('warn: eof not found in stream: "'+sentinel+'"') 
+			print(e)
+			if self.stats != None:
+				self.stats.countSentinelMiss()
+				if isinstance(e, socket.timeout):
+					self.stats.countTimeout()
+
+		data = self.reader.drain()
+		if self.tracer != None:
+			self.tracer.trace('lost', data)
+			self.tracer.dump()
+		return data
+
+
+	# counters and latency of each command (see FluidSynthStats)
+	# returns {} if stats are off
+	def getStats(self):
+		if self.stats == None:
+			return {}
+		return self.stats.getStats()
+
+
+	# read data from fluidsynth socket
+	# returns everything printed since the last reply.
+	def read(self):
+		return self.expect().result()
+
+
+	# send command to fluidsynth, read response.
+	# NOTE: non-blocking mode is MUCH faster.  
+	# always use non-blocking unless you actually need to read the response.
+	#   returns: data packet (if blocking mode)
+	#   returns: True (if non-blocking mode)
+	# the end of line '\n' char is not required.
+	def cmd(self, packet, non_blocking = False):
+		#if non_blocking and not self.debug: #to disable nonblocking for debug  
+		if non_blocking:
+			if self.stats != None:
+				self.stats.countCommand(packet)
+			self.settings.observe(packet)
+			self.send(packet+'\n')
+			return True
+
+		return self.cmdPipelined(packet).result()
+
+
+	# send command to fluidsynth, but do not wait for the response.
+	# any number of commands may be in flight at once.
+	#   returns: FluidSynthReply, call result() to read the data packet
+	def cmdPipelined(self, packet):
+		self.settings.observe(packet)
+		with self.sendLock:
+			self.send(packet+'\n')
+			reply = self.expect()
+			if self.stats != None:
+				reply.verb = self.stats.countCommand(packet)
+				reply.sent = time.time()
+			return reply
+
+
+	# send several commands at once, then read all responses.
+	# this costs one round trip, instead of one per command.
+	#   returns: list of data packets, in the same order as packets
+	def cmds(self, packets):
+		replies = [self.cmdPipelined(packet) for packet in packets]
+		return [reply.result() for reply in replies]
+
+
+	#######################################################################
+	# get/set fluidsynth variable
+	#######################################################################
+
+	# set fluidsynth variable
+	# note: the value is kept in self.settings (see cmd)
+	def setValue(self,key,value):
+		value = self.cmd('set ' + key + ' ' + value, True)
+
+
+	# get fluidsynth variable.
+	# answered from self.settings if known, see --settings-max-age
+	def getValue(self,key):
+		value = self.settings.get(key)
+		if value != None:
+			return value
+		return self.parseValue(key, self.cmd('get ' + key))
+
+
+	# parse the reply to `get key`, and keep the value.
+	# an error (more than one word) is not kept
+	def parseValue(self, key, data):
+		values = self.stripWarnings(data).split() 
+		if len(values) == 1:
+			self.settings.put(key, values[0])
+		if len(values):
+			return values[-1]
+		else:
+			return '' 
+
+
+	# read settings from fluidsynth again, in one round trip
+	# (default: every setting known).  use when another client may have
+	# changed them.  returns {key: value}
+	def refreshSettings(self, keys=None):
+		if keys == None:
+			keys = self.settings.getKeys()
+		with self.batch() as batch:
+			replies = [batch.cmd('get ' + key) for key in keys]
+		values = {}
+		for (key, reply) in zip(keys, replies):
+			values[key] = self.parseValue(key, reply.result())
+		self.settings.refreshed(len(keys))
+		return values
+
+
+	# remove lines the engine prints on its own, for example:
+	#
+	# fluidsynth: warning: No preset found on channel 9 [bank=128 prog=0]
+	#
+	# these can show up in the middle of any reply.
+	def stripWarnings(self, data):
+		if 'fluidsynth: ' not in data:
+			return data
+		lines = [line for line in data.splitlines(True) 
+			if not line.startswith('fluidsynth: ')]
+		return ''.join(lines)
+
+
+	# parse string variable as boolean 
+	def isTruthy(self,value):
+		value = value.lower()
+		if value in ['true','1','on','yes']:
+			return True
+		return False
+
+
+	# get fluidsynth variable as boolean 
+	def getBoolValue(self,key):
+		value = self.getValue(key)
+		return self.isTruthy(value)
+
+
+	# get fluidsynth variable as number 
+	def getNumValue(self,key):
+		value = self.getValue(key)
+		value = float(value)
+		return value 
+
+
+	# get fluidsynth variable as integer
+	def getIntValue(self,key):
+		value = self.getValue(key)
+		value = int(value)
+		return value 
+
+
+	#######################################################################
+	# get/set channel, font, instrument
+	#######################################################################
+
+	# set selected channel (index is 1-based) 
+	def setSelectedChannel(self,channel):
+		self.selectedChannel = int(channel)
+
+
+	# get selected channel (where index is 1-based) 
+	def getSelectedChannel(self):
+		return self.selectedChannel
+
+
+	# get selected channel (where index is 0-based) 
+	def getSelectedChannel0(self):
+		return self.selectedChannel-1
+
+
+	# return last known font and instrument on a channel
+	# note: channel is 1-based
+	# return: (font_file, instrument_name)
+	def getFontInstrumentFromChannel(self,channel):
+
+		try:
+			chan0 = channel-1 # to 0 based
+			font_id = self.fontsInUse[chan0] 
+			font = self.fontFilesLoaded[font_id]
+			instrument = self.instrumentsInUse[chan0]
+			return (font, instrument)
+		except Exception as e:
+			print('error: could not find font, instrument on channel '+str(channel))
+			print(e)
+
+		return ('','')
+
+
+	# lookup fluidsynth's font id from a path (if loaded)
+	# returns int
+	def getSoundFontIdFromPath(self, path):
+		for key, value in self.fontFilesLoaded.iteritems():
+			if value == path:
+				return int(key)
+		return -1
+
+
+	# load sound soundfont, for example:
+	#
+	# > load "/home/Music/sf2/Brass 4.SF2"
+	# loaded SoundFont has ID 1
+	# fluidsynth: warning: No preset found on channel 9 [bank=128 prog=0]
+	# > 
+	def loadSoundFont(self, sf2Filename):
+		try:
+			# try cache
+			id = self.getSoundFontIdFromPath(sf2Filename)
+
+			if id < 0:
+				# cache miss	
+				data = self.cmd('load "'+ sf2Filename +'"')
+				id = self.parseSoundFontId(data)
+				self.residency.miss()
+			else:
+				self.residency.hit(id)
+
+			if id < 0:
+				raise Exception('no font id in reply')
+
+			self.fontFilesLoaded[id] = sf2Filename # store mapping id->file
+			self.residency.touch(id, sf2Filename)
+			self.activeSoundFontId = id
+			self.activeSoundFontFile = sf2Filename
+			return id
+
+		except Exception as e:
+			print('error: could not load font: ' + sf2Filename)
+			print(e)	
+
+		return -1
+
+
+	# parse sound font id from the output of load
+	def parseSoundFontId(self, data):
+		id = -1
+		data = self.stripWarnings(data)
+		ids = [int(s) for s in data.split() if s.isdigit()]	
+		if len(ids) > 0:
+			id = ids[-1] # return last item
+			id = int(id)
+		return id
+
+
+	# return soundfonts loaded in memory, for example:
+	#
+	# > fonts
+	# ID  Name
+	#  1  /home/Music/sf2/Brass 4.SF2
+	# > 
+	def getSoundFonts(self):
+		try:
+			data = self.cmd('fonts')
+			return self.parseSoundFonts(data)
+
+		except Exception as e:
+			print('error: no fonts parsed')
+			print(e)
+
+		return []
+
+
+	# learn the fonts fluidsynth already has (for example, loaded by an
+	# earlier client), so loading one of them again is a cache hit.
+	# returns {font_id: font_file}
+	def syncSoundFonts(self):
+		fonts = {}
+		try:
+			for line in self.stripWarnings(self.cmd('fonts')).splitlines():
+				parts = line.split(None, 1)
+				if len(parts) == 2 and parts[0].isdigit():
+					fonts[int(parts[0])] = parts[1].strip()
+		except Exception as e:
+			print('error: no fonts parsed')
+			print(e)
+
+		for id, font in fonts.iteritems():
+			if id not in self.fontFilesLoaded:
+				self.fontFilesLoaded[id] = font
+				self.residency.touch(id, font)
+		return fonts
+
+
+	# parse font ids from the output of fonts
+	def parseSoundFonts(self, data):
+		ids=self.stripWarnings(data).splitlines()
+				
+		#ids = ids[3:] # cli only: discard first 3 items (header)
+		ids_clean = []
+		for id in ids:
+			# example:
+			# '1 /home/user/sf2/Choir__Aahs_736KB.sf2'
+			parts = id.split()
+			if len(parts) == 0:
+				continue
+
+			try:
+				if parts[0] != 'ID':
+					id2=int(parts[0])
+					ids_clean.append(id2)
+
+			except Exception as e:
+				print('warn: skipping font parse:')
+				print(parts)
+				print(e) 
+
+		return ids_clean
+
+ 
+	# remove unused soundfonts from memory, for example:
+	#
+	# > unload 1
+	# fluidsynth: warning: No preset found on channel 0 [bank=0 prog=0]
+	# > 
+	#
+	# ids: fonts in memory (default: ask fluidsynth)
+	# keep: font ids to keep, even if not in use on a channel
+	def unloadSoundFonts(self, ids=None, keep=[]):
+		try:
+			if ids == None:
+				ids = self.getSoundFonts()
+			## debug memory management
+			#if self.debug:
+			#	print('Fonts in use:')
+			#	print(self.fontsInUse)
+			#	print('All Fonts in memory:')
+			#	print(ids)
+
+			## unload any soundfont that is not referenced
+			for id in ids:
+				sid=str(id)
+				if id in self.fontsInUse or id in keep:
+					#print 'font in use: ' + sid
+					pass
+				else:
+					self.cmd('unload '+ sid, True)
+					self.fontFilesLoaded.pop(id, None)
+					self.residency.forget(id)
+
+		except Exception as e:
+			print('error: could not unload fonts')
+			print(e)
+
+
+	# list instruments in soundfont, for example:
+	# 
+	# > inst 1
+	# 000-000 Dark Violins  
+	# > 
+	def getInstruments(self,fontId):
+
+		fontId = int(fontId)
+
+		if fontId < 0:
+			return []
+
+		try:
+			data = self.cmd('inst ' + str(fontId))
+			ids = self.stripWarnings(data).splitlines()
+			ids = [id for id in ids if id.strip() != '']
+			#ids = map(lambda s: s.strip(' '), ids)
+			#ids = ids[2:] # cli only: discard first two items (header)
+			return ids
+
+		except Exception as e:
+			print('error: could not get instruments')
+			print(e)
+
+		return []
+
+
+	# change voice in soundfont
+	#
+	# arg formats:
+	#	000-000 Some Voice
+	#	000-000
+	#
+	# note: 'prog bank prog' doesn't always seem to work as expected
+	# using 'select' instead
+	#
+	# for example:
+	#
+	#    select chan sfont bank prog
+	#> 
+	def setInstrument(self,instrumentName):
+
+		if instrumentName == '':
+			raise Exception('instrument name cannot be blank')
+
+		if self.activeSoundFontId < 0:
+			return ''
+
+		try:
+			parts = instrumentName.split()
+			ids = parts[0].split('-')			
+			chan0 = str(self.getSelectedChannel0()) # convert base 0
+			font = str(self.activeSoundFontId)
+			bank = ids[0]
+			prog = ids[1]
+			cmd = 'select '+chan0+' '+font+' '+bank+' '+prog
+			data = self.cmd(cmd, True)
+
+			self.activeInstrument = instrumentName
+			self.fontsInUse[int(chan0)] = int(font)
+			self.instrumentsInUse[int(chan0)] = instrumentName 
+			self.activeChannel = self.getSelectedChannel()
+
+			return data
+
+		except Exception as e:
+			print('error: could not select instrument: '+instrumentName)
+			print(e)
+
+		return False 
+
+
+	# unload the least recently used fonts that are over the memory budget.
+	# fonts on a channel, and fonts in keep, are never unloaded.
+	# fonts that fluidsynth has, but this api did not load, are unloaded too.
+	#
+	# ids: fonts in memory (default: ask fluidsynth)
+	def evictSoundFonts(self, ids=None, keep=[]):
+		pinned = set(self.fontsInUse) | set(keep)
+		evicted = self.residency.evict(pinned)
+		if self.debug and len(evicted) > 0:
+			print('evict fonts: ' + str(evicted))
+		self.unloadSoundFonts(ids, keep=list(pinned) + self.residency.getIds())
+
+
+	# load a font in the background, so it is resident when it is selected.
+	# the active font and channels are not changed.  fonts larger than the 
+	# memory budget are not prefetched.
+	# keep: paths of fonts that must not be evicted (for example, the other
+	# fonts being prefetched)
+	# returns font id, or -1
+	def prefetchSoundFont(self, sf2, keep=[]):
+		id = self.getSoundFontIdFromPath(sf2)
+		if id > -1:
+			return id # already resident
+
+		if self.residency.getCost(sf2) > self.residency.budget:
+			return -1
+
+		try:
+			data = self.cmd('load "'+ sf2 +'"')
+			id = self.parseSoundFontId(data)
+			if id < 0:
+				return -1
+			self.fontFilesLoaded[id] = sf2
+			self.residency.touch(id, sf2, prefetch=True)
+
+			keepIds = [self.getSoundFontIdFromPath(path) for path in keep]
+			self.evictSoundFonts(keep=keepIds + [id, self.activeSoundFontId])
+			if self.debug:
+				print('prefetched: ' + sf2)
+				print(self.residency.getSummary())
+			return id
+
+		except Exception as e:
+			print('error: could not prefetch font: ' + sf2)
+			print(e)
+
+		return -1
+
+
+	# load soundfont, select first program voice
+	# returns (id,array_of_voices)
+	#
+	# the commands are pipelined:
+	#    fonts + load        one round trip
+	#    unload + inst       one round trip
+	#    select              non-blocking
+	#
+	# a font that is still resident (see FluidSynthResidency) is not loaded
+	# again, and `fonts` is not asked, so switching back to a recent (or 
+	# prefetched) font only costs the `select`.
+	#
+	# isStale: optional function, returns True if the font is no longer
+	# wanted (for example, the user selected another font, or another 
+	# channel, while loading).  a stale font stays resident if it fits the
+	# budget, and nothing is selected.  otherwise the first preset is 
+	# selected on the channel selected when the load is done.
+	#
+	# voices: optional list of instruments, if already known (for example,
+	# from SoundFontCatalog).  this saves the `inst` round trip.
+	def initSoundFont(self,sf2,isStale=None,voices=None):
+		try:
+			fonts = None
+			if self.getSoundFontIdFromPath(sf2) < 0:
+				fonts = self.cmdPipelined('fonts')
+			lastId = self.activeSoundFontId
+			lastFile = self.activeSoundFontFile
+			id = self.loadSoundFont(sf2)
+
+			# fonts in memory
+			if fonts != None:
+				ids = self.parseSoundFonts(fonts.result())
+			else:
+				ids = list(self.fontFilesLoaded.keys())
+			if id > -1 and id not in ids:
+				ids.append(id)
+
+			if isStale != None and isStale():
+				print('info: drop stale font: ' + sf2)
+				self.activeSoundFontId = lastId
+				self.activeSoundFontFile = lastFile
+				self.evictSoundFonts(ids, keep=[lastId])
+				return (-1,[])
+
+			self.evictSoundFonts(ids, keep=[id])
+			if self.debug:
+				print(self.residency.getSummary())
+			if id > -1:
+				if not voices:
+					voices = self.getInstruments(id)
+				self.setInstrument(voices[0])
+				return (id,voices)
+
+		except Exception as e:
+			print('error: font and instrument did not load: '+sf2)
+			print(e)
+
+		return (-1,[])
+
+
+	# restore many channels at once, for example the last session.
+	# plan: list of (channel, font_file, instrument_name), channel is 1-based
+	#
+	# each file is loaded once, even if it is on several channels, and
+	# resident fonts are not loaded again.  the commands are pipelined:
+	#    load                    restoreWindow files in flight at a time
+	#    select (every channel)  non-blocking, one write
+	# fluidsynth loads the files one after another anyway, and with the next
+	# file already queued it never waits for us.
+	#
+	# activeChannel: selected last, and becomes the active channel.
+	# onLoad: optional function(count, total, font_file), called as each 
+	# load is done.
+	# isCancelled: optional function, checked after each load.  returns True
+	# to stop: no more files are loaded (the ones in flight still finish),
+	# the fonts loaded so far are unloaded again, and no channel changes.
+	# returns the number of channels restored
+	def restoreChannels(self, plan, activeChannel=None, onLoad=None, isCancelled=None):
+
+		# files to load, each once
+		ids = {}   # font_file: id
+		files = [] # font files not resident
+		for (channel, font, instrument) in plan:
+			if font in ids:
+				continue
+			ids[font] = self.getSoundFontIdFromPath(font)
+			if ids[font] < 0:
+				files.append(font)
+			else:
+				self.residency.hit(ids[font])
+
+		loaded = []   # font ids loaded here
+		loads = collections.deque() # (font_file, reply) in flight
+		sent = 0      # files sent
+		cancelled = False
+		while True:
+			with self.batch():
+				while not cancelled and sent < len(files) and len(loads) < self.restoreWindow:
+					font = files[sent]
+					sent += 1
+					loads.append((font, self.cmdPipelined('load "'+ font +'"')))
+			if len(loads) == 0:
+				break
+
+			(font, reply) = loads.popleft()
+			try:
+				ids[font] = self.parseSoundFontId(reply.result())
+			except Exception as e:
+				print(e)
+			self.residency.miss()
+			if ids[font] < 0:
+				print('error: could not load font: ' + font)
+			else:
+				self.fontFilesLoaded[ids[font]] = font # store mapping id->file
+				loaded.append(ids[font])
+			if onLoad != None:
+				onLoad(sent - len(loads), len(files), font)
+			if isCancelled != None and isCancelled():
+				cancelled = True
+
+		if cancelled or (isCancelled != None and isCancelled()):
+			# none of these fonts went on a channel
+			self.unloadSoundFonts(loaded)
+			return 0
+
+		# select every channel, the active channel last
+		count = 0
+		plan = sorted(plan, key=lambda step: step[0] == activeChannel)
+		with self.batch():
+			for (channel, font, instrument) in plan:
+				id = ids[font]
+				if id < 0:
+					continue
+				self.residency.touch(id, font)
+				self.setSelectedChannel(channel)
+				self.activeSoundFontId = id
+				self.activeSoundFontFile = font
+				if self.setInstrument(instrument) != False:
+					count += 1
+
+			if activeChannel != None:
+				self.setSelectedChannel(activeChannel)
+
+		return count
+
+
+	#######################################################################
+	# levels api
+	#######################################################################
+
+	#    gain value                Set the master gain (0 < gain < 5)
+	#    get synth.gain            10
+	# set gain, where value is between [0,5]
+	def setGain(self,value):
+		with self.batch():
+			self.cmd('gain ' + str(value),True) # [0,5]
+			self.setValue('synth.gain',str(float(value)*2)) # [0,10]
+
+
+	# get gain, where value is between [0,5]
+	def getGain(self):
+		return self.getNumValue('synth.gain') / 2
+
+
+	# turn reverb on/off
+	#    reverb [0|1|on|off]        Turn the reverb on or off
+	def setReverb(self,boolean):
+		with self.batch():
+			self.cmd('reverb ' + str(int(boolean)),True)
+			# ? not auto updated
+			self.setValue('synth.reverb.active', str(int(boolean))) 
+
+
+	# returns True if reverb is on
+	def getReverb(self):
+		value = self.getBoolValue('synth.reverb.active')
+		return value 
+
+
+	# update reverb settings. num is between [0,1]
+	#    rev_setroomsize num        Change reverb room size. 0 - 1.0
+	def setReverbRoomSize(self,num):
+		self.cmd('rev_setroomsize ' + str(num), True)
+
+
+	# update reverb settings. num is between [0,1]
+	#    rev_setdamp num            Change reverb damping. 0 - 1.0
+	def setReverbDamp(self,num):
+		self.cmd('rev_setdamp ' + str(num), True)
+
+
+	# update reverb settings. num is between [0,1]
+	#    rev_setwidth num           Change reverb width. 0 - 1.0
+	def setReverbWidth(self,num):
+		self.cmd('rev_setwidth ' + str(num), True)
+
+
+	# update reverb settings. num is between [0,1]
+	#    rev_setlevel num           Change reverb level. 0 - 1.0
+	def setReverbLevel(self,num):
+		self.cmd('rev_setlevel ' + str(num), True)
+
+
+	# note: no getters for reverb details	
+
+	# chorus api
+
+	# turn chorus on/off
+	# arg: True/False
+	#    chorus [0|1|on|off]        Turn the chorus on or off
+	#	 set synth.chorus.active 1|0
+	def setChorus(self,boolean):
+		with self.batch():
+			self.cmd('chorus ' + str(int(boolean)),True)
+			# ? not auto updated
+			self.setValue('synth.chorus.active', str(int(boolean))) 
+
+
+	# return True if chorus is on.
+	def getChorus(self):
+		value = self.getBoolValue('synth.chorus.active')
+		return value 
+
+
+	# update chorus setting
+	#   cho_set_nr n               Use n delay lines (default 3). 0 - 99
+	def setChorusNR(self,num):
+		self.cmd('cho_set_nr ' + str(num), True)
+
+
+	# update chorus setting
+	#   cho_set_level num          Set output level of each chorus line. 0 - 1.0
+	def setChorusLevel(self,num):
+		self.cmd('cho_set_level ' + str(num), True)
+
+
+	# update chorus setting
+	#   cho_set_speed num          Set mod speed of chorus (Hz). 0.3 - 5.0
+	def setChorusSpeed(self,num):
+		self.cmd('cho_set_speed ' + str(num), True)
+
+
+	# update chorus setting
+	#    cho_set_depth num         Set chorus modulation depth (ms). 0 - 46
+	def setChorusDepth(self,num):
+		self.cmd('cho_set_depth ' + str(num), True)
+
+
+	# note: no getters for chorus details	
+
+
+	# gain, reverb and chorus, as on the Levels page.
+	# settings not cached are read in one round trip.
+	# returns {'gain': [0,5], 'reverb': bool, 'chorus': bool}
+	def getLevels(self):
+		keys = ['synth.gain', 'synth.reverb.active', 'synth.chorus.active']
+		values = {}
+		for key in keys:
+			value = self.settings.get(key)
+			if value != None:
+				values[key] = value
+		missing = [key for key in keys if key not in values]
+		if len(missing) > 0:
+			values.update(self.refreshSettings(missing))
+		return {
+			'gain': float(values['synth.gain'] or 0) / 2,
+			'reverb': self.isTruthy(values['synth.reverb.active']),
+			'chorus': self.isTruthy(values['synth.chorus.active']),
+		}
+
+	#######################################################################
+	# reset
+	#######################################################################
+
+	# reset controller (all notes off)
+	def panic(self):
+		self.cmd('reset', True)
+
+
+	#######################################################################
+	# load
+	#######################################################################
+
+	# cpu used by the spawned fluidsynth process since the last call, in 
+	# percent of one core.  linux only (reads /proc).
+	# returns None if unknown (not spawned by this api, or the first call)
+	def getCpuLoad(self):
+		if self.fluidsynth == None:
+			return None
+		try:
+			with open('/proc/' + str(self.fluidsynth.pid) + '/stat') as f:
+				fields = f.read().rsplit(')', 1)[1].split()
+			ticks = int(fields[11]) + int(fields[12]) # utime + stime
+			seconds = ticks / float(os.sysconf('SC_CLK_TCK'))
+		except Exception as e:
+			return None
+
+		now = time.time()
+		last = self.lastCpuSample
+		self.lastCpuSample = (now, seconds)
+		if last == None or now <= last[0]:
+			return None
+		return 100 * (seconds - last[1]) / (now - last[0])
+
+
+	# how busy is the engine?
+	# returns a list with one dict (see FluidSynthPool.getLoad):
+	#    name      the transport, for example 'tcp localhost:9800'
+	#    channels  channels with a font selected
+	#    fonts     fonts loaded
+	#    memory    bytes of font files resident (see FluidSynthResidency)
+	#    cpu       percent of one core, or None
+	def getLoad(self):
+		name = 'not connected'
+		if self.transport != None:
+			name = self.transport.getName()
+		return [{
+			'name': name,
+			'channels': len([id for id in self.fontsInUse if id != -1]),
+			'fonts': len(self.fontFilesLoaded),
+			'memory': self.residency.used,
+			'cpu': self.getCpuLoad(),
+		}]
+
+
+# end class
+
+
+# several fluidsynth engines, with the MIDI channels shared out between them.
+# one fluidsynth renders all its channels on one core, so a dense template
+# can saturate it while other cores are idle.  the pool starts one engine
+# per core you give it (--engines N), on ports 9800, 9801, ... and has the
+# same methods as FluidSynthApi:
+#
+#    channel commands (fonts, instruments) go to the engine of the channel.
+#    levels, panic and plain commands go to every engine.
+#
+# each engine is a FluidSynthApi, with its own fonts, font ids and channels 
+# (fontsInUse, instrumentsInUse).  the pool keeps a merged view of those,
+# where font ids are 'engine:id' (for example '2:14'), so the gui can save 
+# and restore a session the same way.
+#
+# channel policies:
+#    block        channels in equal blocks (2 engines: 1-8, 9-16).
+#    round-robin  channel N on engine N % engines.
+#    balance      a channel is moved, when it gets its first font, to the
+#                 engine with the fewest channels in use.
+#    map          from --channel-map, for example: 1,1,1,1,2,2,2,2,...
+#
+# MIDI: route each channel to the MIDI port of its engine (FluidSynth-GUI-1,
+# FluidSynth-GUI-2, ...), or send all of it to every engine.  channels an
+# engine does not own are muted there (cc 7 = 0), so nothing plays twice.
+# the mute is set again after a panic, but a cc 7 coming in over MIDI
+# undoes it until then, so routing per engine is safer.
+#
+#    pool = FluidSynthPool(options, args)
+#    pool.setSelectedChannel(10)
+#    pool.initSoundFont('/home/Music/sf2/Strings.sf2') # on the engine of 10
+class FluidSynthPool:
+
+	policies = ['block', 'round-robin', 'balance', 'map']
+
+	# connect: False to connect later, with start()
+	def __init__(self, options, args, connect=True):
+		self.options = options         # key/value pairs.
+		self.args = args               # bare args, sent to every engine.
+		self.engines = []              # FluidSynthApi.  position is engine number - 1.
+		self.policy = options.channelPolicy # see policies.
+		if options.channelMap != '':
+			self.policy = 'map'
+		self.channelEngines = []       # engine index. position is channel - 1.
+		self.connected = False         # are all engines connected?
+		self.debug = options.debug
+		self.stats = None              # FluidSynthStats, shared by the engines.
+		self.tracer = None             # FluidSynthTracer, shared by the engines.
+		self.lock = threading.RLock()  # channel map and merged state.
+
+		if options.stats or options.statsPort:
+			self.stats = FluidSynthStats()
+		if options.trace:
+			self.tracer = FluidSynthTracer(options.traceSize)
+
+		# merged state of the engines (see updateState)
+		self.fontFilesLoaded = {}      # 'engine:id': font_file.
+		self.fontsInUse = [-1] * 16    # 'engine:id'. position is channel.
+		self.instrumentsInUse = ['']*16 # instrument_name. position is channel.
+		self.selectedChannel = 1       # 1-based.
+		self.activeChannel = 1         # 1-based. last used channel.
+		self.activeSoundFontId = -1    # 'engine:id' of the last font loaded.
+		self.activeSoundFontFile = ''  # last SoundFont loaded.
+		self.activeInstrument = ''     # last instrument loaded.
+
+		for idx in range(options.engines):
+			engineOptions = optparse.Values(vars(options))
+			engineOptions.port = options.port + idx
+			engineOptions.stats = False
+			engineOptions.statsPort = 0
+			engineOptions.trace = False
+			engine = FluidSynthApi(engineOptions, [], connect=False)
+			engine.stats = self.stats
+			engine.tracer = self.tracer
+			engine.fluidsynthCmd = self.getEngineCmd(engine.fluidsynthCmd, idx)
+			engine.fluidsynthPipeCmd = self.getEngineCmd(engine.fluidsynthPipeCmd, idx)
+			self.engines.append(engine)
+
+		self.channelEngines = self.getChannelMap(options.channelMap)
+		self.settings = self.engines[0].settings # reads go to the first engine.
+
+		if connect:
+			self.start()
+
+
+	# command that starts engine idx (0-based).
+	# a custom command (-c) may place the port and the engine number with
+	# %(port)d and %(engine)d, otherwise fluidsynth options are added.
+	def getEngineCmd(self, cmd, idx):
+		port = self.options.port + idx
+		if '%(' in cmd:
+			return cmd % {'port': port, 'engine': idx+1}
+		return cmd + ' -o shell.port=' + str(port) + ' -p FluidSynth-GUI-' + str(idx+1)
+
+
+	# engine index of each channel, before any channel is used.
+	# channelMap: engine numbers (1-based), comma separated, for example
+	# '1,1,2,2' (channels not listed go to the last engine listed)
+	def getChannelMap(self, channelMap=''):
+		count = len(self.engines)
+		if self.policy == 'map':
+			numbers = [int(n) - 1 for n in channelMap.split(',') if n.strip() != '']
+			if len(numbers) == 0 or min(numbers) < 0 or max(numbers) >= count:
+				raise Exception('bad --channel-map for ' + str(count) + ' engines: ' + channelMap)
+			return (numbers + [numbers[-1]] * 16)[:16]
+		if self.policy == 'round-robin':
+			return [chan0 % count for chan0 in range(16)]
+		return [chan0 * count / 16 for chan0 in range(16)] # block, balance
+
+
+	# start every engine at once, then mute the channels each engine does
+	# not own, and send the command line args to every engine.
+	# returns True if all engines are connected
+	def start(self):
+		results = [False] * len(self.engines)
+		def startEngine(idx):
+			results[idx] = self.engines[idx].start()
+
+		threads = []
+		for idx in range(len(self.engines)):
+			thread = threading.Thread(target=startEngine, args=(idx,))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		for thread in threads:
+			thread.join()
+
+		self.connected = not (False in results)
+		if not self.connected:
+			print('error: ' + str(results.count(False)) + ' of ' + 
+				str(len(results)) + ' engines did not start')
+			return False
+
+		with self.batch():
+			self.muteChannels()
+			for arg in self.args:
+				self.cmd(arg, True)
+
+		print('engines: ' + str(len(self.engines)) + ', channels: ' + 
+			' '.join([str(idx+1) for idx in self.channelEngines]))
+		return True
+
+
+	def close(self):
+		self.connected = False
+		for engine in self.engines:
+			engine.close()
+
+
+	def closeFluidSynth(self):
+		self.connected = False
+		for engine in self.engines:
+			engine.closeFluidSynth()
+
+
+	#######################################################################
+	# channels
+	#######################################################################
+
+	# engine of a channel (default: the selected channel), 1-based
+	def getEngine(self, channel=None):
+		if channel == None:
+			channel = self.selectedChannel
+		return self.engines[self.channelEngines[int(channel)-1]]
+
+
+	# with the balance policy, move an unused channel to the engine with
+	# the fewest channels in use (then the least font memory).
+	# counts: channels in use per engine (default: count them now)
+	def balanceChannel(self, channel, counts=None):
+		chan0 = int(channel) - 1
+		with self.lock:
+			old = self.channelEngines[chan0]
+			if self.policy != 'balance' or self.engines[old].fontsInUse[chan0] != -1:
+				return old # fixed, or in use
+
+			if counts == None:
+				counts = [self.getChannelCount(idx) for idx in range(len(self.engines))]
+			best = min(range(len(self.engines)), key=lambda idx: 
+				(counts[idx], self.engines[idx].residency.used, idx))
+			if best != old:
+				self.engines[old].cmd('cc ' + str(chan0) + ' 7 0', True)
+				self.engines[best].cmd('cc ' + str(chan0) + ' 7 100', True)
+				self.channelEngines[chan0] = best
+				if self.debug:
+					print('channel ' + str(channel) + ': engine ' + str(best+1))
+			return best
+
+
+	# mute each channel on the engines that do not own it (cc 7 = 0).
+	# a reset puts cc 7 back on every channel, so this runs again after
+	# one (see panic).
+	def muteChannels(self):
+		with self.lock:
+			with self.batch():
+				for idx, engine in enumerate(self.engines):
+					for chan0 in range(16):
+						if self.channelEngines[chan0] != idx:
+							engine.cmd('cc ' + str(chan0) + ' 7 0', True)
+
+
+	# set selected channel (index is 1-based) 
+	def setSelectedChannel(self, channel):
+		self.selectedChannel = int(channel)
+		self.getEngine().setSelectedChannel(channel)
+
+
+	def getSelectedChannel(self):
+		return self.selectedChannel
+
+
+	def getSelectedChannel0(self):
+		return self.selectedChannel-1
+
+
+	def getFontInstrumentFromChannel(self, channel):
+		return self.getEngine(channel).getFontInstrumentFromChannel(channel)
+
+
+	# merge the state of the engines (fonts, channels, active font).
+	# font ids become 'engine:id'
+	def updateState(self):
+		with self.lock:
+			fontFilesLoaded = {}
+			fontsInUse = [-1] * 16
+			instrumentsInUse = [''] * 16
+			for idx, engine in enumerate(self.engines):
+				for id, font in engine.fontFilesLoaded.items():
+					fontFilesLoaded['%d:%d' % (idx+1, id)] = font
+
+			for chan0 in range(16):
+				idx = self.channelEngines[chan0]
+				id = self.engines[idx].fontsInUse[chan0]
+				if id != -1:
+					fontsInUse[chan0] = '%d:%d' % (idx+1, id)
+					instrumentsInUse[chan0] = self.engines[idx].instrumentsInUse[chan0]
+
+			self.fontFilesLoaded = fontFilesLoaded
+			self.fontsInUse = fontsInUse
+			self.instrumentsInUse = instrumentsInUse
+
+			engine = self.getEngine()
+			self.activeSoundFontId = -1
+			if engine.activeSoundFontId > -1:
+				self.activeSoundFontId = '%d:%d' % (self.engines.index(engine)+1, 
+					engine.activeSoundFontId)
+			self.activeSoundFontFile = engine.activeSoundFontFile
+			self.activeInstrument = engine.activeInstrument
+
+
+	#######################################################################
+	# fonts (on the engine of the selected channel)
+	#######################################################################
+
+	def loadSoundFont(self, sf2Filename):
+		self.balanceChannel(self.selectedChannel)
+		engine = self.getEngine()
+		engine.setSelectedChannel(self.selectedChannel)
+		id = engine.loadSoundFont(sf2Filename)
+		self.updateState()
+		return id
+
+
+	def setInstrument(self, instrumentName):
+		engine = self.getEngine()
+		engine.setSelectedChannel(self.selectedChannel)
+		data = engine.setInstrument(instrumentName)
+		self.activeChannel = self.selectedChannel
+		self.updateState()
+		return data
+
+
+	def initSoundFont(self, sf2, isStale=None, voices=None):
+		self.balanceChannel(self.selectedChannel)
+		engine = self.getEngine()
+		engine.setSelectedChannel(self.selectedChannel)
+		result = engine.initSoundFont(sf2, isStale, voices)
+		if result[0] > -1:
+			self.activeChannel = self.selectedChannel
+		self.updateState()
+		return result
+
+
+	def prefetchSoundFont(self, sf2, keep=[]):
+		return self.getEngine().prefetchSoundFont(sf2, keep)
+
+
+	def evictSoundFonts(self, ids=None, keep=[]):
+		self.getEngine().evictSoundFonts(ids, keep)
+		self.updateState()
+
+
+	def unloadSoundFonts(self, ids=None, keep=[]):
+		self.getEngine().unloadSoundFonts(ids, keep)
+		self.updateState()
+
+
+	def getInstruments(self, fontId):
+		return self.getEngine().getInstruments(fontId)
+
+
+	def syncSoundFonts(self):
+		for engine in self.engines:
+			engine.syncSoundFonts()
+		self.updateState()
+		return self.fontFilesLoaded
+
+
+	# like FluidSynthApi.restoreChannels, but each engine restores its own
+	# channels, and the engines load at the same time.  so the restore takes
+	# about as long as the busiest engine.
+	def restoreChannels(self, plan, activeChannel=None, onLoad=None, isCancelled=None):
+
+		# channels of each engine
+		counts = [self.getChannelCount(idx) for idx in range(len(self.engines))]
+		plans = [[] for engine in self.engines]
+		for step in plan:
+			idx = self.balanceChannel(step[0], counts)
+			counts[idx] += 1
+			plans[idx].append(step)
+
+		# loads are reported for all engines together
+		total = sum([len(set([step[1] for step in steps])) for steps in plans])
+		loaded = [0]
+		progressLock = threading.Lock()
+		def onEngineLoad(count, engineTotal, font):
+			with progressLock:
+				loaded[0] += 1
+				if onLoad != None:
+					onLoad(loaded[0], total, font)
+
+		results = [0] * len(self.engines)
+		def restore(idx):
+			active = None
+			if activeChannel != None and self.channelEngines[int(activeChannel)-1] == idx:
+				active = activeChannel
+			results[idx] = self.engines[idx].restoreChannels(plans[idx], active,
+				onEngineLoad, isCancelled)
+
+		threads = []
+		for idx in range(len(self.engines)):
+			if len(plans[idx]) == 0:
+				continue
+			thread = threading.Thread(target=restore, args=(idx,))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		for thread in threads:
+			thread.join()
+
+		if activeChannel != None:
+			self.setSelectedChannel(activeChannel)
+			self.activeChannel = int(activeChannel)
+		self.updateState()
+		return sum(results)
+
+
+	#######################################################################
+	# every engine
+	#######################################################################
+
+	# batch commands on every engine (see FluidSynthBatch)
+	def batch(self):
+		return FluidSynthBatch(self)
+
+
+	def beginBatch(self):
+		for engine in self.engines:
+			engine.beginBatch()
+
+
+	def endBatch(self):
+		for engine in self.engines:
+			engine.endBatch()
+
+
+	# send a command to every engine.
+	# returns the reply of the first engine
+	def cmd(self, packet, non_blocking = False):
+		if non_blocking:
+			# no replies to read, so nothing is left waiting on the sockets
+			with self.batch():
+				for engine in self.engines[1:]:
+					engine.cmd(packet, True)
+				data = self.engines[0].cmd(packet, True)
+		else:
+			replies = [engine.cmdPipelined(packet) for engine in self.engines[1:]]
+			data = self.engines[0].cmd(packet)
+			for reply in replies:
+				reply.result() # keep the engines in step
+		if packet.strip() == 'reset':
+			self.muteChannels()
+		return data
+
+
+	def cmdPipelined(self, packet):
+		replies = [engine.cmdPipelined(packet) for engine in self.engines]
+		return replies[0]
+
+
+	def getStats(self):
+		if self.stats == None:
+			return {}
+		return self.stats.getStats()
+
+
+	# load of each engine (see FluidSynthApi.getLoad)
+	def getLoad(self):
+		loads = []
+		for idx, engine in enumerate(self.engines):
+			load = engine.getLoad()[0]
+			load['channels'] = self.getChannelCount(idx)
+			loads.append(load)
+		return loads
+
+
+	# channels in use on engine idx (0-based)
+	def getChannelCount(self, idx):
+		engine = self.engines[idx]
+		return len([chan0 for chan0 in range(16) 
+			if self.channelEngines[chan0] == idx and engine.fontsInUse[chan0] != -1])
+
+
+	#######################################################################
+	# levels (on every engine, values are read from the first)
+	#######################################################################
+
+	def setValue(self, key, value):
+		for engine in self.engines:
+			engine.setValue(key, value)
+
+
+	def getValue(self, key):
+		return self.engines[0].getValue(key)
+
+
+	def refreshSettings(self, keys=None):
+		for engine in self.engines[1:]:
+			engine.refreshSettings(keys)
+		return self.engines[0].refreshSettings(keys)
+
+
+	def setGain(self, value):
+		for engine in self.engines:
+			engine.setGain(value)
+
+
+	def getGain(self):
+		return self.engines[0].getGain()
+
+
+	def setReverb(self, boolean):
+		for engine in self.engines:
+			engine.setReverb(boolean)
+
+
+	def getReverb(self):
+		return self.engines[0].getReverb()
+
+
+	def setReverbRoomSize(self, num):
+		for engine in self.engines:
+			engine.setReverbRoomSize(num)
+
+
+	def setReverbDamp(self, num):
+		for engine in self.engines:
+			engine.setReverbDamp(num)
+
+
+	def setReverbWidth(self, num):
+		for engine in self.engines:
+			engine.setReverbWidth(num)
+
+
+	def setReverbLevel(self, num):
+		for engine in self.engines:
+			engine.setReverbLevel(num)
+
+
+	def setChorus(self, boolean):
+		for engine in self.engines:
+			engine.setChorus(boolean)
+
+
+	def getChorus(self):
+		return self.engines[0].getChorus()
+
+
+	def getLevels(self):
+		return self.engines[0].getLevels()
+
+
+	def setChorusNR(self, num):
+		for engine in self.engines:
+			engine.setChorusNR(num)
+
+
+	def setChorusLevel(self, num):
+		for engine in self.engines:
+			engine.setChorusLevel(num)
+
+
+	def setChorusSpeed(self, num):
+		for engine in self.engines:
+			engine.setChorusSpeed(num)
+
+
+	def setChorusDepth(self, num):
+		for engine in self.engines:
+			engine.setChorusDepth(num)
+
+
+	# all notes off, on every engine.  the reset unmutes every channel, so
+	# the channels other engines own are muted again.
+	def panic(self):
+		with self.batch():
+			for engine in self.engines:
+				engine.panic()
+			self.muteChannels()
+
+
+# end class
+
+
+# the result of a call that runs on a worker thread.
+# the caller can wait for it (with a timeout), cancel it before it starts,
+# or get a callback when it is done.
+class FluidSynthFuture:
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.event = threading.Event() # set when done or cancelled.
+		self.state = 'pending'         # pending, running, done, cancelled.
+		self.value = None              # return value of the call.
+		self.error = None              # exception raised by the call.
+		self.callbacks = []            # called with this future when done.
+
+
+	# cancel the call, if it has not started yet.
+	# returns True if cancelled
+	def cancel(self):
+		with self.lock:
+			if self.state != 'pending':
+				return self.state == 'cancelled'
+			self.state = 'cancelled'
+		self.finish()
+		return True
+
+
+	def cancelled(self):
+		return self.state == 'cancelled'
+
+
+	# finished or cancelled?
+	def done(self):
+		return self.event.is_set()
+
+
+	# wait for the call to finish, and return its value.
+	# raises the exception of the call, or on timeout/cancel.
+	# timeout is in seconds (None waits forever).
+	def result(self, timeout=None):
+		if not self.event.wait(timeout):
+			raise Exception('timeout waiting for fluidsynth')
+		if self.state == 'cancelled':
+			raise Exception('cancelled')
+		if self.error != None:
+			raise self.error
+		return self.value
+
+
+	# call fn(future) when done. called right away if already done.
+	# NOTE: fn runs on the worker thread.
+	def addDoneCallback(self, fn):
+		with self.lock:
+			if not self.done():
+				self.callbacks.append(fn)
+				return
+		fn(self)
+
+
+	# worker is about to run the call.
+	# returns False if the call was cancelled
+	def start(self):
+		with self.lock:
+			if self.state != 'pending':
+				return False
+			self.state = 'running'
+			return True
+
+
+	def setResult(self, value):
+		self.value = value
+		self.state = 'done'
+		self.finish()
+
+
+	def setError(self, error):
+		self.error = error
+		self.state = 'done'
+		self.finish()
+
+
+	def finish(self):
+		with self.lock:
+			self.event.set()
+			callbacks = self.callbacks
+			self.callbacks = []
+		for fn in callbacks:
+			try:
+				fn(self)
+			except Exception as e:
+				print('error: callback failed')
+				print(e)
+				traceback.print_exc()
+
+
+# end class
+
+
+# async API
+# wraps FluidSynthApi, and runs every call on one worker thread, in order.
+# each call returns a FluidSynthFuture instead of blocking, for example:
+#
+#    engine = AsyncFluidSynthApi(api)
+#    future = engine.loadSoundFont('/home/Music/sf2/Brass 4.SF2')
+#    id = future.result(timeout=5)
+#
+# any FluidSynthApi method can be called this way (loadSoundFont,
+# getInstruments, setInstrument, setGain, setReverb..., setChorus..., etc).
+# scripts can drive several engines at once by waiting on their futures.
+class AsyncFluidSynthApi:
+
+	def __init__(self, api):
+		self.api = api                 # the blocking api.
+		self.queue = Queue.Queue()     # (future, function, args) to run.
+		self.latest = {}               # key: last future from submitLatest.
+		self.lock = threading.Lock()
+		self.worker = threading.Thread(target=self.run, name='fluidsynth-worker')
+		self.worker.daemon = True
+		self.worker.start()
+
+
+	# api.method(*args) -> future
+	def __getattr__(self, name):
+		if name.startswith('__'):
+			raise AttributeError(name)
+		fn = getattr(self.api, name)
+		if not callable(fn):
+			return fn
+		def submit(*args, **kwargs):
+			return self.submit(fn, *args, **kwargs)
+		return submit
+
+
+	# queue a call for the worker thread
+	#   returns: FluidSynthFuture
+	def submit(self, fn, *args, **kwargs):
+		future = FluidSynthFuture()
+		self.queue.put((future, fn, args, kwargs))
+		return future
+
+
+	# like submit, but only the latest call for each key will run.
+	# an older call with the same key is cancelled, if not started yet.
+	#   returns: FluidSynthFuture
+	def submitLatest(self, key, fn, *args, **kwargs):
+		with self.lock:
+			old = self.latest.get(key)
+			if old != None:
+				old.cancel()
+			future = self.submit(fn, *args, **kwargs)
+			self.latest[key] = future
+			return future
+
+
+	# all notes off.
+	# this is not queued behind slow calls, the command is sent right away.
+	def panic(self):
+		future = FluidSynthFuture()
+		try:
+			future.start()
+			future.setResult(self.api.panic())
+		except Exception as e:
+			future.setError(e)
+		return future
+
+
+	# stop the worker thread, after the queued calls are finished
+	def close(self):
+		self.queue.put(None)
+
+
+	# worker thread main loop
+	def run(self):
+		while True:
+			item = self.queue.get()
+			if item == None:
+				return
+			(future, fn, args, kwargs) = item
+			if not future.start():
+				continue # cancelled
+			try:
+				future.setResult(fn(*args, **kwargs))
+			except Exception as e:
+				print('error: async call failed: ' + fn.__name__)
+				print(e)
+				future.setError(e)
+
+
+# end class
+
+
+# sends parameter updates at a limited rate.
+# for example, dragging a slider creates hundreds of events per second,
+# but the engine only needs a few updates per second per control.
+# updates in between are coalesced, and the latest value always wins.
+# the last value is sent when the rate allows it, or on flush().
+#
+# schedule(seconds, fn) runs fn later.  the default starts a timer thread,
+# the gui passes wx.CallLater, so a late update is sent from the gui thread
+# like every other update (and no thread is started per update).
+#
+#    throttle = FluidSynthThrottle(maxRate=20)
+#    throttle.update('gain', api.setGain, 2.5)
+#    throttle.flush() # mouse released, send now
+class FluidSynthThrottle:
+
+	def __init__(self, maxRate=20, schedule=None):
+		self.maxRate = maxRate         # default max updates per second per key.
+		self.rates = {}                # key: max updates per second (override).
+		self.lastSent = {}             # key: time of last update sent.
+		self.pending = {}              # key: (function, args) not sent yet.
+		self.timers = {}               # key: number of the scheduled send.
+		self.timerCount = 0            # makes each scheduled send unique.
+		self.schedule = schedule       # schedule(seconds, fn), see above.
+		self.lock = threading.RLock()
+		if self.schedule == None:
+			self.schedule = self.startTimer
+
+
+	# change the max update rate for one key (0 = no limit)
+	def setRate(self, key, maxRate):
+		self.rates[key] = maxRate
+
+
+	# seconds between updates for key
+	def getInterval(self, key):
+		rate = self.rates.get(key, self.maxRate)
+		if rate <= 0:
+			return 0
+		return 1.0 / rate
+
+
+	# call fn(*args) now, or later if the key was updated too recently.
+	# a later update for the same key replaces this one.
+	def update(self, key, fn, *args):
+		with self.lock:
+			wait = self.lastSent.get(key, 0) + self.getInterval(key) - time.time()
+			self.pending[key] = (fn, args)
+			if wait <= 0:
+				self.flush(key)
+			elif key not in self.timers:
+				self.timerCount += 1
+				timer = self.timerCount
+				self.timers[key] = timer
+				self.schedule(wait, lambda: self.flushLate(key, timer))
+
+
+	def startTimer(self, seconds, fn):
+		timer = threading.Timer(seconds, fn)
+		timer.daemon = True
+		timer.start()
+
+
+	# a scheduled send.  does nothing if the update was sent already
+	# (by flush), or another send was scheduled since.
+	def flushLate(self, key, timer):
+		with self.lock:
+			if self.timers.get(key) == timer:
+				self.flush(key)
+
+
+	# send pending updates now. key=None sends all of them.
+	def flush(self, key=None):
+		with self.lock:
+			if key == None:
+				keys = list(self.pending.keys())
+			else:
+				keys = [key]
+
+			for key in keys:
+				self.timers.pop(key, None)
+				if key not in self.pending:
+					continue
+				(fn, args) = self.pending.pop(key)
+				self.lastSent[key] = time.time()
+				try:
+					fn(*args)
+				except Exception as e:
+					print('error: could not send update: ' + str(key))
+					print(e)
+
+
+# end class
+
+
+# keeps recently used fonts loaded, up to a memory budget.
+# loading a large font takes seconds, so switching back to a font heard a
+# moment ago should not load it again.  the cost of a font is the size of
+# its file, which is close to what the engine keeps in memory for sf2.
+# fonts are kept in the order they were used, and the least recently used
+# fonts that are not pinned (on a channel) are evicted first.
+#
+#    residency = FluidSynthResidency(512 * 1024 * 1024)
+#    residency.touch(1, '/home/Music/sf2/Piano.sf2')
+#    residency.evict(pinned=set([1]))
+#    []
+class FluidSynthResidency:
+
+	def __init__(self, budget):
+		self.budget = budget           # max bytes of resident fonts (0 = no cache).
+		self.fonts = collections.OrderedDict() # font_id: cost. oldest first.
+		self.used = 0                  # bytes of resident fonts.
+		self.hits = 0                  # loads served by a resident font.
+		self.misses = 0                # loads sent to fluidsynth.
+		self.evictions = 0             # fonts evicted to fit the budget.
+		self.prefetched = set()        # font ids prefetched, not selected yet.
+		self.prefetches = 0            # fonts loaded by prefetch.
+		self.prefetchHits = 0          # prefetched fonts that were selected.
+		self.lock = threading.RLock()
+
+
+	# the cost of a font, in bytes
+	def getCost(self, path):
+		try:
+			return os.path.getsize(path)
+		except Exception as e:
+			return 0
+
+
+	# mark the font as most recently used
+	# prefetch: the font was loaded before anyone asked for it
+	def touch(self, id, path, prefetch=False):
+		with self.lock:
+			cost = self.fonts.pop(id, None)
+			if cost == None:
+				cost = self.getCost(path)
+				self.used += cost
+				if prefetch:
+					self.prefetched.add(id)
+					self.prefetches += 1
+			self.fonts[id] = cost
+
+
+	# the font was unloaded
+	def forget(self, id):
+		with self.lock:
+			cost = self.fonts.pop(id, None)
+			if cost != None:
+				self.used -= cost
+			self.prefetched.discard(id)
+
+
+	# a resident font was selected
+	def hit(self, id):
+		with self.lock:
+			self.hits += 1
+			if id in self.prefetched:
+				self.prefetched.discard(id)
+				self.prefetchHits += 1
+
+
+	def miss(self):
+		self.misses += 1
+
+
+	# resident font ids, oldest first
+	def getIds(self):
+		with self.lock:
+			return list(self.fonts.keys())
+
+
+	# forget least recently used fonts until the rest fit the budget.
+	# pinned fonts are never evicted, but do count against the budget.
+	# returns the evicted font ids (the caller unloads them)
+	def evict(self, pinned=set()):
+		evicted = []
+		with self.lock:
+			for id in list(self.fonts.keys()):
+				if self.budget > 0 and self.used <= self.budget:
+					break
+				if id in pinned:
+					continue
+				self.forget(id)
+				evicted.append(id)
+			self.evictions += len(evicted)
+		return evicted
+
+
+	# counters, for debugging
+	def getStats(self):
+		with self.lock:
+			return {
+				'fonts': len(self.fonts),
+				'used': self.used,
+				'budget': self.budget,
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions,
+				'prefetches': self.prefetches,
+				'prefetchHits': self.prefetchHits,
+			}
+
+
+	# one line summary of the counters
+	def getSummary(self):
+		stats = self.getStats()
+		summary = 'resident fonts: %d (%.1f of %.1f MB) hits: %d misses: %d evictions: %d' % (
+			stats['fonts'], stats['used'] / 1048576.0, stats['budget'] / 1048576.0,
+			stats['hits'], stats['misses'], stats['evictions'])
+		if stats['prefetches'] > 0:
+			summary += ' prefetch hits: %d of %d (%.0f%%)' % (stats['prefetchHits'], 
+				stats['prefetches'], 100.0 * stats['prefetchHits'] / stats['prefetches'])
+		return summary
+
+
+# end class
+
+
+# a copy of the synth settings this client wrote or read (write-through).
+# a `get` costs a round trip, but most settings were set by this client, so
+# reads are answered from here.  another client (for example, through
+# fluidsynthproxy.py) may change a setting behind our back, so an entry can
+# expire after maxAge seconds, or be read again with refresh.
+#
+#    settings = FluidSynthSettings(maxAge=-1)
+#    settings.observe('set synth.gain 4.0')
+#    settings.get('synth.gain')
+#    '4.0'
+class FluidSynthSettings:
+
+	# shell commands that change a setting, without a `set`
+	commandKeys = {
+		'gain': ['synth.gain'],
+		'reverb': ['synth.reverb.active'],
+		'chorus': ['synth.chorus.active'],
+	}
+
+	def __init__(self, maxAge=-1):
+		self.maxAge = maxAge           # seconds an entry is good for (-1 = forever, 0 = no cache).
+		self.values = {}               # key: (value, time stored).
+		self.hits = 0                  # reads answered here.
+		self.misses = 0                # reads sent to fluidsynth.
+		self.refreshes = 0             # keys read again with refresh.
+		self.lock = threading.RLock()
+
+
+	# the cached value, or None if unknown or expired
+	def get(self, key):
+		with self.lock:
+			value = self.peek(key)
+			if value == None:
+				self.misses += 1
+			else:
+				self.hits += 1
+			return value
+
+
+	# like get, but not counted
+	def peek(self, key):
+		with self.lock:
+			entry = self.values.get(key)
+			if entry == None or self.maxAge == 0:
+				return None
+			if self.maxAge > 0 and time.time() - entry[1] > self.maxAge:
+				return None
+			return entry[0]
+
+
+	def put(self, key, value):
+		with self.lock:
+			self.values[key] = (value, time.time())
+
+
+	# forget one key, or every key (for example, a new connection)
+	def invalidate(self, key=None):
+		with self.lock:
+			if key == None:
+				self.values.clear()
+			else:
+				self.values.pop(key, None)
+
+
+	# keep up with a command sent to fluidsynth.
+	# `set key value` is stored, other commands that change a setting 
+	# (like `gain 2`) make the setting unknown.
+	def observe(self, packet):
+		for line in packet.split('\n'):
+			parts = line.split(None, 2)
+			if len(parts) == 0:
+				continue
+			if parts[0] == 'set' and len(parts) == 3:
+				self.put(parts[1], parts[2].strip())
+			elif parts[0] in self.commandKeys:
+				for key in self.commandKeys[parts[0]]:
+					self.invalidate(key)
+
+
+	# count keys read again (see FluidSynthApi.refreshSettings)
+	def refreshed(self, count):
+		with self.lock:
+			self.refreshes += count
+
+
+	# known keys
+	def getKeys(self):
+		with self.lock:
+			return list(self.values.keys())
+
+
+	# counters, for debugging
+	def getStats(self):
+		with self.lock:
+			return {
+				'settings': len(self.values),
+				'hits': self.hits,
+				'misses': self.misses,
+				'refreshes': self.refreshes,
+				'maxAge': self.maxAge,
+			}
+
+
+	# one line summary of the counters
+	def getSummary(self):
+		stats = self.getStats()
+		reads = stats['hits'] + stats['misses']
+		rate = 100.0 * stats['hits'] / reads if reads > 0 else 0
+		return 'cached settings: %d hits: %d misses: %d (%.0f%% hits) refreshes: %d' % (
+			stats['settings'], stats['hits'], stats['misses'], rate, stats['refreshes'])
+
+
+# end class
+
+
+# reads the preset list and header of a .sf2 file, without fluidsynth.
+# the file is memory mapped, and only the RIFF chunk headers, the INFO list 
+# and the preset headers (phdr) are read.  the sample data is never touched,
+# so this takes milliseconds even for very large banks.
+#
+#    sf2 = SoundFontFile('/home/Music/sf2/Brass 4.SF2')
+#    sf2.getInstruments()
+#    ['000-000 Brass', '000-001 Soft Brass']
+#
+# the instrument names use the same format as `inst` in fluidsynth, so
+# they can be passed to FluidSynthApi.setInstrument.
+#
+# .sf2 layout:
+#
+#    RIFF sfbk
+#       LIST INFO    ifil, INAM, ... (header)
+#       LIST sdta    smpl (sample data, skipped)
+#       LIST pdta    phdr, pbag, ... (presets)
+class SoundFontFile:
+
+	# INFO sub chunk: key in info dict
+	infoKeys = {
+		'ifil': 'version',
+		'isng': 'engine',
+		'INAM': 'name',
+		'irom': 'rom',
+		'iver': 'romVersion',
+		'ICRD': 'date',
+		'IENG': 'engineers',
+		'IPRD': 'product',
+		'ICOP': 'copyright',
+		'ICMT': 'comment',
+		'ISFT': 'software',
+	}
+
+	def __init__(self, path):
+		self.path = path               # path to the .sf2 file.
+		self.info = {}                 # header, see infoKeys.
+		self.presets = []              # (bank, prog, name), sorted.
+		self.read()
+
+
+	# parse the file. raises if it is not a .sf2 file
+	def read(self):
+		f = open(self.path, 'rb')
+		try:
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				self.parse(data)
+			finally:
+				data.close()
+		finally:
+			f.close()
+
+
+	def parse(self, data):
+		(riff, size, form) = struct.unpack_from('<4sI4s', data, 0)
+		if riff != 'RIFF' or form != 'sfbk':
+			raise Exception('not a sf2 file: ' + self.path)
+
+		end = min(8 + size, len(data))
+		for (id, pos, size) in self.chunks(data, 12, end):
+			if id != 'LIST':
+				continue
+			listType = data[pos:pos+4]
+			if listType == 'INFO':
+				self.parseInfo(data, pos+4, pos+size)
+			elif listType == 'pdta':
+				self.parsePresets(data, pos+4, pos+size)
+
+		self.presets.sort()
+
+
+	# iterate RIFF chunks between start and end
+	# yields (id, data_position, data_size)
+	def chunks(self, data, start, end):
+		pos = start
+		while pos + 8 <= end:
+			(id, size) = struct.unpack_from('<4sI', data, pos)
+			yield (id, pos+8, min(size, end-pos-8))
+			pos += 8 + size + (size & 1) # chunks are word aligned
+
+
+	def parseInfo(self, data, start, end):
+		for (id, pos, size) in self.chunks(data, start, end):
+			if id not in self.infoKeys:
+				continue
+			key = self.infoKeys[id]
+			if id in ['ifil', 'iver']:
+				(major, minor) = struct.unpack_from('<HH', data, pos)
+				self.info[key] = str(major) + '.' + str(minor)
+			else:
+				self.info[key] = self.cstring(data[pos:pos+size])
+
+
+	# preset header records:
+	#    char  name[20]
+	#    WORD  preset, bank, bag index
+	#    DWORD library, genre, morphology
+	# the last record is the terminal 'EOP' record
+	def parsePresets(self, data, start, end):
+		recordSize = 38
+		for (id, pos, size) in self.chunks(data, start, end):
+			if id != 'phdr':
+				continue
+			count = size / recordSize - 1 # skip terminal record
+			for i in range(count):
+				(name, prog, bank) = struct.unpack_from('<20sHH', data, pos + i*recordSize)
+				self.presets.append((bank, prog, self.cstring(name)))
+
+
+	# text up to the first null
+	def cstring(self, text):
+		return text.split('\0', 1)[0]
+
+
+	# instruments, formatted like `inst` in fluidsynth:
+	#    000-000 Dark Violins
+	def getInstruments(self):
+		return ['%03d-%03d %s' % preset for preset in self.presets]
+
+
+	def getInfo(self):
+		return self.info
+
+
+# end class
+
+
+# remembers the presets and header of every .sf2 file seen, in a sqlite
+# database (by default ~/.fluidsynth-gui/catalog.db).  the entries are keyed
+# by path, and store the size and modification time of the file.  a file is
+# only read again (see SoundFontFile) if its size or mtime changed.
+#
+#    catalog = SoundFontCatalog('/home/user/.fluidsynth-gui/catalog.db')
+#    catalog.getInstruments('/home/Music/sf2/Brass 4.SF2')
+#    ['000-000 Brass', '000-001 Soft Brass']
+#
+# the catalog can be used from any thread.  once closed, lookups return None
+# and nothing is written, so a thread still running does no harm.
+class SoundFontCatalog:
+
+	def __init__(self, dbFile):
+		self.dbFile = dbFile           # sqlite database file.
+		self.lock = threading.RLock()
+		self.hits = 0                  # lookups served from the catalog.
+		self.misses = 0                # lookups that had to read the file.
+		self.closed = False            # after close(), calls do nothing.
+
+		dbDir = os.path.dirname(dbFile)
+		if dbDir != '' and not os.path.exists(dbDir):
+			os.makedirs(dbDir)
+
+		self.db = sqlite3.connect(dbFile, check_same_thread=False)
+		self.db.text_factory = str
+		self.db.execute("""
+			create table if not exists fonts (
+				path text primary key,
+				size integer,
+				mtime real,
+				presets text,   -- one instrument per line, null if unreadable
+				info text       -- one 'key<tab>value' per line
+			)""")
+		self.db.commit()
+
+
+	# catalog entry for a file, (re)read from the file if it changed.
+	# returns (instruments, info), or None if the file is not a readable .sf2
+	# NOTE: preset names are stored as raw bytes, since many .sf2 files
+	# are not utf-8.
+	def lookup(self, path, commit=True):
+		try:
+			st = os.stat(path)
+		except Exception as e:
+			print('info: could not stat: ' + path)
+			print(e)
+			return None
+
+		with self.lock:
+			if self.closed:
+				return None
+			row = self.db.execute('select size, mtime, presets, info from fonts where path = ?',
+				(path,)).fetchone()
+
+		if row != None and row[0] == st.st_size and row[1] == st.st_mtime:
+			self.hits += 1
+			if row[2] == None:
+				return None
+			info = dict([line.split('\t', 1) for line in row[3].splitlines()])
+			return (row[2].splitlines(), info)
+
+		# NOTE: files are read outside the lock, so several threads 
+		# can read files at once
+		self.misses += 1
+		instruments = None
+		info = {}
+		try:
+			sf2 = SoundFontFile(path)
+			instruments = sf2.getInstruments()
+			info = sf2.getInfo()
+		except Exception as e:
+			print('info: could not read presets: ' + path)
+			print(e)
+
+		presets = None
+		if instruments != None:
+			presets = '\n'.join([name.replace('\n', ' ') for name in instruments])
+		infoText = '\n'.join([key + '\t' + value.replace('\n', ' ') 
+			for (key, value) in info.items()])
+
+		with self.lock:
+			if not self.closed:
+				self.db.execute('insert or replace into fonts values (?, ?, ?, ?, ?)',
+					(path, st.st_size, st.st_mtime, presets, infoText))
+				if commit:
+					self.db.commit()
+
+		if instruments == None:
+			return None
+		return (instruments, info)
+
+
+	# instruments, formatted like `inst` in fluidsynth:
+	#    000-000 Dark Violins
+	# returns [] if the file is not a readable .sf2
+	def getInstruments(self, path):
+		entry = self.lookup(path)
+		if entry == None:
+			return []
+		return entry[0]
+
+
+	# header of the file (see SoundFontFile.infoKeys)
+	def getInfo(self, path):
+		entry = self.lookup(path)
+		if entry == None:
+			return {}
+		return entry[1]
+
+
+	# bring the entries of a dir up to date.
+	# only files that changed are read again, deleted files are removed.
+	# names: file names in the dir (default: list the dir)
+	# isCancelled: optional function, returns True to stop (the files
+	# read so far are kept).
+	def refreshDir(self, dir, names=None, isCancelled=None):
+		if names == None:
+			names = os.listdir(dir)
+
+		paths = [os.path.join(dir, name) for name in names if SoundFontScanner.isSoundFontFile(name)]
+		for path in paths:
+			if isCancelled != None and isCancelled():
+				self.commit()
+				return
+			self.lookup(path, commit=False)
+
+		with self.lock:
+			if self.closed:
+				return
+			# forget files that are gone
+			known = self.db.execute('select path from fonts where path like ?',
+				(os.path.join(dir, '%'),)).fetchall()
+			present = set(paths)
+			for (path,) in known:
+				if os.path.dirname(path) == dir and path not in present:
+					self.db.execute('delete from fonts where path = ?', (path,))
+
+			self.db.commit()
+
+
+	# every preset of every font in the catalog, without reading any files.
+	# returns [(path, instrument), ...] where instrument is like:
+	#    000-000 Dark Violins
+	def getAllInstruments(self):
+		with self.lock:
+			if self.closed:
+				return []
+			rows = self.db.execute('select path, presets from fonts where presets is not null').fetchall()
+		instruments = []
+		for (path, presets) in rows:
+			for instrument in presets.splitlines():
+				instruments.append((path, instrument))
+		return instruments
+
+
+	def commit(self):
+		with self.lock:
+			if not self.closed:
+				self.db.commit()
+
+
+	def close(self):
+		with self.lock:
+			if not self.closed:
+				self.closed = True
+				self.db.close()
+
+
+# end class
+
+
+# walks a library of sound fonts, one directory per task, on a pool of 
+# threads.  entries are reported as soon as each directory is read:
+#
+#    onEntries(dir, entries)   entries: [(name, isDir, isSoundFont), ...]
+#    onProgress(dirs, files, soundFonts)
+#    onDone(cancelled)
+#
+# NOTE: the callbacks are called on the scanner threads.
+#
+# the file types come from scandir (when available), so no extra stat call
+# is needed per file.  directory symlinks are listed, but not followed.
+class SoundFontScanner:
+
+	def __init__(self, root, onEntries=None, onProgress=None, onDone=None,
+			threads=8, recursive=True):
+		self.root = root               # top directory.
+		self.onEntries = onEntries
+		self.onProgress = onProgress
+		self.onDone = onDone
+		self.threads = threads         # number of directories read at once.
+		self.recursive = recursive     # scan sub directories?
+		self.queue = Queue.Queue()     # directories to read.
+		self.workers = []              # threads, see start().
+		self.lock = threading.Lock()
+		self.cancelled = False
+		self.outstanding = 0           # directories queued or being read.
+		self.dirs = 0                  # directories read.
+		self.files = 0                 # entries found.
+		self.soundFonts = 0            # sound fonts found.
+
+
+	# is this file name a sound font?
+	@staticmethod
+	def isSoundFontFile(name):
+		return name.lower().endswith(('.sf2', '.sf3'))
+
+
+	# read one directory
+	# returns [(name, isDir, isSoundFont, isLink), ...], dot files excluded
+	@staticmethod
+	def listDir(path):
+		entries = []
+		if scandir != None:
+			for entry in scandir(path):
+				if entry.name.startswith('.'):
+					continue
+				isDir = entry.is_dir()
+				entries.append((entry.name, isDir, 
+					not isDir and SoundFontScanner.isSoundFontFile(entry.name),
+					isDir and entry.is_symlink()))
+		else:
+			# fallback: one stat per entry
+			for name in os.listdir(path):
+				if name.startswith('.'):
+					continue
+				full = os.path.join(path, name)
+				isDir = os.path.isdir(full)
+				entries.append((name, isDir, 
+					not isDir and SoundFontScanner.isSoundFontFile(name),
+					isDir and os.path.islink(full)))
+		return entries
+
+
+	# start scanning in the background
+	def start(self):
+		self.add(self.root)
+		for i in range(self.threads):
+			thread = threading.Thread(target=self.run, name='sf2-scanner')
+			thread.daemon = True
+			thread.start()
+			self.workers.append(thread)
+
+
+	# stop scanning. directories being read are finished.
+	def cancel(self):
+		self.cancelled = True
+
+
+	# wait for the scan to finish
+	# timeout: max seconds to wait for the threads (None = no limit)
+	def join(self, timeout=None):
+		if timeout == None:
+			self.queue.join()
+			return
+		end = time.time() + timeout
+		for thread in self.workers:
+			thread.join(max(0, end - time.time()))
+
+
+	def add(self, path):
+		with self.lock:
+			self.outstanding += 1
+		self.queue.put(path)
+
+
+	# worker thread main loop
+	def run(self):
+		while True:
+			path = self.queue.get()
+			if path == None:
+				self.queue.task_done()
+				return
+			try:
+				if not self.cancelled:
+					self.scan(path)
+			except Exception as e:
+				print('warn: could not scan dir: ' + path)
+				print(e)
+			self.finish()
+			self.queue.task_done()
+
+
+	def scan(self, path):
+		entries = self.listDir(path)
+
+		if self.recursive:
+			for (name, isDir, isSoundFont, isLink) in entries:
+				if isDir and not isLink:
+					self.add(os.path.join(path, name))
+
+		with self.lock:
+			self.dirs += 1
+			self.files += len(entries)
+			self.soundFonts += len([1 for entry in entries if entry[2]])
+			progress = (self.dirs, self.files, self.soundFonts)
+
+		if self.onEntries != None:
+			self.onEntries(path, [entry[0:3] for entry in entries])
+		if self.onProgress != None:
+			self.onProgress(*progress)
+
+
+	# a directory is finished. the last one stops the workers
+	def finish(self):
+		with self.lock:
+			self.outstanding -= 1
+			done = self.outstanding == 0
+		if done:
+			for i in range(self.threads):
+				self.queue.put(None)
+			if self.onDone != None:
+				self.onDone(self.cancelled)
+
+
+# end class
+
+
+# search-as-you-type index over a list of names (case insensitive).
+# built once per listing.  each search only looks at the names that share
+# the trigrams (3 letter sequences) of the query, so typing in a large 
+# folder costs time proportional to the matches, not the whole folder.
+#
+#    index = TrigramIndex(['Brass 4.SF2', 'Dark Violins.sf2'])
+#    index.build()
+#    index.search('vio')
+#    ['Dark Violins.sf2']
+#
+# search patterns:
+#    default   space is a wildcard, everything else is literal text.
+#              while the query only grows, the last result is narrowed
+#              instead of searching again.
+#    regex     space is a wildcard, the rest is a regular expression.
+#              literal text in the regex is used to pre-filter names.
+class TrigramIndex:
+
+	def __init__(self, names):
+		self.names = sorted(names, key=lambda s: s.lower()) # presorted results.
+		self.trigrams = None           # trigram: set of positions in names.
+		self.lastQuery = None          # (pattern, regex) of last search.
+		self.lastResult = None         # positions matching last search.
+
+
+	# build the trigram sets.
+	# call it once the names are listed (the gui does it on a background
+	# thread).  until it is done, search looks at every name.
+	def build(self):
+		trigrams = {}
+		for (i, name) in enumerate(self.names):
+			name = name.lower()
+			for j in range(len(name)-2):
+				trigram = name[j:j+3]
+				positions = trigrams.get(trigram)
+				if positions == None:
+					trigrams[trigram] = set([i])
+				else:
+					positions.add(i)
+		self.trigrams = trigrams
+
+
+	# all 3 letter sequences in text
+	def getTrigrams(self, text):
+		return set([text[i:i+3] for i in range(len(text)-2)])
+
+
+	# names that match the pattern, sorted (case insensitive).
+	# limit: max number of names (None = all).  the names are walked in
+	# order, so a short query over many names stops early.
+	# returns a new list
+	def search(self, pattern, regex=False, limit=None):
+
+		# whitespace may be confusing since it won't show up in search box
+		# by default all space will be a wildcard 
+		# clean up trailing, duplicate spaces
+		pattern = pattern.strip(' \t\n\r') 
+		pattern = re.sub('  +', ' ', pattern)
+
+		if regex:
+			literals = self.getRegexLiterals(pattern)
+			expr = pattern.replace(' ','.*')
+		else:
+			literals = pattern.split(' ')
+			expr = re.escape(pattern)
+			expr = expr.replace('\\ ','.*')
+
+		try:
+			expr = re.compile(expr, re.IGNORECASE)
+		except Exception as e:
+			print('warn: bad search pattern: ' + pattern)
+			print(e)
+			return []
+
+		# start from the last result, if the query only grew.
+		# (only safe for literal patterns)
+		candidates = None
+		if not regex and self.lastQuery != None and not self.lastQuery[1] \
+				and pattern.startswith(self.lastQuery[0]):
+			candidates = set(self.lastResult)
+
+		# narrow down by trigrams, rarest first
+		trigrams = set()
+		for literal in literals:
+			trigrams.update(self.getTrigrams(literal.lower()))
+		index = self.trigrams # may be set by build() on another thread
+		if index == None:
+			trigrams = set()  # not built yet
+		postings = [index.get(trigram, set()) for trigram in trigrams]
+		postings.sort(key=len)
+		for positions in postings:
+			if candidates == None:
+				candidates = positions
+			elif len(positions) < len(candidates):
+				candidates = set([i for i in positions if i in candidates])
+			else:
+				candidates = set([i for i in candidates if i in positions])
+
+		if candidates == None:
+			if pattern == '':
+				self.lastQuery = (pattern, regex)
+				self.lastResult = range(len(self.names))
+				return self.names[:limit]
+			candidates = range(len(self.names)) # nothing to narrow by
+
+		names = self.names
+		if limit == None:
+			result = sorted([i for i in candidates if expr.search(names[i])])
+		else:
+			result = []
+			for i in sorted(candidates):
+				if expr.search(names[i]):
+					result.append(i)
+					if len(result) == limit:
+						break
+
+		if len(result) == limit:
+			self.lastQuery = None # cut short, can't be narrowed
+		else:
+			self.lastQuery = (pattern, regex)
+			self.lastResult = result
+		return [names[i] for i in result]
+
+
+	# literal text that any match of the regex must contain.
+	# text inside groups, or before ?, * and {, is optional and is skipped.
+	# so are escapes like \d, and the digits of \x41, \101 or \1.
+	# returns [] if nothing is certain (for example, alternation)
+	def getRegexLiterals(self, pattern):
+		if '|' in pattern:
+			return []
+
+		literals = []
+		current = ''
+		depth = 0 # inside a group?
+		i = 0
+		while i < len(pattern):
+			c = pattern[i]
+			literal = None
+			if c == '\\' and i+1 < len(pattern):
+				i += 1
+				if not pattern[i].isalnum():
+					literal = pattern[i] # escaped punctuation
+				elif pattern[i] in 'xuU':
+					i += {'x': 2, 'u': 4, 'U': 8}[pattern[i]] # hex digits
+				elif pattern[i].isdigit():
+					# octal or group number, up to 3 digits
+					end = i+1
+					while end < len(pattern) and end < i+3 and pattern[end].isdigit():
+						end += 1
+					i = end - 1
+			elif c == '[':
+				# skip character class
+				end = pattern.find(']', i+2)
+				i = len(pattern) if end < 0 else end
+			elif c == '(':
+				depth += 1
+			elif c == ')':
+				depth -= 1
+			elif c in '?*{':
+				current = current[:-1] # last char is optional
+				if c == '{':
+					# skip repeat count
+					end = pattern.find('}', i)
+					i = len(pattern) if end < 0 else end
+			elif c not in '.^$+ ':
+				literal = c
+
+			if literal != None and depth == 0:
+				current += literal
+			else:
+				literals.append(current)
+				current = ''
+			i += 1
+
+		literals.append(current)
+		return [literal for literal in literals if len(literal) >= 3]
+
+
+# end class
+
+
+# searches preset names across many sound fonts, without loading them.
+# the same name is often in many fonts (Piano, Strings, ...), so the
+# names are indexed once (see TrigramIndex) and each name maps to the
+# fonts that have it.
+#
+#    index = PresetIndex(catalog.getAllInstruments())
+#    index.search('violin')
+#    [('/home/Music/sf2/Strings.sf2', 0, 40, 'Violin'), ...]
+class PresetIndex:
+
+	def __init__(self, instruments):
+		self.fonts = {}                # preset name: [(path, bank, prog), ...]
+		self.count = 0                 # number of presets.
+
+		# instrument format:
+		#    000-000 Dark Violins  
+		for (path, instrument) in instruments:
+			try:
+				parts = instrument.split(' ', 1)
+				ids = parts[0].split('-')
+				name = parts[1] if len(parts) > 1 else ''
+				preset = (path, int(ids[0]), int(ids[1]))
+			except Exception as e:
+				print('warn: skipping preset: ' + instrument)
+				continue
+			fonts = self.fonts.get(name)
+			if fonts == None:
+				fonts = self.fonts[name] = []
+			fonts.append(preset)
+			self.count += 1
+
+		for fonts in self.fonts.values():
+			fonts.sort()
+
+		self.index = TrigramIndex(self.fonts.keys())
+		self.index.build()
+
+
+	# presets with a name matching the pattern (see TrigramIndex.search)
+	# returns [(path, bank, prog, name), ...] sorted by name, then path.
+	# limit: max number of results.  every name has at least one preset,
+	# so the name search stops at the same limit.
+	def search(self, pattern, limit=1000):
+		results = []
+		for name in self.index.search(pattern, False, limit):
+			for (path, bank, prog) in self.fonts[name]:
+				results.append((path, bank, prog, name))
+				if len(results) >= limit:
+					return results
+		return results
+
+
+# end class
+
+
+# the channels and levels of a gui session, as saved in data.json.
+# the gui writes it on exit, and restores it on start.  fluidsynthcli.py
+# can restore it without the gui.
+#
+#    session = FluidSynthSession()
+#    session.load()
+#    session.applyLevels(api)
+#    (plan, activeChannel) = session.getPlan()
+#    api.restoreChannels(plan, activeChannel)
+class FluidSynthSession:
+
+	dataFile = os.path.expanduser('~') + '/.fluidsynth-gui/data.json'
+
+	def __init__(self, data=None):
+		if data == None:
+			data = {}
+		self.data = data               # anything the gui saved.
+
+
+	# read a saved session (default: the gui's data.json)
+	def load(self, dataFile=None):
+		if dataFile == None:
+			dataFile = self.dataFile
+		f = open(dataFile, 'r')
+		self.data = json.loads(f.read())
+		f.close()
+
+
+	def get(self, key, default=''):
+		if key in self.data:
+			return self.data[key]
+		return default
+
+
+	# fonts and instruments to restore
+	# note: font ids will change on reloading
+	# returns (plan, activeChannel), see FluidSynthApi.restoreChannels
+	def getPlan(self):
+		fontsInUse = self.get('fontsInUse', [])	 # overall map 
+		fontFilesLoaded = self.get('fontFilesLoaded', {})
+		instrumentsInUse = self.get('instrumentsInUse', [])
+		activeChannel = self.get('activeChannel', 1) # base 1
+
+		plan = [] # (channel, font, instrument)
+		for idx, oldFontId in enumerate(fontsInUse):
+
+			if oldFontId == -1: # not in use
+				continue
+
+			channel = idx+1 # 1-based
+			font = fontFilesLoaded.get(str(oldFontId), '')
+			instrument = instrumentsInUse[idx]
+
+			print('found ')
+			print('	channel: ' + str(channel))
+			print('	font: ' + font)
+			print('	instrument: ' + instrument)
+			print('--')
+
+			if font == '':
+				print('error: missing font data')
+				continue
+
+			if instrument == '':
+				print('error: missing instrument data')
+				continue
+
+			plan.append((channel, font, instrument))
+
+		return (plan, activeChannel)
+
+
+	# levels saved from the Levels page, scaled the same way the sliders
+	# are (see FluidSynthGui.onScrollGain ...)
+	# returns [(api method name, value)]
+	def getLevels(self):
+		levels = []
+		if 'sGain' in self.data:
+			levels.append(('setGain', self.data['sGain'] / 20.0)) # 100 -> 5
+
+		effects = [
+			('cbEnableReverb', 'setReverb', [
+				('sReverbDamp', 'setReverbDamp', 1/100.0),
+				('sReverbRoomSize', 'setReverbRoomSize', 1/100.0),
+				('sReverbWidth', 'setReverbWidth', 1/100.0),
+				('sReverbLevel', 'setReverbLevel', 1/100.0)]),
+			('cbEnableChorus', 'setChorus', [
+				('sChorusNR', 'setChorusNR', 1),
+				('sChorusLevel', 'setChorusLevel', 1/100.0),
+				('sChorusSpeed', 'setChorusSpeed', 1/100.0),
+				('sChorusDepth', 'setChorusDepth', 1)]),
+		]
+		for (enable, method, details) in effects:
+			if enable not in self.data:
+				continue
+			on = bool(self.data[enable])
+			levels.append((method, on))
+			if not on:
+				continue # details only matter when the effect is on
+			for (key, detail, scale) in details:
+				if key in self.data:
+					levels.append((detail, self.data[key] * scale))
+
+		return levels
+
+
+	# send the saved levels, in one write
+	def applyLevels(self, api):
+		with api.batch():
+			for (method, value) in self.getLevels():
+				getattr(api, method)(value)
+
+
+# end class
+
+
+# add the options of the api (connection, engines, fonts, debugging) to
+# a command line parser.  used by the gui and the cli.
+def addApiOptions(parser):
+	parser.add_option('-c', '--cmd', action='store', dest='fluidsynthCmd', 
+		help='use a custom command to start FluidSynth server', default='') 
+	parser.add_option('--transport', action='store', dest='transport', 
+		choices=['tcp', 'pipe'], help='talk to fluidsynth over tcp, or over the stdin/stdout of a fluidsynth started by this program (tcp|pipe)', default='tcp') 
+	parser.add_option('--host', action='store', dest='host', 
+		help='fluidsynth host (tcp)', default='localhost') 
+	parser.add_option('--port', action='store', type='int', dest='port', 
+		help='fluidsynth shell port (tcp)', default=9800) 
+	parser.add_option('--engines', action='store', type='int', dest='engines', 
+		help='start N fluidsynth engines (ports PORT, PORT+1, ...) and share the channels between them', default=1) 
+	parser.add_option('--channel-policy', action='store', dest='channelPolicy', 
+		choices=FluidSynthPool.policies, help='how channels are shared between engines: ' + '|'.join(FluidSynthPool.policies) + ' (default block)', default='block') 
+	parser.add_option('--channel-map', action='store', dest='channelMap', 
+		help='engine of each channel, for --channel-policy map. for example: 1,1,1,1,2,2,2,2,3,3,3,3,4,4,4,4', default='') 
+	parser.add_option('--font-memory', action='store', type='float', dest='fontMemory',
+		help='MB of recently used fonts to keep loaded (0 = only fonts on a channel)', default=512) 
+	parser.add_option('--settings-max-age', action='store', type='float', dest='settingsMaxAge',
+		help='seconds a cached setting (gain, reverb, ...) is good for, before it is read from fluidsynth again (default -1 = forever, 0 = no cache). use when other programs change settings', default=-1) 
+	parser.add_option('--debug', action='store_true', dest='debug', 
+		help='verbose logging to stdout') 
+	parser.add_option('--trace', action='store_true', dest='trace', 
+		help='keep the last socket io in memory. dump with: kill -USR1 <pid>') 
+	parser.add_option('--trace-size', action='store', type='int', dest='traceSize',
+		help='socket io events kept by --trace', default=4096) 
+	parser.add_option('--stats', action='store_true', dest='stats', 
+		help='print command counts and latency on exit') 
+	parser.add_option('--stats-port', action='store', type='int', dest='statsPort',
+		help='serve command stats as text on http://localhost:PORT/metrics', default=0) 
+
+
+# create the api for the parsed options: a FluidSynthPool for --engines > 1,
+# otherwise a FluidSynthApi.  also starts --trace and --stats-port.
+# connect: False to connect later, with start()
+def openApi(options, args, connect=True):
+	if options.engines > 1:
+		api = FluidSynthPool(options, args, connect)
+	else:
+		api = FluidSynthApi(options, args, connect)
+
+	if options.trace and hasattr(signal, 'SIGUSR1'):
+		signal.signal(signal.SIGUSR1, lambda signum, frame: api.tracer.dump())
+
+	if options.statsPort:
+		statsServer = FluidSynthStatsServer(api.stats, options.statsPort)
+		statsServer.start()
+		print('stats on http://localhost:' + str(statsServer.port) + '/metrics')
+
+	return api
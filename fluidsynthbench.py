@@ -0,0 +1,696 @@
+#!/usr/bin/python
+#
+# Kevin Seifert - GPL 2015
+#
+# Benchmarks for the FluidSynthApi hot paths.
+# Everything runs against fluidsynthmock.py, so no audio setup is needed,
+# and the same inputs are used on every run.
+#
+# Run:
+#
+#    python fluidsynthbench.py
+#
+# Save the results, then compare a later run against them:
+#
+#    python fluidsynthbench.py --json before.json
+#    python fluidsynthbench.py --baseline before.json --threshold 0.2
+#
+# With --baseline, the exit status is 1 if any benchmark is slower than
+# the baseline by more than the threshold (0.2 = 20%).
+#
+# Benchmarks defined below:
+#
+#   read - time to read one reply from the socket, as the reply grows.
+#          the cost per byte should stay flat.
+#
+#   cmd - round trip of one blocking command, and the cost of one
+#          non-blocking command.
+#
+#   font - loadSoundFont, getInstruments and setInstrument, as the gui
+#          does when a font is selected.
+#
+#   unload - unloadSoundFonts with many fonts loaded.
+#
+#   filter - indexing 1k, 10k and 100k file names, and typing a search
+#          filter (see TrigramIndex, used by FluidSynthGui.filterSoundFont).
+#
+#   presets - search 102,400 presets (800 fonts of 128) for a few short
+#          queries, 500 results at most (see PresetIndex, used by
+#          FluidSynthGui.searchPresets).
+#
+#   trace - cost of one FluidSynthTracer event.
+#
+#   scene - load a 16 channel scene (levels + 16 fonts and instruments),
+#          with and without batched writes. counts socket writes.
+#
+#   restore - restore a 16 channel session (8 files, 20 ms per load), one
+#          channel at a time, and with FluidSynthApi.restoreChannels.
+#
+#   transport - a non-blocking command followed by a blocking one, over
+#          tcp (with and without Nagle's algorithm) and over a pipe.  also
+#          checks that the reader raises once a pipe engine exits.
+#
+#   settings - read gain, reverb and chorus (the Levels page), from the
+#          settings cache, and with the cache off (one `get` each).
+#
+#   proxy - a blocking command through fluidsynthproxy.py, with 1 and 100
+#          clients, and how long a reset waits behind a busy client.
+#
+#   import - time to import fluidsynthapi (what fluidsynthcli.py loads)
+#          and fluidsynthgui (with wx), each in a new python process.
+#          the note has the peak memory of that process.
+#
+# Note on whitespace:
+#    I'm using tabs for indentation, with my tab width set at 4 spaces.
+
+
+import sys
+import time
+import socket
+import threading
+import optparse
+import random
+import os
+import json
+import platform
+import subprocess
+
+from fluidsynthapi import FluidSynthReader
+from fluidsynthapi import FluidSynthPipeTransport
+from fluidsynthapi import FluidSynthApi
+from fluidsynthapi import TrigramIndex
+from fluidsynthapi import PresetIndex
+from fluidsynthapi import FluidSynthTracer
+from fluidsynthmock import MockFluidSynthServer
+from fluidsynthproxy import FluidSynthProxy
+
+
+# a fake `inst` reply of about `size` bytes
+def makeReply(size):
+	lines = []
+	total = 0
+	i = 0
+	while total < size:
+		line = '%03d-%03d Instrument Number %d\n' % (i / 128, i % 128, i)
+		lines.append(line)
+		total += len(line)
+		i += 1
+	return ''.join(lines)[0:size]
+
+
+# the reader used before FluidSynthReader.
+# appends every chunk and searches the whole buffer each time.
+def readQuadratic(sock, eof, buffersize=4096):
+	data = ''
+	while True:
+		part = sock.recv(buffersize)
+		data += part
+		pos = data.find(eof)
+		if pos > -1:
+			return data[0:pos]
+
+
+# best time of several runs of fn(), seconds
+def timeMin(fn, repeat=5):
+	best = None
+	for i in range(repeat):
+		start = time.time()
+		fn()
+		elapsed = time.time() - start
+		if best == None or elapsed < best:
+			best = elapsed
+	return best
+
+
+# time one read of a reply, seconds
+def timeRead(size, legacy=False):
+	eof = '\n.bench.1\n'
+	reply = makeReply(size)
+	(a, b) = socket.socketpair()
+
+	# write in the background, so the reader sees many small chunks
+	writer = threading.Thread(target=a.sendall, args=(reply + eof,))
+	writer.start()
+
+	start = time.time()
+	if legacy:
+		data = readQuadratic(b, eof)
+	else:
+		data = FluidSynthReader(b).readUntil(eof)
+	elapsed = time.time() - start
+
+	writer.join()
+	a.close()
+	b.close()
+
+	if len(data) != len(reply):
+		raise Exception('read ' + str(len(data)) + ' of ' + str(len(reply)) + ' bytes')
+	return elapsed
+
+
+# counts writes to a socket
+class CountingSocket:
+
+	def __init__(self, sock):
+		self.sock = sock
+		self.writes = 0
+
+
+	def sendall(self, data):
+		self.writes += 1
+		return self.sock.sendall(data)
+
+
+	def __getattr__(self, name):
+		return getattr(self.sock, name)
+
+
+# api options, as parsed by fluidsynthgui.py
+def makeOptions(**values):
+	options = {'fluidsynthCmd': '', 'fontMemory': 0, 'stats': False, 
+		'statsPort': 0, 'debug': False, 'trace': False, 'transport': 'tcp',
+		'host': 'localhost', 'port': 9800, 'settingsMaxAge': -1}
+	options.update(values)
+	return optparse.Values(options)
+
+
+# api connected to a MockFluidSynthServer
+class BenchApi(FluidSynthApi):
+
+	def __init__(self, port, noDelay=True):
+		self.benchNoDelay = noDelay
+		FluidSynthApi.__init__(self, makeOptions(port=port), [])
+		self.debug = False
+		self.transport = CountingSocket(self.transport)
+
+
+	def connect(self):
+		self.noDelay = self.benchNoDelay
+		FluidSynthApi.connect(self)
+
+
+	# stop counting, the api closes the real transport on delete
+	def finish(self):
+		writes = self.transport.writes
+		self.transport = self.transport.sock
+		return writes
+
+
+# start a mock server and connect an api to it
+# returns (server, api)
+def connectMock(presets=128, latency={}):
+	server = MockFluidSynthServer(port=0, presets=presets, latency=latency)
+	server.start()
+	return (server, BenchApi(server.port))
+
+
+# results are lists of (name, seconds, note)
+
+# reply size vs cost per byte
+def benchRead(legacy=False, maxSize=10*1024*1024):
+	results = []
+	prefix = 'read/legacy/' if legacy else 'read/'
+	size = 1024
+	while size <= maxSize:
+		elapsed = min([timeRead(size, legacy) for i in range(3)])
+		note = '%.2f ns/byte' % (elapsed * 1e9 / size)
+		results.append((prefix + str(size), elapsed, note))
+		size *= 10
+	return results
+
+
+# blocking round trip, and non-blocking send (per command)
+def benchCmd(count=1000):
+	(server, api) = connectMock()
+
+	def blocking():
+		for i in range(count):
+			api.cmd('get synth.gain')
+
+	def nonBlocking():
+		for i in range(count):
+			api.cmd('gain 1', True)
+		api.cmd('echo done') # wait for the last command
+
+	results = [
+		('cmd/blocking', timeMin(blocking) / count, 'per command'),
+		('cmd/non-blocking', timeMin(nonBlocking) / count, 'per command'),
+	]
+	api.finish()
+	server.close()
+	return results
+
+
+# select a font the way the gui does (per font)
+def benchFont(count=20, presets=128):
+	(server, api) = connectMock(presets)
+	paths = ['/bench/font' + str(i) + '.sf2' for i in range(count)]
+
+	def select():
+		for path in paths:
+			id = api.loadSoundFont(path)
+			voices = api.getInstruments(id)
+			api.setInstrument(voices[0])
+		api.unloadSoundFonts()
+		api.cmd('echo done')
+
+	results = [('font/select', timeMin(select) / count,
+		'load+inst+select, ' + str(presets) + ' presets')]
+	api.finish()
+	server.close()
+	return results
+
+
+# unload every font, with many fonts loaded
+def benchUnload(counts=[16, 256, 1024]):
+	results = []
+	for count in counts:
+		(server, api) = connectMock()
+		best = None
+		for run in range(3):
+			for i in range(count):
+				api.loadSoundFont('/bench/font' + str(i) + '.sf2')
+			start = time.time()
+			api.unloadSoundFonts()
+			api.cmd('echo done')
+			elapsed = time.time() - start
+			if best == None or elapsed < best:
+				best = elapsed
+		results.append(('unload/' + str(count), best, 'fonts loaded'))
+		api.finish()
+		server.close()
+	return results
+
+
+# file names like a large sound font folder
+def makeFileNames(count, seed=1):
+	words = ['Piano', 'Grand', 'Violin', 'Viola', 'Cello', 'Strings', 'Brass',
+		'Trumpet', 'Horn', 'Organ', 'Choir', 'Pad', 'Lead', 'Bass', 'Guitar',
+		'Drums', 'Flute', 'Oboe', 'Harp', 'Bells', 'Synth', 'Ensemble']
+	rand = random.Random(seed)
+	names = []
+	for i in range(count):
+		name = ' '.join([rand.choice(words) for j in range(rand.randint(1, 3))])
+		names.append('%s %d.sf2' % (name, i))
+	return names
+
+
+# index a listing (done in the background by the gui), then type a
+# filter one letter at a time
+def benchFilter(counts=[1000, 10000, 100000]):
+	results = []
+	for count in counts:
+		names = makeFileNames(count)
+		index = TrigramIndex(names)
+		results.append(('filter/index/' + str(count), timeMin(index.build, 3), 'build'))
+		for (query, regex) in [('violin 1', False), ('vio.*n 1', True)]:
+			def typeQuery():
+				index.lastQuery = None # fresh search
+				for i in range(1, len(query)+1):
+					index.search(query[:i], regex)
+			name = 'filter/' + ('regex/' if regex else '') + str(count)
+			results.append((name, timeMin(typeQuery, 3), 'type "' + query + '"'))
+	return results
+
+
+# one search of the preset index, as the gui does after a key press
+def benchPresets(fonts=800, presets=128, limit=500):
+	instruments = []
+	for (i, name) in enumerate(makeFileNames(fonts * presets)):
+		path = '/sf2/%d.sf2' % (i / presets)
+		instruments.append((path, '%03d-%03d %s' % (0, i % presets, name[:-4])))
+	index = PresetIndex(instruments)
+
+	def search(query):
+		index.index.lastQuery = None # fresh search
+		return index.search(query, limit)
+
+	results = []
+	for query in ['o', 'o 1', 'vi', 'violin 12']:
+		elapsed = timeMin(lambda: search(query), 5)
+		results.append(('presets/' + query.replace(' ', '_'), elapsed, 
+			str(len(search(query))) + ' of ' + str(index.count)))
+	return results
+
+
+# cost of one trace event (per event)
+def benchTrace(count=100000):
+	tracer = FluidSynthTracer(4096)
+	packet = 'select 0 1 0 0\n'
+
+	def trace():
+		for i in range(count):
+			tracer.trace('send', packet)
+
+	def loop():
+		for i in range(count):
+			pass
+
+	elapsed = timeMin(trace) - timeMin(loop) # without the loop itself
+	return [('trace/event', elapsed / count, 'per event')]
+
+
+# restore levels and 16 channels, like applyPreferenceSnapshot does
+def loadScene(api):
+	api.setGain(2.5)
+	api.setReverb(True)
+	api.setReverbRoomSize(.5)
+	api.setReverbDamp(.5)
+	api.setReverbWidth(.5)
+	api.setReverbLevel(.5)
+	api.setChorus(True)
+	api.setChorusNR(3)
+	api.setChorusLevel(.5)
+	api.setChorusSpeed(2.5)
+	api.setChorusDepth(20)
+	for channel in range(1, 17):
+		api.setSelectedChannel(channel)
+		api.loadSoundFont('/bench/font' + str(channel) + '.sf2')
+		api.setInstrument('000-000 Instrument')
+
+
+# time one scene load. returns (seconds, socket writes)
+def timeScene(batched):
+	(server, api) = connectMock()
+
+	start = time.time()
+	if batched:
+		with api.batch():
+			loadScene(api)
+	else:
+		loadScene(api)
+	api.cmd('echo done') # wait for the last command
+	elapsed = time.time() - start
+
+	writes = api.finish()
+	server.close()
+	return (elapsed, writes)
+
+
+def benchScene():
+	results = []
+	for batched in [False, True]:
+		runs = [timeScene(batched) for i in range(5)]
+		elapsed = min([run[0] for run in runs])
+		name = 'scene/batched' if batched else 'scene/unbatched'
+		results.append((name, elapsed, str(runs[0][1]) + ' writes'))
+	return results
+
+
+# restore a session of 16 channels sharing 8 files.
+# returns (seconds, socket writes)
+def timeRestore(planned, loadTime=.02):
+	(server, api) = connectMock(latency={'load': loadTime})
+	plan = [(channel, '/bench/font' + str(channel % 8) + '.sf2',
+		'000-%03d Instrument' % channel) for channel in range(1, 17)]
+
+	start = time.time()
+	if planned:
+		api.restoreChannels(plan, activeChannel=1)
+	else:
+		for (channel, font, instrument) in plan:
+			api.setSelectedChannel(channel)
+			api.loadSoundFont(font)
+			api.setInstrument(instrument)
+		api.setSelectedChannel(1)
+	api.cmd('echo done') # wait for the last command
+	elapsed = time.time() - start
+
+	writes = api.finish()
+	server.close()
+	return (elapsed, writes)
+
+
+def benchRestore():
+	results = []
+	for planned in [False, True]:
+		runs = [timeRestore(planned) for i in range(3)]
+		elapsed = min([run[0] for run in runs])
+		name = 'restore/planned' if planned else 'restore/sequential'
+		results.append((name, elapsed, str(runs[0][1]) + ' writes, 8 loads of 20 ms'))
+	return results
+
+
+# a non-blocking command, then a blocking one (per pair).
+# the second small write is the one Nagle's algorithm holds back.
+def timeTransport(api, count=200):
+	def pairs():
+		for i in range(count):
+			api.cmd('gain 1', True)
+			api.cmd('get synth.gain')
+	return timeMin(pairs, 3) / count
+
+
+def benchTransport():
+	results = []
+	for noDelay in [True, False]:
+		server = MockFluidSynthServer(port=0)
+		server.start()
+		api = BenchApi(server.port, noDelay)
+		name = 'transport/tcp' if noDelay else 'transport/tcp-nagle'
+		results.append((name, timeTransport(api, 200 if noDelay else 20), 'per pair'))
+		api.finish()
+		server.close()
+
+	mock = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fluidsynthmock.py')
+	api = FluidSynthApi(makeOptions(transport='pipe', 
+		fluidsynthCmd=sys.executable + ' ' + mock + ' --stdio'), [])
+	results.append(('transport/pipe', timeTransport(api), 'per pair'))
+	api.closeFluidSynth()
+	results.append(('transport/pipe-exit', timePipeExit(), 'until the reader gives up'))
+	return results
+
+
+# an engine that exits after a partial prompt.  the reader must raise
+# right away, instead of reading the held prompt over and over.
+def timePipeExit():
+	code = 'import sys; sys.stdout.write("hello\\n>")'
+	process = subprocess.Popen([sys.executable, '-c', code],
+		stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+	reader = FluidSynthReader(FluidSynthPipeTransport(process, 5))
+	start = time.time()
+	try:
+		reader.readUntil('\nnever\n')
+		raise Exception('error: reader did not see the engine exit')
+	except Exception as e:
+		if str(e) != 'connection closed':
+			raise
+	elapsed = time.time() - start
+	process.wait()
+	return elapsed
+
+
+# read the Levels state, seconds per read.  maxAge 0 = cache off
+def timeSettings(api, maxAge, count=200):
+	api.settings.maxAge = maxAge
+	api.setGain(2.5)
+	api.setReverb(True)
+	api.setChorus(False)
+	def levels():
+		for i in range(count):
+			api.getGain()
+			api.getReverb()
+			api.getChorus()
+	return timeMin(levels, 3) / count
+
+
+def benchSettings():
+	(server, api) = connectMock()
+	results = []
+	results.append(('settings/uncached', timeSettings(api, 0), '3 gets per read'))
+	results.append(('settings/cached', timeSettings(api, -1), 'per read, ' + api.settings.getSummary()))
+	api.finish()
+	server.close()
+	return results
+
+
+# blocking commands from `clients` apis at once, through a proxy.
+# returns seconds per command
+def timeProxy(proxy, clients, count=50):
+	apis = [FluidSynthApi(makeOptions(port=proxy.port), []) for i in range(clients)]
+	def run(api):
+		for i in range(count):
+			api.cmd('get synth.gain')
+	threads = [threading.Thread(target=run, args=(api,)) for api in apis]
+	start = time.time()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = time.time() - start
+	for api in apis:
+		api.close()
+	return elapsed / (clients * count)
+
+
+# a reset sent while another client has 200 slow commands (2 ms) queued
+def timeProxyPanic(proxy):
+	busy = socket.create_connection(('localhost', proxy.port))
+	busy.sendall('inst 1\n' * 200 + 'echo ""\necho done\n')
+	time.sleep(.02)
+	api = FluidSynthApi(makeOptions(port=proxy.port), [])
+	start = time.time()
+	api.panic()
+	api.cmd('echo ""') # the reset has been run once this is answered
+	elapsed = time.time() - start
+	api.close()
+	busy.close()
+	return elapsed
+
+
+def benchProxy():
+	(server, engine) = connectMock(latency={'inst': .002})
+	proxy = FluidSynthProxy(engine, port=0)
+	proxy.start()
+	results = []
+	results.append(('proxy/1-client', timeProxy(proxy, 1, 500), 'per command'))
+	results.append(('proxy/100-clients', timeProxy(proxy, 100), 'per command, all clients'))
+	results.append(('proxy/panic', timeProxyPanic(proxy), 'behind 200 x 2 ms commands'))
+	proxy.close()
+	engine.finish()
+	server.close()
+	return results
+
+
+# import a module in a new python process.
+# the peak rss is VmHWM of that process.  ru_maxrss would carry over the
+# peak of this process (the other benchmarks) across the fork.  without
+# /proc, ru_maxrss is used anyway.
+# returns (seconds, peak rss in KB), or None if the import failed
+def timeImport(module):
+	code = '\n'.join([
+		'import time',
+		'start = time.time()',
+		'import ' + module,
+		'elapsed = time.time() - start',
+		'try:',
+		'	status = open(\'/proc/self/status\').read()',
+		'	rss = int(status.split(\'VmHWM:\')[1].split()[0])',
+		'except Exception:',
+		'	import resource',
+		'	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss',
+		'print(\'%f %d\' % (elapsed, rss))'])
+	folder = os.path.dirname(os.path.abspath(__file__))
+	process = subprocess.Popen([sys.executable, '-c', code], cwd=folder,
+		stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	(out, err) = process.communicate()
+	if process.returncode != 0:
+		return None
+	(elapsed, rss) = out.split()
+	return (float(elapsed), int(rss))
+
+
+def benchImport():
+	results = []
+	for module in ['fluidsynthapi', 'fluidsynthgui']:
+		runs = [timeImport(module) for i in range(5)]
+		if None in runs:
+			print('import/' + module + ': skipped, import failed (is wx installed?)')
+			continue
+		elapsed = min([run[0] for run in runs])
+		rss = min([run[1] for run in runs])
+		results.append(('import/' + module, elapsed, 'peak rss ' + str(rss / 1024) + ' MB'))
+	return results
+
+
+benchmarks = [
+	('read', benchRead),
+	('cmd', benchCmd),
+	('font', benchFont),
+	('unload', benchUnload),
+	('filter', benchFilter),
+	('presets', benchPresets),
+	('trace', benchTrace),
+	('scene', benchScene),
+	('restore', benchRestore),
+	('transport', benchTransport),
+	('settings', benchSettings),
+	('proxy', benchProxy),
+	('import', benchImport),
+]
+
+
+# compare results with a baseline.
+# returns [(name, seconds, baseline seconds, ratio, regression?)]
+def compare(results, baseline, threshold):
+	rows = []
+	for (name, elapsed, note) in results:
+		if name not in baseline:
+			continue
+		base = baseline[name]
+		ratio = elapsed / base if base > 0 else 1.0
+		rows.append((name, elapsed, base, ratio, ratio > 1 + threshold))
+	return rows
+
+
+def printResults(results):
+	print('%-24s %12s   %s' % ('benchmark', 'ms', ''))
+	for (name, elapsed, note) in results:
+		print('%-24s %12.4f   %s' % (name, elapsed * 1000, note))
+	print('')
+
+
+def printComparison(rows, threshold):
+	print('%-24s %12s %12s %8s' % ('benchmark', 'ms', 'baseline', 'ratio'))
+	for (name, elapsed, base, ratio, regression) in rows:
+		flag = '  REGRESSION' if regression else ''
+		print('%-24s %12.4f %12.4f %8.2f%s' % (name, elapsed * 1000, base * 1000, ratio, flag))
+	print('')
+	print('threshold: %.0f%% slower' % (threshold * 100))
+
+
+# results as json.  times are in seconds.
+def toJson(results):
+	return {
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+		'results': dict([(name, elapsed) for (name, elapsed, note) in results]),
+		'notes': dict([(name, note) for (name, elapsed, note) in results]),
+	}
+
+
+# main
+if __name__ == '__main__':
+
+	parser = optparse.OptionParser()
+	parser.add_option('--only', action='store', dest='only',
+		help='comma separated benchmarks to run: ' +
+			','.join([name for (name, fn) in benchmarks]), default='')
+	parser.add_option('--json', action='store', dest='json',
+		help='write results to this json file', default='')
+	parser.add_option('--baseline', action='store', dest='baseline',
+		help='compare results with this json file', default='')
+	parser.add_option('--threshold', action='store', type='float', dest='threshold',
+		help='max slowdown vs baseline before failing (default 0.2 = 20%)', default=0.2)
+	parser.add_option('--legacy', action='store_true', dest='legacy',
+		help='also time the old quadratic reader (up to 1 MB)')
+	options, args = parser.parse_args()
+
+	only = [name for name in options.only.split(',') if name != '']
+	results = []
+	for (name, fn) in benchmarks:
+		if len(only) == 0 or name in only:
+			results.extend(fn())
+	if options.legacy:
+		results.extend(benchRead(legacy=True, maxSize=1024*1024))
+
+	printResults(results)
+
+	if options.json != '':
+		with open(options.json, 'w') as f:
+			json.dump(toJson(results), f, indent=4, sort_keys=True)
+		print('saved: ' + options.json)
+
+	if options.baseline != '':
+		with open(options.baseline) as f:
+			baseline = json.load(f)['results']
+		rows = compare(results, baseline, options.threshold)
+		printComparison(rows, options.threshold)
+		regressions = [row[0] for row in rows if row[4]]
+		if len(regressions) > 0:
+			print('regressions: ' + ', '.join(regressions))
+			sys.exit(1)
+
+# end main
+
@@ -0,0 +1,305 @@
+#!/usr/bin/python
+#
+# Kevin Seifert - GPL 2015
+#
+# Runs the FluidSynth api from the command line, without a display.
+# It uses the same connection, fonts and session code as the gui
+# (fluidsynthapi.py), but never imports wx.
+#
+# Run one command after another:
+#
+#    python fluidsynthcli.py "load 1 /home/Music/sf2/Piano.sf2 000-000" "gain 2.5"
+#
+# Restore the last gui session, then keep running and read more commands
+# from stdin (one per line) until EOF:
+#
+#    python fluidsynthcli.py --daemon restore
+#
+# Commands:
+#
+#    load CHANNEL FILE [INSTRUMENT]  load a font (if not loaded yet), and
+#                                    select an instrument on a channel.
+#                                    INSTRUMENT is a name or a bank-prog
+#                                    like 000-000 (default: the first).
+#                                    fonts not on a channel are unloaded
+#                                    past --font-memory, like in the gui.
+#    instruments FILE                list the instruments of a font (read
+#                                    from the file, the font is not loaded).
+#    fonts                           list the loaded fonts.
+#    gain VALUE                      master gain, 0 to 5.
+#    reverb on|off                   turn the reverb on or off.
+#    chorus on|off                   turn the chorus on or off.
+#    levels                          show the gain, reverb and chorus.
+#    refresh                         read the cached settings again.
+#    restore [DATA_FILE]             restore the levels and channels of a
+#                                    gui session (default: ~/.fluidsynth-gui/data.json)
+#    panic                           all notes off.
+#    stats                           command counts and latency (--stats).
+#
+# Anything else is sent to fluidsynth as is, and the reply is printed.
+#
+# Classes defined below:
+#
+#   FluidSynthCli - runs the commands above on a FluidSynthApi.
+#
+# Note on whitespace:
+#    I'm using tabs for indentation, with my tab width set at 4 spaces.
+
+
+import sys
+import os
+import shlex
+import optparse
+import traceback
+
+from fluidsynthapi import FluidSynthSession
+from fluidsynthapi import SoundFontFile
+from fluidsynthapi import SoundFontCatalog
+from fluidsynthapi import addApiOptions
+from fluidsynthapi import openApi
+
+
+# runs one command line at a time on the api.
+# every command returns True if it worked.
+class FluidSynthCli:
+
+	# the gui's catalog of presets, shared with the gui
+	catalogFile = os.path.expanduser('~') + '/.fluidsynth-gui/catalog.db'
+
+	def __init__(self, api, out=None, catalog=None):
+		self.api = api                 # FluidSynthApi or FluidSynthPool.
+		self.out = out                 # where results are written (default stdout).
+		self.catalog = catalog         # SoundFontCatalog (None = read the files).
+		if self.out == None:
+			self.out = sys.stdout
+
+
+	# run one command line, for example: load 1 "/home/Music/sf2/Brass 4.SF2"
+	def run(self, line):
+		try:
+			args = shlex.split(line)
+		except ValueError as e:
+			print('error: ' + str(e))
+			return False
+		if len(args) == 0:
+			return True
+
+		handler = getattr(self, 'cmd_' + args[0], None)
+		try:
+			if handler == None:
+				return self.passThrough(line)
+			return handler(*args[1:])
+		except TypeError as e:
+			print('error: wrong arguments for ' + args[0])
+			print(e)
+		except Exception as e:
+			print('error: ' + args[0] + ' failed')
+			print(e)
+			traceback.print_exc()
+		return False
+
+
+	def write(self, text):
+		self.out.write(text + '\n')
+		self.out.flush()
+
+
+	# like picking a font in the gui: initSoundFont selects the first
+	# preset, and unloads fonts past the --font-memory budget
+	def cmd_load(self, channel, font, *words):
+		api = self.api
+		instrument = ' '.join(words) # names may have spaces
+		api.setSelectedChannel(int(channel))
+		(id, voices) = api.initSoundFont(font, None, self.readInstruments(font))
+		if id < 0:
+			print('error: could not load font: ' + font)
+			return False
+
+		voice = self.findInstrument(voices, instrument)
+		if voice == None:
+			print('error: no instrument "' + instrument + '" in ' + font)
+			return False
+
+		if voice != voices[0]:
+			api.setInstrument(voice)
+		self.write('channel ' + str(channel) + ': ' + font + ' ' + voice)
+		return True
+
+
+	# presets of a .sf2 file, without loading it in fluidsynth
+	# returns [] if the file could not be read
+	def readInstruments(self, path):
+		try:
+			if self.catalog != None:
+				return self.catalog.getInstruments(path)
+			return SoundFontFile(path).getInstruments()
+		except Exception as e:
+			print('info: could not read presets: ' + path)
+			print(e)
+		return []
+
+
+	# instrument by name or bank-prog (case insensitive), the first if
+	# the name is blank.  returns None if not found
+	def findInstrument(self, voices, name):
+		if len(voices) == 0:
+			return None
+		if name == '':
+			return voices[0]
+		name = name.lower()
+		for voice in voices:
+			if voice.lower().startswith(name):
+				return voice
+		for voice in voices:
+			if name in voice.lower():
+				return voice
+		return None
+
+
+	def cmd_instruments(self, font):
+		voices = self.readInstruments(font)
+		if len(voices) == 0:
+			print('error: no presets read from: ' + font)
+			return False
+		for voice in voices:
+			self.write(voice)
+		return True
+
+
+	def cmd_fonts(self):
+		fonts = self.api.syncSoundFonts()
+		for id in sorted(fonts.keys()):
+			self.write(str(id) + '  ' + fonts[id])
+		return True
+
+
+	def cmd_gain(self, value):
+		self.api.setGain(float(value))
+		return True
+
+
+	def cmd_reverb(self, value):
+		self.api.setReverb(self.isOn(value))
+		return True
+
+
+	def cmd_chorus(self, value):
+		self.api.setChorus(self.isOn(value))
+		return True
+
+
+	def cmd_levels(self):
+		levels = self.api.getLevels()
+		self.write('gain: ' + str(levels['gain']))
+		self.write('reverb: ' + ('on' if levels['reverb'] else 'off'))
+		self.write('chorus: ' + ('on' if levels['chorus'] else 'off'))
+		return True
+
+
+	# read the settings from fluidsynth again (another program may have
+	# changed them)
+	def cmd_refresh(self):
+		self.api.refreshSettings()
+		return True
+
+
+	def isOn(self, value):
+		return value.lower() in ['1', 'on', 'yes', 'true']
+
+
+	def cmd_restore(self, dataFile=None):
+		session = FluidSynthSession()
+		session.load(dataFile)
+		session.applyLevels(self.api)
+		(plan, activeChannel) = session.getPlan()
+
+		def onLoad(count, total, font):
+			self.write('loaded ' + str(count) + ' of ' + str(total) + ': ' + font)
+
+		count = self.api.restoreChannels(plan, activeChannel, onLoad)
+		self.write('restored ' + str(count) + ' of ' + str(len(plan)) + ' channels')
+		return count == len(plan)
+
+
+	def cmd_panic(self):
+		self.api.panic()
+		return True
+
+
+	def cmd_stats(self):
+		if self.api.stats == None:
+			print('error: stats are off, use --stats')
+			return False
+		self.write(self.api.stats.getText())
+		self.write(self.api.settings.getSummary())
+		return True
+
+
+	# a plain fluidsynth command
+	def passThrough(self, line):
+		data = self.api.cmd(line)
+		if data.strip() != '':
+			self.write(data.rstrip('\n'))
+		return True
+
+
+	# did this program start fluidsynth (instead of finding one running)?
+	def isFluidSynthOwner(self):
+		engines = getattr(self.api, 'engines', [self.api])
+		for engine in engines:
+			if engine.fluidsynth != None:
+				return True
+		return False
+
+
+# end class
+
+
+# main
+if __name__ == '__main__':
+
+	parser = optparse.OptionParser(usage='%prog [options] [command ...]')
+	parser.add_option('--daemon', action='store_true', dest='daemon',
+		help='after the commands, read more commands from stdin until EOF. a fluidsynth started by this program runs until then')
+	addApiOptions(parser)
+	options, args = parser.parse_args()
+
+	# args are commands of this program, not of fluidsynth
+	api = openApi(options, [])
+	if not api.connected:
+		sys.exit(2)
+	api.syncSoundFonts() # fonts loaded by an earlier run are reused
+
+	catalog = None
+	try:
+		catalog = SoundFontCatalog(FluidSynthCli.catalogFile)
+	except Exception as e:
+		print('info: no sound font catalog, presets are read from the files')
+		print(e)
+
+	cli = FluidSynthCli(api, None, catalog)
+	ok = True
+	for line in args:
+		ok = cli.run(line) and ok
+
+	if options.daemon:
+		try:
+			for line in iter(sys.stdin.readline, ''):
+				ok = cli.run(line) and ok
+		except KeyboardInterrupt:
+			pass
+	elif cli.isFluidSynthOwner():
+		print('note: fluidsynth was started by this command, and stops with it.  use --daemon to keep it running.')
+
+	if options.stats:
+		print(api.stats.getText())
+		print(api.settings.getSummary())
+	if catalog != None:
+		catalog.close()
+	if cli.isFluidSynthOwner():
+		api.closeFluidSynth()
+	else:
+		api.close()
+	sys.exit(0 if ok else 1)
+
+# end main
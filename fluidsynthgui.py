@@ -8,10 +8,9 @@
 # 
 # See README.txt for more details.
 # 
-# Classes defined below:
+# The api (sockets, fonts, catalog, search) is in fluidsynthapi.py.
 # 
-#   FluidSynthApi - this is the core api that interfaces with fluidsynth
-#                   using the socket api.
+# Classes defined below:
 # 
 #   FluidSynthGui - the graphical interface wraps the api and saves the state
 #                   of the application on shutdown.
@@ -23,655 +22,22 @@
 import sys 
 import os 
 import wx
-import re
 import time
-import socket
-import subprocess
 import traceback
 import optparse
-import signal
 import json
+import threading
 
-
-# API
-# this is the api that writes data to and read data from the command line interface.
-# this communicates with fluidsynth over the socket 9800.
-class FluidSynthApi:
-
-	def __init__(self,options,args):
-
-		print('init FluidSynth api...')
-
-		# cli
-		self.options = options         # key/value pairs.
-		self.args = args               # bare args.
-
-		# memory/font management
-		# note: we will only load at most 16 fonts on the 16 channels. 
-		#       all other fonts will be unloaded from memory.
-		self.fontFilesLoaded={}        # font_id: font_file.
-		self.fontsInUse=[-1] * 16      # font_id. position is channel.
-		self.instrumentsInUse=['']*16  # instrument_name. position is channel.
-		self.selectedChannel = 1       # 1-based. all new instruments load here.
-		self.activeChannel = 1         # 1-based. last used channel.
-		self.activeSoundFontId = -1    # last font loaded.
-		self.activeSoundFontFile = ''  # last SoundFont loaded.
-		self.activeInstrument = ''     # last instrument loaded.
-
-		# socket io settings
-		self.host='localhost'          # fluidsynth hostname.
-		self.port=9800                 # fluidsynth socket port.
-		self.buffersize=4096           # buffer size for socket.
-		self.readtimeout=8             # read timeout in seconds (blocking IO only).
-		self.fluidsynth = None         # the fluidsynth system process.
-		self.eof = '.'                 # arbitrary text to mark the end of stream.
-		self.debug = True              # enable verbose logging to stdout.
-
-		# see `man fluidsynth` for explanation of cli options
-		#
-		# -C, --chorus
-		#    Turn the chorus on or off [0|1|yes|no, default = on]
-		# -i, --no-shell
-		#    Don't read commands from the shell [default = yes]
-		# -g, --gain
-		#    Set the master gain [0 < gain < 10, default = 0.2]
-		# -j, --connect-jack-outputs
-		#    Attempt to connect the jack outputs to the physical ports
-		# -p, --portname=[label]
-		#    Set MIDI port name (alsa_seq, coremidi drivers)
-		# -s, --server
-		#    Start FluidSynth as a server process
-		# -R, --reverb
-		#    Turn the reverb on or off [0|1|yes|no, default = on]
-		self.fluidsynthCmd = 'fluidsynth -sli -g 5 -C 0 -R 0 -p FluidSynth-GUI'
-
-
-		# cli option overrides
-		if ( options.fluidsynthCmd != '' ):
-			self.fluidsynthCmd = options.fluidsynthCmd
-
-		# set up/test server
-		self.initFluidSynth()
-
-		# process command line args passed to fluid synth
-		if len(self.args) > 0:
-			for arg in args:
-				self.cmd(arg,True)
-
-
-	def __del__(self):
-		self.closeFluidSynth()
-
-
-	#######################################################################
-	# socket api
-	#######################################################################
-
-	# test/initialize connection to fluidsynth
-	def initFluidSynth(self):
-		try:
-			self.connect()
-			# looks good
-			return True
-
-		except Exception as e:
-			print('error: FluidSynth not running?')
-			print('could not connect to socket: ' + str(self.port))
-			print(e)
-
-		try:
-			# try starting fluidsynth command line process
-			print('trying to start fluidsynth ...')
-			print(self.fluidsynthCmd)
-			cmd = self.fluidsynthCmd.split()
-			self.fluidsynth = subprocess.Popen(cmd, shell=False, 
-				stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-
-			# process should be started, try connection again
-			for i in range(10):	
-				try:
-					self.connect()
-					return True
-
-				except Exception as e:
-					print(e)
-					print('retry ...')
-					time.sleep(.5)
-
-		except Exception as e:
-			print('error: fluidsynth could not start')
-			print(e)
-
-		print('error: giving up. :(')
-		print('you may try stopping any fluidsynth that is currently running.')
-		print('for example, on linux:')
-		print('    killall fluidsynth')
-		print('    killall -s 9 fluidsynth')
-		return False
-
-
-	# cleanup
-	def closeFluidSynth(self):
-		self.close()
-		try:
-			self.fluidsynth.kill()
-		except:
-			print('fluidsynth will be left running')
-
-
-	# create socket connection.
-	# NOTE: do NOT connect on every request (like HTTP).
-	# fluidsynth seems to only be able to spawn a small number of total sockets.
-	# reuse the same socket connection for all io, or you will run out of 
-	# fluidsynth threads.
-	def connect(self):
-		self.clientsocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self.clientsocket.connect((self.host,self.port))
-		self.clientsocket.settimeout(self.readtimeout)
-		print('connected to port: ' + str(self.port))
-
-
-	# cleanup sockets when finished
-	def close(self):
-		self.clientsocket.shutdown(socket.SHUT_RDWR)
-		self.clientsocket.close()
-		print('closed')
-
-
-	# send data to fluidsynth socket
-	def send(self, packet):
-		if self.debug:
-			print('send: '+ packet)
-		self.clientsocket.send(packet)
-
-
-	# read data from fluidsynth socket
-	# these packets will be small
-	def read(self):
-		data = ''
-		# inject EOF marker into output
-		# add blank line and eof marker, to tag the end of the stream
-		self.send('echo ""\n')
-		self.send('echo ' + self.eof + '\n')
-		try:
-			i=0
-			max_reads = 1000000 # avoid infinite loop
-			part = ''
-			while i<max_reads: 
-				i+=1
-				part = self.clientsocket.recv(self.buffersize)
-				data += part
-				#print 'chunk: ' + part
-				# test data for boundary hit
-				# NOTE: part may only contain fragment of eof 
-				for eol in [ '\n' ]:
-					eof = eol + self.eof + eol 
-					pos = data.find(eof)
-					if pos > -1: 
-						# found end of stream
-						# chop eof marker off
-						data = data[0:pos]
-						if self.debug:
-							print('data: ' + data + '\n--\n')
-						return data
-
-		except Exception as e:
-			print('warn: eof not found in stream: "'+self.eof+'"') 
-			print(e)
-
-		if self.debug:
-			print('data (timeout): ' + data + '\n--\n')
-		return data
-
-
-	# send command to fluidsynth, read response.
-	# NOTE: non-blocking mode is MUCH faster.  
-	# always use non-blocking unless you actually need to read the response.
-	#   returns: data packet (if blocking mode)
-	#   returns: True (if non-blocking mode)
-	# the end of line '\n' char is not required.
-	def cmd(self, packet, non_blocking = False):
-		data = ''
-		self.send(packet+'\n')
-
-		#if non_blocking and not self.debug: #to disable nonblocking for debug  
-		if non_blocking:
-			return True
-
-		data = self.read()
-		return data
-
-
-	## DEPRECATED - this works and is left in as fallback option.
-	## Instead of connecting with a socket, you can also connect to the cli directly.
-	## This is a very basic version of 'Expect'.
-	## the function will read all output and stop at the next '>' prompt.
-	## NOTE: non_blocking IO was not implemented.
-	##
-	## Python bug?!  Popen readlines() does not return data.
-	## And, Python doesn't support multiple Popen communicate() calls.
-	## There seems to be a race condition with pipes. 
-	## Overall, IMO subprocess is difficult to work with.
-	## Workaround: poll input with '\n' write to prevent IO blocking 
-	## on each single readline().  Then, drain the padded output after 
-	## the total size of the text response is known.
-	##
-	#def cmd(self, cmd):
-	#	readtil = '>'
-	#	p=self.fluidsynth
-	#	lines=''
-	#	p.stdin.write(cmd + '\n' )
-	#	count=0 # track \n padding
-	#	while True:
-	#		count += 1
-	#		p.stdin.write('\n')
-	#		line = p.stdout.readline()
-	#		line = line.strip();
-	#		if line == readtil:
-	#			if lines != '':
-	#				# drain \n padding 
-	#				for num in range(count):
-	#					p.stdout.readline()
-	#				if self.debug:
-	#					print lines	
-	#				return lines
-	#		else:
-	#			lines = lines + '\n' + line
-
-
-	#######################################################################
-	# get/set fluidsynth variable
-	#######################################################################
-
-	# set fluidsynth variable
-	def setValue(self,key,value):
-		value = self.cmd('set ' + key + ' ' + value, True)
-
-
-	# get fluidsynth variable
-	def getValue(self,key):
-		value = self.cmd('get ' + key)
-		values = value.split() 
-		if len(values):
-			return values[-1]
-		else:
-			return '' 
-
-
-	# parse string variable as boolean 
-	def isTruthy(self,value):
-		value = value.lower()
-		if value in ['true','1','on','yes']:
-			return True
-		return False
-
-
-	# get fluidsynth variable as boolean 
-	def getBoolValue(self,key):
-		value = self.getValue(key)
-		return self.isTruthy(value)
-
-
-	# get fluidsynth variable as number 
-	def getNumValue(self,key):
-		value = self.getValue(key)
-		value = float(value)
-		return value 
-
-
-	# get fluidsynth variable as integer
-	def getIntValue(self,key):
-		value = self.getValue(key)
-		value = int(value)
-		return value 
-
-
-	#######################################################################
-	# get/set channel, font, instrument
-	#######################################################################
-
-	# set selected channel (index is 1-based) 
-	def setSelectedChannel(self,channel):
-		self.selectedChannel = int(channel)
-
-
-	# get selected channel (where index is 1-based) 
-	def getSelectedChannel(self):
-		return self.selectedChannel
-
-
-	# get selected channel (where index is 0-based) 
-	def getSelectedChannel0(self):
-		return self.selectedChannel-1
-
-
-	# return last known font and instrument on a channel
-	# note: channel is 1-based
-	# return: (font_file, instrument_name)
-	def getFontInstrumentFromChannel(self,channel):
-
-		try:
-			chan0 = channel-1 # to 0 based
-			font_id = self.fontsInUse[chan0] 
-			font = self.fontFilesLoaded[font_id]
-			instrument = self.instrumentsInUse[chan0]
-			return (font, instrument)
-		except Exception as e:
-			print('error: could not find font, instrument on channel '+str(channel))
-			print(e)
-
-		return ('','')
-
-
-	# lookup fluidsynth's font id from a path (if loaded)
-	# returns int
-	def getSoundFontIdFromPath(self, path):
-		for key, value in self.fontFilesLoaded.iteritems():
-			if value == path:
-				return int(key)
-		return -1
-
-
-	# load sound soundfont, for example:
-	#
-	# > load "/home/Music/sf2/Brass 4.SF2"
-	# loaded SoundFont has ID 1
-	# fluidsynth: warning: No preset found on channel 9 [bank=128 prog=0]
-	# > 
-	def loadSoundFont(self, sf2Filename):
-		try:
-			# try cache
-			id = self.getSoundFontIdFromPath(sf2Filename)
-
-			if id < 0:
-				# cache miss	
-				data = self.cmd('load "'+ sf2Filename +'"')
-
-				# parse sound font id
-				ids = [int(s) for s in data.split() if s.isdigit()]	
-				if len(ids) > 0:
-					id = ids[-1] # return last item
-					id = int(id)
-
-			self.fontFilesLoaded[id] = sf2Filename # store mapping id->file
-			self.activeSoundFontId = id
-			self.activeSoundFontFile = sf2Filename
-			return id
-
-		except Exception as e:
-			print('error: could not load font: ' + sf2Filename)
-			print(e)	
-
-		return -1
-
-
-	# return soundfonts loaded in memory, for example:
-	#
-	# > fonts
-	# ID  Name
-	#  1  /home/Music/sf2/Brass 4.SF2
-	# > 
-	def getSoundFonts(self):
-		try:
-			data = self.cmd('fonts')
-			ids=data.splitlines()
-					
-			#ids = ids[3:] # cli only: discard first 3 items (header)
-			ids_clean = []
-			for id in ids:
-				# example:
-				# '1 /home/user/sf2/Choir__Aahs_736KB.sf2'
-				parts = id.split()
-
-				try:
-					if parts[0] != 'ID':
-						id2=int(parts[0])
-						ids_clean.append(id2)
-
-				except Exception as e:
-					print('warn: skipping font parse:')
-					print(parts)
-					print(e) 
-
-			return ids_clean
-
-		except Exception as e:
-			print('error: no fonts parsed')
-			print(e)
-
-		return []
-
- 
-	# remove unused soundfonts from memory, for example:
-	#
-	# > unload 1
-	# fluidsynth: warning: No preset found on channel 0 [bank=0 prog=0]
-	# > 
-	def unloadSoundFonts(self):
-		try:
-			ids = self.getSoundFonts()
-			## debug memory management
-			#if self.debug:
-			#	print('Fonts in use:')
-			#	print(self.fontsInUse)
-			#	print('All Fonts in memory:')
-			#	print(ids)
-
-			## unload any soundfont that is not referenced
-			for id in ids:
-				sid=str(id)
-				if id in self.fontsInUse:
-					#print 'font in use: ' + sid
-					pass
-				else:
-					self.cmd('unload '+ sid, True)
-					del self.fontFilesLoaded[id]
-
-		except Exception as e:
-			print('error: could not unload fonts')
-			print(e)
-
-
-	# list instruments in soundfont, for example:
-	# 
-	# > inst 1
-	# 000-000 Dark Violins  
-	# > 
-	def getInstruments(self,fontId):
-
-		fontId = int(fontId)
-
-		if fontId < 0:
-			return []
-
-		try:
-			data = self.cmd('inst ' + str(fontId))
-			ids = data.splitlines()
-			#ids = map(lambda s: s.strip(' '), ids)
-			#ids = ids[2:] # cli only: discard first two items (header)
-			return ids
-
-		except Exception as e:
-			print('error: could not get instruments')
-			print(e)
-
-		return []
-
-
-	# change voice in soundfont
-	#
-	# arg formats:
-	#	000-000 Some Voice
-	#	000-000
-	#
-	# note: 'prog bank prog' doesn't always seem to work as expected
-	# using 'select' instead
-	#
-	# for example:
-	#
-	#    select chan sfont bank prog
-	#> 
-	def setInstrument(self,instrumentName):
-
-		if instrumentName == '':
-			raise Exception('instrument name cannot be blank')
-
-		if self.activeSoundFontId < 0:
-			return ''
-
-		try:
-			parts = instrumentName.split()
-			ids = parts[0].split('-')			
-			chan0 = str(self.getSelectedChannel0()) # convert base 0
-			font = str(self.activeSoundFontId)
-			bank = ids[0]
-			prog = ids[1]
-			cmd = 'select '+chan0+' '+font+' '+bank+' '+prog
-			data = self.cmd(cmd, True)
-
-			self.activeInstrument = instrumentName
-			self.fontsInUse[int(chan0)] = int(font)
-			self.instrumentsInUse[int(chan0)] = instrumentName 
-			self.activeChannel = self.getSelectedChannel()
-
-			return data
-
-		except Exception as e:
-			print('error: could not select instrument: '+instrumentName)
-			print(e)
-
-		return False 
-
-
-	# load soundfont, select first program voice
-	# returns (id,array_of_voices)
-	def initSoundFont(self,sf2):
-		try:
-			self.unloadSoundFonts()
-			id = self.loadSoundFont(sf2)
-			if id > -1:
-				voices = self.getInstruments(id)
-				self.setInstrument(voices[0])
-				return (id,voices)
-
-		except Exception as e:
-			print('error: font and instrument did not load: '+sf2)
-			print(e)
-
-		return (-1,[])
-
-
-	#######################################################################
-	# levels api
-	#######################################################################
-
-	#    gain value                Set the master gain (0 < gain < 5)
-	#    get synth.gain            10
-	# set gain, where value is between [0,5]
-	def setGain(self,value):
-		self.cmd('gain ' + str(value),True) # [0,5]
-		self.setValue('synth.gain',str(float(value)*2)) # [0,10]
-
-
-	# get gain, where value is between [0,5]
-	def getGain(self):
-		self.getNumValue('synth.gain') / 2
-
-
-	# turn reverb on/off
-	#    reverb [0|1|on|off]        Turn the reverb on or off
-	def setReverb(self,boolean):
-		self.cmd('reverb ' + str(int(boolean)),True)
-		# ? not auto updated
-		self.setValue('synth.reverb.active', str(int(boolean))) 
-
-
-	# returns True if reverb is on
-	def getReverb(self):
-		value = self.getBoolValue('synth.reverb.active')
-		return value 
-
-
-	# update reverb settings. num is between [0,1]
-	#    rev_setroomsize num        Change reverb room size. 0 - 1.0
-	def setReverbRoomSize(self,num):
-		self.cmd('rev_setroomsize ' + str(num), True)
-
-
-	# update reverb settings. num is between [0,1]
-	#    rev_setdamp num            Change reverb damping. 0 - 1.0
-	def setReverbDamp(self,num):
-		self.cmd('rev_setdamp ' + str(num), True)
-
-
-	# update reverb settings. num is between [0,1]
-	#    rev_setwidth num           Change reverb width. 0 - 1.0
-	def setReverbWidth(self,num):
-		self.cmd('rev_setwidth ' + str(num), True)
-
-
-	# update reverb settings. num is between [0,1]
-	#    rev_setlevel num           Change reverb level. 0 - 1.0
-	def setReverbLevel(self,num):
-		self.cmd('rev_setlevel ' + str(num), True)
-
-
-	# note: no getters for reverb details	
-
-	# chorus api
-
-	# turn chorus on/off
-	# arg: True/False
-	#    chorus [0|1|on|off]        Turn the chorus on or off
-	#	 set synth.chorus.active 1|0
-	def setChorus(self,boolean):
-		self.cmd('chorus ' + str(int(boolean)),True)
-		# ? not auto updated
-		self.setValue('synth.chorus.active', str(int(boolean))) 
-
-
-	# return True if chorus is on.
-	def getChorus(self):
-		value = self.getBoolValue('synth.chorus.active')
-		return value 
-
-
-	# update chorus setting
-	#   cho_set_nr n               Use n delay lines (default 3). 0 - 99
-	def setChorusNR(self,num):
-		self.cmd('cho_set_nr ' + str(num), True)
-
-
-	# update chorus setting
-	#   cho_set_level num          Set output level of each chorus line. 0 - 1.0
-	def setChorusLevel(self,num):
-		self.cmd('cho_set_level ' + str(num), True)
-
-
-	# update chorus setting
-	#   cho_set_speed num          Set mod speed of chorus (Hz). 0.3 - 5.0
-	def setChorusSpeed(self,num):
-		self.cmd('cho_set_speed ' + str(num), True)
-
-
-	# update chorus setting
-	#    cho_set_depth num         Set chorus modulation depth (ms). 0 - 46
-	def setChorusDepth(self,num):
-		self.cmd('cho_set_depth ' + str(num), True)
-
-
-	# note: no getters for chorus details	
-
-	#######################################################################
-	# reset
-	#######################################################################
-
-	# reset controller (all notes off)
-	def panic(self):
-		self.cmd('reset', True)
-
-
-# end class
+from fluidsynthapi import AsyncFluidSynthApi
+from fluidsynthapi import FluidSynthThrottle
+from fluidsynthapi import FluidSynthSession
+from fluidsynthapi import SoundFontFile
+from fluidsynthapi import SoundFontCatalog
+from fluidsynthapi import SoundFontScanner
+from fluidsynthapi import TrigramIndex
+from fluidsynthapi import PresetIndex
+from fluidsynthapi import addApiOptions
+from fluidsynthapi import openApi
 
 
 # GUI
@@ -696,8 +62,14 @@ class FluidSynthGui(wx.Frame):
 		super(FluidSynthGui, self).__init__(parent, title=title, size=(800, 420))
 
 		self.fluidsynth = api    # the fluidsynth socket api 
+		self.fluidsynthAsync = AsyncFluidSynthApi(api) # same api, off the gui thread
+		self.levels = FluidSynthThrottle(api.options.maxRate, # rate limit for sliders
+			lambda seconds, fn: wx.CallLater(int(seconds * 1000) + 1, fn))
 
 		self.soundFontsAll = []  # all files in dir.  only filenames, not full paths.
+		self.soundFontDirs = set() # names in soundFontsAll that are dirs.
+		self.soundFontIndex = TrigramIndex([]) # search index for soundFontsAll.
+		self.soundFontFilter = None # search filter of the current listing.
 		self.soundFonts = []     # filtered version of soundFontsAll
 		self.instrumentsAll = [] # everything in current SoundFont.
 		self.instruments = []    # filtered version of instrumentsAll.
@@ -706,11 +78,39 @@ class FluidSynthGui(wx.Frame):
 		self.regex = False       # use regular expressions in search filter? 
 		self.lastSelectedPath='' # to preserve selected dir/font when possible.
 		self.parentDir = '..'    # text for option to navigate up one dir.
+		self.soundFontGeneration = 0 # incremented on every font request.
+		self.loadingText = 'loading...' # shown while a font loads.
+		self.loadingInstrument = None # instrument to select when font is loaded.
+		self.unloadedSoundFont = '' # listed, but not loaded yet (lazy load).
+		self.lazyLoad = False    # only load fonts when a preset is picked?
+		self.library = ''        # root dir of the sound font library (optional).
+		self.libraryScanner = None # SoundFontScanner.
+		self.lastProgress = 0    # time of the last scan progress update.
+		self.presetIndex = None  # PresetIndex over the catalog.
+		self.presetResults = []  # (path, bank, prog, name) shown in preset search.
+		self.presetLimit = 500   # max preset search results shown.
+		self.presetPattern = None # preset search of the results shown.
+		self.presetDelay = 150   # ms typing must pause before a preset search.
+		self.presetGeneration = 0 # incremented on every preset search key.
+		self.prefetchDepth = 0   # fonts to prefetch on each side of the selection.
+		self.prefetchDelay = 300 # ms the selection must settle before prefetch.
+		self.prefetches = []     # futures of queued prefetches.
+		self.prefetchIdx = -1    # list position of the last font loaded.
+		self.prefetchDirection = 1 # 1 = moving down the list, -1 = up.
+		self.starting = True     # until connected and the last session is restored.
+		self.restoreCancelled = False # cancel pressed while restoring.
+		self.restoreGeneration = 0 # soundFontGeneration when the restore started.
+		self.engineLoadInterval = 2000 # ms between engine load updates (--engines).
 	
 		# persistent data
 		self.data = {}           # anything in this dict will be persisitent
 		self.dataDir = os.path.expanduser('~') + '/.fluidsynth-gui' # prefs dir
 		self.dataFile = self.dataDir + '/data.json' # save gui state to this file
+		self.catalogFile = self.dataDir + '/catalog.db' # presets of all fonts seen
+		self.catalog = None      # SoundFontCatalog
+		self.catalogThreads = [] # threads using the catalog, joined on close.
+		self.catalogLock = threading.Lock() # for catalogThreads.
+		self.closing = False     # tells the catalog threads to stop.
 
 		# what components will be persistent?
 		# anything in this list will be automatically serialized
@@ -748,16 +148,45 @@ class FluidSynthGui(wx.Frame):
 
 
 		# init
+		self.initCatalog()             # open the sound font catalog.
 		self.initUI()                  # create widgets.
 		self.bindEvents()              # bind ui widgets to callback event handlers.
 		self.loadDataFile()            # load last state of GUI from file.
 		self.applyPreferenceSnapshot() # restore last state of GUI.
 		self.processCliArgs()          # cli overrides saved state.
+		self.scanLibrary()             # index the library in the background.
+		self.indexPresets()            # index all preset names in the background.
 
 		# show
 		self.Centre()
 		self.Show() 
 
+		# connect, then restore the last session
+		self.startEngine()
+		if self.fluidsynth.options.engines > 1:
+			self.updateEngineLoad()
+
+
+	#######################################################################
+	# threads ...
+	#######################################################################
+
+	# call fn(result) on the gui thread when the future is done.
+	# cancelled or failed calls are ignored.
+	# this is the bridge between AsyncFluidSynthApi and wx.
+	def callAfter(self, future, fn):
+		def done(future):
+			if future.cancelled():
+				return
+			try:
+				value = future.result()
+			except Exception as e:
+				print('error: background call failed')
+				print(e)
+				return
+			wx.CallAfter(fn, value)
+		future.addDoneCallback(done)
+
 
 	#######################################################################
 	# persistence/data utilities ...
@@ -773,6 +202,137 @@ class FluidSynthGui(wx.Frame):
 			self.refreshSoundFontList(resetInstruments=True)
 
 		self.regex = options.regex
+		self.lazyLoad = options.lazyLoad
+		self.library = options.library
+		self.prefetchDepth = options.prefetch
+
+
+	# open the sound font catalog
+	def initCatalog(self):
+		try:
+			self.catalog = SoundFontCatalog(self.catalogFile)
+		except Exception as e:
+			print('error: no sound font catalog: ' + self.catalogFile)
+			print(e)
+
+
+	# update catalog entries of a dir in the background.
+	# only files that changed since the last visit are read.
+	def refreshCatalog(self, dir, names):
+		if self.catalog == None:
+			return
+		self.startCatalogThread(self.catalog.refreshDir, dir, names,
+			lambda: self.closing)
+
+
+	# run fn(*args) on a daemon thread that uses the catalog.
+	# onClose waits for these before it closes the catalog.
+	def startCatalogThread(self, fn, *args):
+		thread = threading.Thread(target=fn, args=args)
+		thread.daemon = True
+		with self.catalogLock:
+			self.catalogThreads = [t for t in self.catalogThreads if t.is_alive()]
+			self.catalogThreads.append(thread)
+		thread.start()
+
+
+	# stop the library scan and the catalog threads, and wait for them
+	# (up to timeout seconds), so the catalog is not closed under them.
+	def stopCatalogThreads(self, timeout=2):
+		end = time.time() + timeout
+		self.closing = True
+		if self.libraryScanner != None:
+			self.libraryScanner.cancel()
+			self.libraryScanner.join(timeout)
+		with self.catalogLock:
+			threads = list(self.catalogThreads)
+		for thread in threads:
+			thread.join(max(0, end - time.time()))
+
+
+	# walk the whole library in the background (see --library).
+	# every sound font found is added to the catalog.
+	def scanLibrary(self):
+		if self.library == '':
+			return
+		if self.libraryScanner != None:
+			self.libraryScanner.cancel()
+
+		print('scan library: ' + self.library)
+		self.libraryScanner = SoundFontScanner(os.path.realpath(self.library),
+			onEntries=self.onScanEntries, onProgress=self.onScanProgress, 
+			onDone=self.onScanDone)
+		self.libraryScanner.start()
+
+
+	# scanner found entries in a dir (called on scanner thread).
+	# the fonts go in the catalog, and the preset search sees them once the
+	# scan is done (see onScanDone).  each dir is committed on its own, so
+	# the database is not locked for the whole scan (fluidsynthcli.py uses
+	# it too).
+	def onScanEntries(self, dir, entries):
+		if self.catalog == None:
+			return
+		found = False
+		for entry in entries:
+			if self.closing:
+				break
+			if not entry[2]:
+				continue
+			path = os.path.join(dir, entry[0])
+			self.catalog.lookup(path, commit=False)
+			found = True
+		if found:
+			self.catalog.commit()
+
+
+	# scan progress (called on scanner thread)
+	def onScanProgress(self, dirs, files, soundFonts):
+		now = time.time()
+		if now - self.lastProgress < .2:
+			return # limit redraws
+		self.lastProgress = now
+		text = 'scanning library: %d dirs, %d files, %d fonts' % (dirs, files, soundFonts)
+		wx.CallAfter(self.SetStatusText, text)
+
+
+	# scan finished (called on scanner thread)
+	def onScanDone(self, cancelled):
+		if cancelled:
+			return
+		if self.catalog != None:
+			self.catalog.commit()
+		self.indexPresets()
+		scanner = self.libraryScanner
+		text = 'library: %d dirs, %d files, %d fonts' % (scanner.dirs, scanner.files, scanner.soundFonts)
+		print(text)
+		wx.CallAfter(self.SetStatusText, text)
+
+
+	# rebuild the preset search index from the catalog, in the background.
+	def indexPresets(self):
+		if self.catalog == None:
+			return
+
+		def run():
+			try:
+				instruments = self.catalog.getAllInstruments()
+				if self.closing:
+					return
+				index = PresetIndex(instruments)
+				print('indexed ' + str(index.count) + ' presets')
+				wx.CallAfter(self.onIndexPresets, index)
+			except Exception as e:
+				print('error: could not index presets')
+				print(e)
+
+		self.startCatalogThread(run)
+
+
+	# preset index is ready (called on gui thread)
+	def onIndexPresets(self, index):
+		self.presetIndex = index
+		self.searchPresets()
 
 
 	# get persistent data
@@ -875,78 +435,156 @@ class FluidSynthGui(wx.Frame):
 					else:
 						print('error: ' + prop + 'does not have SetValue()')
 
-			# trigger change on all level controls to sync api
-			self.onScrollGain()
-			self.onClickEnableReverb()
-			self.onClickEnableChorus()
-
-			# restore core api properties manually...
-
 			# restore last dir, will restore filtered view
 			path = self.getData('textSoundFontDir')			
 			print('restore dir path: ' + path)
 			self.changeDir(path,giveFocus=True)
 
-			# restore last fonts in memory
-			# note: font ids will change on reloading
-			fontsInUse = self.getData('fontsInUse')	 # overall map 
-			fontFilesLoaded = self.getData('fontFilesLoaded')			
-			instrumentsInUse = self.getData('instrumentsInUse')	
-			selectedChannel = self.getData('selectedChannel') # base 1
-			activeChannel = self.getData('activeChannel') # base 1
-			activeSoundFontFile = self.getData('activeSoundFontFile')
-			activeInstrument = self.getData('activeInstrument')
-
-			# restore inactive fonts 
-			print('restore inactive fonts...')
-			for idx, oldFontId in enumerate(fontsInUse):
-
-				if oldFontId == -1: # not in use
-					continue
+			# fonts and levels are restored once fluidsynth is connected,
+			# see restoreSession
 
-				channel = idx+1 # 1-based
-				font = fontFilesLoaded[str(oldFontId)]
-				instrument = instrumentsInUse[idx]
+		except Exception as e:
+			print('error: could not restore snapshot of preferences')
+			print(e)
+			traceback.print_exc()
 
-				print('found ')
-				print('	channel: ' + str(channel))
-				print('	font: ' + font)
-				print('	instrument: ' + instrument)
-				print('--')
 
-				if font == '':
-					print('error: missing font data')
-					continue
+	# restore the fonts and instruments of the last session in fluidsynth.
+	# all channels are restored in the background (see 
+	# FluidSynthApi.restoreChannels), then the primary font is set the same
+	# way as picking it from the list.  it is resident by then, so this only
+	# costs a select.
+	def restoreSession(self):
+		try:
+			# find fonts in use (see FluidSynthSession)
+			(plan, activeChannel) = FluidSynthSession(self.data).getPlan()
 
-				if instrument == '':
-					print('error: missing instrument data')
-					continue
+		except Exception as e:
+			print('error: could not read last session')
+			print(e)
+			traceback.print_exc()
+			self.onRestoreSession(0)
+			return
 
-				if channel == activeChannel and font == activeSoundFontFile and instrument == activeInstrument:
-					print('found primary font')
-					continue
+		# restore primary active channel last
+		# note: ignoring last selectedChannel if it was unused.
+		print('restore fonts, active channel: ' + str(activeChannel))
+		fonts = set([step[1] for step in plan])
+		self.showStartup('restoring session...', len(fonts))
 
-				self.fluidsynth.setSelectedChannel(channel)
-				self.fluidsynth.loadSoundFont(font)
-				self.fluidsynth.setInstrument(instrument)
+		def onLoad(count, total, font):
+			wx.CallAfter(self.onRestoreProgress, count, total, font)
 
-			# restore primary active channel
-			# note: ignoring last selectedChannel if it was unused.
-			print('restore active channel: ' + str(activeChannel))
-			self.fluidsynth.setSelectedChannel(activeChannel)
+		future = self.fluidsynthAsync.submit(self.fluidsynth.restoreChannels,
+			plan, activeChannel, onLoad, lambda: self.restoreCancelled)
+		self.callAfter(future, self.onRestoreSession)
 
-			# restore primary font
-			if activeSoundFontFile != '':
-				self.setSoundFont(activeSoundFontFile)
 
-			# restore primary instrument
-			if activeInstrument != '':
-				self.setInstrumentByName(activeInstrument)
+	# one font of the session loaded
+	def onRestoreProgress(self, count, total, font):
+		if self.restoreCancelled:
+			return
+		self.gaugeStartup.SetRange(total)
+		self.gaugeStartup.SetValue(count)
+		self.SetStatusText('loaded %d of %d: %s' % (count, total, os.path.basename(font)))
 
-		except Exception as e:
-			print('error: could not restore snapshot of preferences')
-			print(e)
-			traceback.print_exc()
+
+	# inactive channels restored.  restore primary font and instrument
+	def onRestoreSession(self, count):
+		self.starting = False
+		self.hideStartup()
+		self.SetStatusText('restored ' + str(count) + ' channels')
+
+		if self.restoreCancelled:
+			return
+
+		if self.soundFontGeneration != self.restoreGeneration:
+			# a font was picked while restoring, keep it
+			return
+
+		activeSoundFontFile = self.getData('activeSoundFontFile')
+		activeInstrument = self.getData('activeInstrument')
+		if activeSoundFontFile != '':
+			self.setSoundFont(activeSoundFontFile, activeInstrument)
+
+
+	# connect to fluidsynth in the background.  starting fluidsynth (or
+	# waiting for its audio driver) can take seconds, the window is already
+	# shown and the font lists can be browsed in the mean time.
+	def startEngine(self):
+		self.restoreGeneration = self.soundFontGeneration
+		self.showStartup('connecting to fluidsynth...', 0)
+		future = self.fluidsynthAsync.start()
+		self.callAfter(future, self.onEngineStarted)
+
+
+	# fluidsynth is up (or failed to start)
+	def onEngineStarted(self, connected):
+		if not connected:
+			self.starting = False
+			self.hideStartup()
+			self.SetStatusText('error: could not connect to fluidsynth')
+			return
+
+		# trigger change on all level controls to sync api
+		with self.fluidsynth.batch():
+			self.onScrollGain()
+			self.onClickEnableReverb()
+			self.onClickEnableChorus()
+			self.levels.flush()
+
+		if self.restoreCancelled:
+			self.onRestoreSession(0)
+			return
+
+		self.restoreSession()
+
+
+	# show startup progress.  total = 0 for unknown
+	def showStartup(self, text, total):
+		self.SetStatusText(text)
+		if total > 0:
+			self.gaugeStartup.SetRange(total)
+			self.gaugeStartup.SetValue(0)
+		else:
+			self.pulseStartup()
+		self.panel.GetSizer().Show(self.startupSizer, True)
+		self.panel.Layout()
+
+
+	# show the load of each engine in the status bar (--engines), for
+	# example:  1: 6 ch, 310 MB, 64% cpu  |  2: 5 ch, 280 MB, 51% cpu
+	def updateEngineLoad(self):
+		if self.fluidsynth.connected:
+			texts = []
+			for idx, load in enumerate(self.fluidsynth.getLoad()):
+				text = '%d: %d ch, %.0f MB' % (idx+1, load['channels'], 
+					load['memory'] / 1048576.0)
+				if load['cpu'] != None:
+					text += ', %.0f%% cpu' % load['cpu']
+				texts.append(text)
+			self.SetStatusText('  |  '.join(texts), 1)
+		wx.CallLater(self.engineLoadInterval, self.updateEngineLoad)
+
+
+	# keep the gauge moving while the time left is unknown
+	def pulseStartup(self):
+		if self.fluidsynth.connected or not self.starting:
+			return
+		self.gaugeStartup.Pulse()
+		wx.CallLater(100, self.pulseStartup)
+
+
+	def hideStartup(self):
+		self.panel.GetSizer().Show(self.startupSizer, False)
+		self.panel.Layout()
+
+
+	# stop restoring the last session.  the engine connection is kept.
+	def onClickCancelStartup(self, event=None):
+		self.restoreCancelled = True
+		self.btnCancelStartup.Disable()
+		self.SetStatusText('cancelling...')
 
 
 	#######################################################################
@@ -962,23 +600,42 @@ class FluidSynthGui(wx.Frame):
 		self.notebook = wx.Notebook(panel)
 		page1 = wx.Panel(self.notebook)
 		page2 = wx.Panel(self.notebook)
+		page3 = wx.Panel(self.notebook)
 
 		self.createSoundFontControls(page1)
 		self.createLevelControls(page2)
+		self.createPresetSearchControls(page3)
 
 		self.notebook.AddPage(page1, 'Sound Fonts')
 		self.notebook.AddPage(page2, 'Levels')
+		self.notebook.AddPage(page3, 'Presets')
 
-		sizer = wx.BoxSizer()
+		sizer = wx.BoxSizer(wx.VERTICAL)
 		sizer.Add(self.notebook, 1, wx.EXPAND)
 
+		# startup progress (hidden when done)
+		self.gaugeStartup = wx.Gauge(panel, range=1)
+		self.btnCancelStartup = wx.Button(panel, label='Cancel')
+		self.startupSizer = wx.BoxSizer(wx.HORIZONTAL)
+		self.startupSizer.Add(self.gaugeStartup, 1, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 4)
+		self.startupSizer.Add(self.btnCancelStartup, 0, wx.ALL, 4)
+		sizer.Add(self.startupSizer, 0, wx.EXPAND)
+
 		panel.SetSizer(sizer)
 
+		if self.fluidsynth.options.engines > 1:
+			# second field: load of each engine
+			self.CreateStatusBar(2)
+			self.SetStatusWidths([-2, -3])
+		else:
+			self.CreateStatusBar()
+
                 # minimum layout
 		sizer.Fit(self)
                 #panel.Fit()
                 page1.Fit()
                 page2.Fit()
+		page3.Fit()
 		self.Fit()
 
                 # fixed layout
@@ -1034,6 +691,31 @@ class FluidSynthGui(wx.Frame):
 		return vbox
 
 
+	# search presets in all fonts in the catalog
+	def createPresetSearchControls(self,panel):
+
+		# ui components
+		self.textSearchPresets = wx.TextCtrl(panel)
+		self.listPresets = wx.ListBox(panel, choices=[], size=(-1,200))
+
+		# start layout 
+		vbox = wx.BoxSizer(wx.VERTICAL)
+
+		# row1
+		row = wx.BoxSizer(wx.HORIZONTAL)
+		row.Add( wx.StaticText(panel, label='Search Presets') , flag=wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, border=10)
+		row.Add(self.textSearchPresets, flag=wx.ALIGN_CENTER_VERTICAL, proportion=1)
+		vbox.Add(row, flag=wx.EXPAND|wx.ALL, border=5)
+
+		# row2
+		row = wx.BoxSizer(wx.HORIZONTAL)
+		row.Add(self.listPresets,proportion=1)
+		vbox.Add(row, flag=wx.EXPAND|wx.ALL, border=5)
+
+		panel.SetSizer(vbox)
+		return vbox
+
+
 	# widget to control master gain level
 	# controls:
 	# gain value                 Set the master gain (0.0 < gain < 5.0)
@@ -1213,8 +895,20 @@ class FluidSynthGui(wx.Frame):
 		self.textFilterSoundFont.Bind(wx.wx.EVT_KEY_UP, self.onKeyUpFilterSoundFont,self.textFilterSoundFont)
 		self.spinChannel.Bind(wx.EVT_SPINCTRL,self.onClickChannel,self.spinChannel)
 		self.btnPanic.Bind(wx.EVT_BUTTON, self.onClickPanic, self.btnPanic)
+		self.btnCancelStartup.Bind(wx.EVT_BUTTON, self.onClickCancelStartup, self.btnCancelStartup)
+
+		# preset search page
+		self.textSearchPresets.Bind(wx.EVT_KEY_UP, self.onKeyUpSearchPresets, self.textSearchPresets)
+		self.listPresets.Bind(wx.EVT_LISTBOX, self.onSelectPreset, self.listPresets)
 
 		# levels page 
+		# sliders are rate limited, the last value is sent on release
+		for slider in [ self.sGain, 
+				self.sReverbDamp, self.sReverbRoomSize, self.sReverbWidth, self.sReverbLevel,
+				self.sChorusNR, self.sChorusLevel, self.sChorusSpeed, self.sChorusDepth ]:
+			slider.Bind(wx.EVT_SCROLL_THUMBRELEASE,self.onReleaseSlider)
+			slider.Bind(wx.EVT_SCROLL_CHANGED,self.onReleaseSlider)
+
 		self.sGain.Bind(wx.EVT_SLIDER,self.onScrollGain)
 
 		self.cbEnableReverb.Bind(wx.EVT_CHECKBOX,self.onClickEnableReverb)
@@ -1275,7 +969,7 @@ class FluidSynthGui(wx.Frame):
 		self.lastSelectedPath = path 
 
 		# if user selected a file, automatically try to open the file as sf2
-		if not os.path.isdir(path):
+		if not self.isDir(path):
 			self.clearInstrumentList()
 			self.setSoundFont(path)
 		
@@ -1289,7 +983,7 @@ class FluidSynthGui(wx.Frame):
 		path = self.getSelectedSoundFontFile()
 		self.lastSelectedPath = path 
 
-		if os.path.isdir(path):
+		if self.isDir(path):
 			# open directories
 			self.clearInstrumentList()
 			self.changeDir(path,clearSearchFilter=True,giveFocus=True)
@@ -1335,7 +1029,7 @@ class FluidSynthGui(wx.Frame):
 		self.onKeyDownListBoxes(event)
 
 		if keycode == wx.WXK_RETURN: 
-			if path != None and os.path.isdir(path):
+			if path != None and self.isDir(path):
 				# navigate to the new dir
 				self.changeDir(path,clearSearchFilter=True,giveFocus=True)
 				self.lastSelectedPath = path 
@@ -1407,7 +1101,9 @@ class FluidSynthGui(wx.Frame):
 					pos = idx + 1
 				giveFocus = True	
 
-		self.refreshSoundFontList()
+		# keys like arrows do not change the filter, no need to search again
+		if self.textFilterSoundFont.GetValue() != self.soundFontFilter:
+			self.refreshSoundFontList()
 
 		if pos != -1: 
 			self.setSoundFontByIdx(pos)
@@ -1419,6 +1115,39 @@ class FluidSynthGui(wx.Frame):
 			event.Skip()
 
 
+	# preset search changed.  the search waits until typing pauses.
+	def onKeyUpSearchPresets(self, event=None):
+		if self.textSearchPresets.GetValue() != self.presetPattern:
+			self.presetGeneration += 1
+			wx.CallLater(self.presetDelay, self.searchPresetsLater, self.presetGeneration)
+		if event != None:
+			event.Skip()
+
+
+	# search, unless another key was pressed since
+	def searchPresetsLater(self, generation):
+		if generation == self.presetGeneration:
+			self.searchPresets()
+
+
+	# load the font and instrument of a preset search result
+	def onSelectPreset(self, event=None):
+		idx = self.listPresets.GetSelection()
+		if idx < 0 or idx >= len(self.presetResults):
+			return
+
+		(path, bank, prog, name) = self.presetResults[idx]
+		instrument = '%03d-%03d %s' % (bank, prog, name)
+		print('select preset: ' + path + ' ' + instrument)
+
+		# show the font in the sound font page too
+		self.changeDir(os.path.dirname(path), clearSearchFilter=True)
+		self.setSoundFont(path, instrument)
+
+		if event != None:
+			event.Skip()
+
+
 	# channel change
 	def onClickChannel(self,event):
 
@@ -1428,7 +1157,17 @@ class FluidSynthGui(wx.Frame):
 		self.refreshSoundFontList()
 
 		channel = self.spinChannel.GetValue()
-		self.fluidsynth.selectedChannel = channel
+
+		# a font still loading was picked for the old channel.  it would 
+		# land on this one, so it is stale now
+		self.soundFontGeneration += 1
+		self.unloadedSoundFont = ''
+		self.loadingInstrument = None
+		self.cancelPrefetch()
+
+		# queue behind the font load or session restore on the worker,
+		# they select on the current channel
+		self.fluidsynthAsync.setSelectedChannel(channel)
 
 		# try to restore last known font/instrument on this channel
 		(font,instrument)=self.fluidsynth.getFontInstrumentFromChannel(channel)
@@ -1436,18 +1175,16 @@ class FluidSynthGui(wx.Frame):
 		if font != '':
 			dirname = os.path.dirname(font)
 			self.changeDir(dirname)
-			self.setSoundFont(font)	
+			self.setSoundFont(font, instrument)	
 		else:
 			self.listSoundFont.SetSelection(-1)	
-
-		if instrument != '':
-			self.setInstrumentByName(instrument)	
-		else:
 			self.refreshInstrumentList(-1)	
 
 
 	# reset (all notes off)
 	def onClickPanic(self, event):
+		if not self.fluidsynth.connected:
+			return
 		self.fluidsynth.panic()
 
 
@@ -1455,95 +1192,125 @@ class FluidSynthGui(wx.Frame):
 	def onScrollGain(self,event=None):
 		value = self.sGain.GetValue()
 		value *= 1/20.0 # 100 -> 5 
-		self.fluidsynth.setGain(value)
+		self.updateLevel('setGain', self.fluidsynth.setGain, value)
 
 
 	# reverb change
 	def onClickEnableReverb(self,event=None):
 		value = self.cbEnableReverb.GetValue()
-		self.fluidsynth.setReverb(value)	
 		self.enableReverbControls(value)
+		if not self.fluidsynth.connected:
+			return
 
-		# sync api to sliders
-		if value:
-			self.onScrollReverbDamp()
-			self.onScrollReverbRoomSize()
-			self.onScrollReverbWidth()
-			self.onScrollReverbLevel()
+		with self.fluidsynth.batch():
+			self.fluidsynth.setReverb(value)	
+
+			# sync api to sliders
+			if value:
+				self.onScrollReverbDamp()
+				self.onScrollReverbRoomSize()
+				self.onScrollReverbWidth()
+				self.onScrollReverbLevel()
+			self.levels.flush() # rate limited levels go in this batch too
 
 
 	# slider change
 	def onScrollReverbDamp(self,event=None):
 		value = self.sReverbDamp.GetValue()
 		value *= 1/100.0  # 100 -> 1
-		self.fluidsynth.setReverbDamp(value) 
+		self.updateLevel('setReverbDamp', self.fluidsynth.setReverbDamp, value)
 
 
 	# slider change
 	def onScrollReverbRoomSize(self,event=None):
 		value = self.sReverbRoomSize.GetValue()
 		value *= 1/100.0  # 100 -> 1
-		self.fluidsynth.setReverbRoomSize(value) 
+		self.updateLevel('setReverbRoomSize', self.fluidsynth.setReverbRoomSize, value)
 
 
 	# slider change
 	def onScrollReverbWidth(self,event=None):
 		value = self.sReverbWidth.GetValue()
 		value *= 1/100.0  # 100 -> 1
-		self.fluidsynth.setReverbWidth(value) 
+		self.updateLevel('setReverbWidth', self.fluidsynth.setReverbWidth, value)
 
 
 	# slider change
 	def onScrollReverbLevel(self,event=None):
 		value = self.sReverbLevel.GetValue()
 		value *= 1/100.0  # 100 -> 1
-		self.fluidsynth.setReverbLevel(value) 
+		self.updateLevel('setReverbLevel', self.fluidsynth.setReverbLevel, value)
 
 
 	# chorus change
 	def onClickEnableChorus(self,event=None):
 		value = self.cbEnableChorus.GetValue()
-		self.fluidsynth.setChorus(value)
 		self.enableChorusControls(value)
+		if not self.fluidsynth.connected:
+			return
+
+		with self.fluidsynth.batch():
+			self.fluidsynth.setChorus(value)
 
-		# sync api to sliders
-		if value:
-			self.onScrollChorusNR()
-			self.onScrollChorusLevel()
-			self.onScrollChorusSpeed()
-			self.onScrollChorusDepth()
+			# sync api to sliders
+			if value:
+				self.onScrollChorusNR()
+				self.onScrollChorusLevel()
+				self.onScrollChorusSpeed()
+				self.onScrollChorusDepth()
+			self.levels.flush() # rate limited levels go in this batch too
 
 
 	# slider change
 	def onScrollChorusNR(self,event=None):
 		value = self.sChorusNR.GetValue()
 		# scale: 1 -> 1
-		self.fluidsynth.setChorusNR(value)
+		self.updateLevel('setChorusNR', self.fluidsynth.setChorusNR, value)
 
 
 	# slider change
 	def onScrollChorusLevel(self,event=None):
 		value = self.sChorusLevel.GetValue()
 		value *= 1/100.0 # 100 -> 1
-		self.fluidsynth.setChorusLevel(value)
+		self.updateLevel('setChorusLevel', self.fluidsynth.setChorusLevel, value)
 
 
 	# slider change
 	def onScrollChorusSpeed(self,event=None):
 		value = self.sChorusSpeed.GetValue()
 		value *= 1/100.0 # 100 -> 1
-		self.fluidsynth.setChorusSpeed(value)
+		self.updateLevel('setChorusSpeed', self.fluidsynth.setChorusSpeed, value)
 
 
 	# slider change
 	def onScrollChorusDepth(self,event=None):
 		value = self.sChorusDepth.GetValue()
 		# scale: 1 -> 1
-		self.fluidsynth.setChorusDepth(value)
+		self.updateLevel('setChorusDepth', self.fluidsynth.setChorusDepth, value)
+
+
+	# send a level to fluidsynth, rate limited.
+	# until connected, levels are only kept in the widgets, and are all
+	# sent once connected (see onEngineStarted)
+	def updateLevel(self, key, fn, value):
+		if not self.fluidsynth.connected:
+			return
+		self.levels.update(key, fn, value)
+
+
+	# slider released, send the last value now
+	def onReleaseSlider(self,event=None):
+		self.levels.flush()
+		if event != None:
+			event.Skip()
 
 
 	# on shutdown
 	def onClose(self,event=None):
+		self.levels.flush()
+		self.stopCatalogThreads()
+		if self.catalog != None:
+			self.catalog.close()
 		self.takePreferenceSnapshot()
 		self.storeDataFile() # store GUI state, will restore on load
 		if event != None:
@@ -1570,14 +1337,26 @@ class FluidSynthGui(wx.Frame):
 		if path != None:
 			self.dir = path
 
+		self.cancelPrefetch()
+		self.prefetchIdx = -1
+
 		if clearSearchFilter:
 			self.clearSearchFilter()
 
-		# get files
-		allFiles = os.listdir(self.dir)
-		# exclude dot files
-		allFiles = [x for x in allFiles if not x.startswith('.')]	
+		# get files (dot files are excluded)
+		# the file types are kept, so selecting an entry needs no stat call
+		entries = []
+		try:
+			entries = SoundFontScanner.listDir(self.dir)
+		except Exception as e:
+			print('error: could not list dir: ' + self.dir)
+			print(e)
+		allFiles = [entry[0] for entry in entries]
 		self.soundFontsAll = allFiles 
+		self.soundFontDirs = set([entry[0] for entry in entries if entry[1]])
+		self.soundFontIndex = TrigramIndex(allFiles)
+		self.indexSoundFonts(self.soundFontIndex)
+		self.refreshCatalog(self.dir, allFiles)
 
 		self.refreshSoundFontList(giveFocus=giveFocus,resetInstruments=True)
 
@@ -1587,6 +1366,33 @@ class FluidSynthGui(wx.Frame):
 				self.textSoundFontDir.SetValue(path) 
 
 
+	# build the search index of a listing in the background, so a big dir
+	# does not stall the gui.  the filter scans every name until it is done.
+	def indexSoundFonts(self, index):
+
+		def run():
+			if index is not self.soundFontIndex:
+				return # dir changed again
+			try:
+				index.build()
+			except Exception as e:
+				print('error: could not index fonts')
+				print(e)
+
+		thread = threading.Thread(target=run)
+		thread.daemon = True
+		thread.start()
+
+
+	# is the path a directory?
+	# entries of the current dir are answered from the listing.
+	def isDir(self, path):
+		(dirname, name) = os.path.split(path)
+		if dirname == self.dir:
+			return name == self.parentDir or name in self.soundFontDirs
+		return os.path.isdir(path)
+
+
 	# getters/setters for font and instrument
 	# idx is the position in the select list (if in bounds)
 
@@ -1657,18 +1463,78 @@ class FluidSynthGui(wx.Frame):
 
 
 	# change soundfont in fluid synth 
-	def setSoundFont(self, path):
+	# the presets are listed right away, read from the .sf2 file.
+	# the font loads on a worker thread, so the gui does not freeze.
+	# only the latest request is loaded, older requests are dropped.
+	# when the font is ready, the instrument is selected (default is first)
+	# with --lazy-load, the font is not loaded until a preset is picked.
+	# returns False if there is nothing to load
+	def setSoundFont(self, path, instrument=''):
 
 		if path == '' or path == None:
-			return -1 # nothing to do 
+			return False # nothing to do 
 
 		self.lastSelectedPath = path # save selection
 
-		if os.path.isdir(path):
-			return -1 # not a sf2 file. don't try to load 
+		if self.isDir(path):
+			return False # not a sf2 file. don't try to load 
+
+		# any font still loading is stale now
+		self.soundFontGeneration += 1
+		self.unloadedSoundFont = ''
+		self.loadingInstrument = None
+		self.cancelPrefetch()
+
+		instrumentsAll = self.readSoundFontInstruments(path)
+		if len(instrumentsAll) > 0:
+			self.instrumentsAll = instrumentsAll
+			self.instruments = self.filterInstruments()
+			self.refreshInstrumentList(0)
+		else:
+			self.showLoadingInstrumentList()
+
+		if self.lazyLoad and instrument == '' and len(instrumentsAll) > 0:
+			# wait for the user to pick a preset
+			self.unloadedSoundFont = path
+			return True
+
+		return self.loadSoundFontInBackground(path, instrument, instrumentsAll)
+
+
+	# load the font on the worker thread, then select the instrument
+	# (default is first).  an instrument picked while loading wins.
+	# voices: the presets, if already read (see readSoundFontInstruments)
+	def loadSoundFontInBackground(self, path, instrument='', voices=None):
+
+		self.soundFontGeneration += 1
+		generation = self.soundFontGeneration
+		isStale = lambda: generation != self.soundFontGeneration
+
+		self.unloadedSoundFont = ''
+		self.loadingInstrument = instrument
 
 		# assume sf2 file, try to load
-		(id,instrumentsAll) = fluidsynth.initSoundFont(path)
+		# presets from the catalog save a round trip
+		if voices == None:
+			voices = self.readSoundFontInstruments(path)
+		future = self.fluidsynthAsync.submitLatest('soundfont',
+			self.fluidsynth.initSoundFont, path, isStale, voices)
+		self.callAfter(future, lambda result:
+			self.onLoadSoundFont(path, generation, result))
+		return True
+
+
+	# font finished loading in the background (called on gui thread)
+	# result is (id,instrumentsAll)
+	def onLoadSoundFont(self, path, generation, result):
+
+		if generation != self.soundFontGeneration:
+			return # stale. user already selected another font
+
+		instrument = self.loadingInstrument
+		self.loadingInstrument = None
+
+		(id,instrumentsAll) = result
 		if id == -1:
 			instrumentsAll = ['Error: could not load as .sf2 file']
 
@@ -1682,7 +1548,80 @@ class FluidSynthGui(wx.Frame):
 
 		#self.setInstrumentByIdx(0) # already initalized
 		self.refreshInstrumentList(0);
-		return id
+
+		if id != -1 and instrument != '' and instrument != None:
+			self.setInstrumentByName(instrument)
+
+		if id != -1 and self.prefetchDepth > 0:
+			wx.CallLater(self.prefetchDelay, self.prefetchSoundFonts, path, generation)
+
+
+	# load the fonts next to the selected font in the list, in the 
+	# background.  fonts in the direction the user is moving go first.
+	# stepping to a prefetched font only needs a `select`.
+	def prefetchSoundFonts(self, path, generation):
+
+		if generation != self.soundFontGeneration:
+			return # selection did not settle
+
+		idx = self.getIdxFromSoundFontName(path)
+		if idx < 0:
+			return
+
+		if self.prefetchIdx > -1 and idx != self.prefetchIdx:
+			self.prefetchDirection = 1 if idx > self.prefetchIdx else -1
+		self.prefetchIdx = idx
+
+		paths = []
+		for distance in range(1, self.prefetchDepth+1):
+			for step in [self.prefetchDirection, -self.prefetchDirection]:
+				neighbor = idx + step * distance
+				if neighbor < 0 or neighbor >= len(self.soundFonts):
+					continue
+				neighborPath = self.getSoundFontFileFromIdx(neighbor)
+				if not self.isDir(neighborPath):
+					paths.append(neighborPath)
+
+		self.cancelPrefetch()
+		self.prefetchNext(paths, paths + [path], generation)
+
+
+	# prefetch one font at a time.  the next font is only queued when the
+	# last one is done, the selection has not changed, and no font picked by
+	# the user is loading.  a `load` the engine has started cannot be 
+	# stopped, so a real load waits for at most that one prefetch.
+	# keep: paths that must not be evicted
+	def prefetchNext(self, paths, keep, generation):
+		if len(paths) == 0 or generation != self.soundFontGeneration:
+			return
+		if self.loadingInstrument != None or self.starting:
+			return # the user is waiting on the engine
+
+		future = self.fluidsynthAsync.submit(self.fluidsynth.prefetchSoundFont,
+			paths[0], keep)
+		self.prefetches = [future]
+		self.callAfter(future, lambda id: 
+			self.prefetchNext(paths[1:], keep, generation))
+
+
+	# drop prefetches that have not started yet
+	def cancelPrefetch(self):
+		for future in self.prefetches:
+			future.cancel()
+		self.prefetches = []
+
+
+	# list presets of a .sf2 file, without loading it in fluidsynth
+	# returns [] if the file could not be read
+	def readSoundFontInstruments(self, path):
+		try:
+			if self.catalog != None:
+				return self.catalog.getInstruments(path)
+			return SoundFontFile(path).getInstruments()
+		except Exception as e:
+			print('info: could not read presets: ' + path)
+			print(e)
+		return []
 
 
 	# allow setting sound font by list index
@@ -1691,12 +1630,11 @@ class FluidSynthGui(wx.Frame):
 			path = self.getSoundFontFileFromIdx(idx)
 			self.listSoundFont.Select(-1)
 			#self.listSoundFont.Focus(-1)
-			id =  self.setSoundFont(path)
-			return id
+			return self.setSoundFont(path)
 		except Exception as e:
 			print('error: could not set sound font by idx: ' + str(idx))
 			print(e)
-		return -1
+		return False
 
 		
 	# change the instrument in fluidsynth
@@ -1723,6 +1661,21 @@ class FluidSynthGui(wx.Frame):
 			#self.listInstruments.SetSelection(idx)
 			self.listInstruments.SetSelection(idx)
 
+		if self.unloadedSoundFont != '':
+			# lazy load: a preset was picked, load the font now
+			return self.loadSoundFontInBackground(self.unloadedSoundFont, 
+				instrumentName, self.instrumentsAll)
+
+		if self.loadingInstrument != None:
+			# font is still loading, select this one when ready
+			self.loadingInstrument = instrumentName
+			return True
+
+		if self.starting:
+			# queue behind the session restore
+			self.fluidsynthAsync.setInstrument(instrumentName)
+			return True
+
 		return self.fluidsynth.setInstrument(instrumentName)	
 
 
@@ -1805,31 +1758,25 @@ class FluidSynthGui(wx.Frame):
 				traceback.print_exc()
 
 
-	# search 
-	def grep(self, pattern, word_list):
-		expr = re.compile(pattern, re.IGNORECASE)
-		return [elem for elem in word_list if expr.search(elem)]
-
-
 	# apply search filter
+	# disable regex searches by default, unless turned on via cli switch
 	def filterSoundFont(self):
 		pattern = self.textFilterSoundFont.GetValue()
+		self.soundFontFilter = pattern
+		return self.soundFontIndex.search(pattern, self.regex)
 
-		# whitespace may be confusing since it won't show up in search box
-		# by default all space will be a wildcard 
-		# clean up trailing, duplicate spaces
-		pattern = pattern.strip(' \t\n\r') 
-		pattern = re.sub('  +', ' ', pattern)
 
-		# disable regex searches by default, unless turned on via cli switch
-		if self.regex:
-			pattern = pattern.replace(' ','.*')
+	# search presets in all fonts, and show the results
+	def searchPresets(self):
+		pattern = self.textSearchPresets.GetValue()
+		self.presetPattern = pattern
+		if self.presetIndex == None or pattern.strip() == '':
+			self.presetResults = []
 		else:
-			pattern = re.escape(pattern)
-			pattern = pattern.replace('\\ ','.*')
-		
-		lst = self.grep(pattern,self.soundFontsAll);
-		return sorted(lst, key=lambda s: s.lower())
+			self.presetResults = self.presetIndex.search(pattern, self.presetLimit)
+
+		self.listPresets.Set(['%s    %03d-%03d    %s' % (name, bank, prog, path)
+			for (path, bank, prog, name) in self.presetResults])
 
 
 	# possible enhancement: add search filter for instruments
@@ -1839,6 +1786,14 @@ class FluidSynthGui(wx.Frame):
 		return self.instrumentsAll;
 
 
+	# show that the instrument list is waiting for a font to load.
+	# nothing can be selected until the font is ready.
+	def showLoadingInstrumentList(self):
+		self.instruments = [] 
+		self.instrumentsAll = [] 
+		self.listInstruments.Set([self.loadingText])
+
+
 	# remove all instruments from listing
 	def clearInstrumentList(self):
 		self.instruments = [] 
@@ -1880,20 +1835,32 @@ if __name__ == '__main__':
 		parser = optparse.OptionParser()
 		parser.add_option('-d', '--dir', action='store', dest='dir',
 			help='load a sf2 directory', default='') 
-		parser.add_option('-c', '--cmd', action='store', dest='fluidsynthCmd', 
-			help='use a custom command to start FluidSynth server', default='') 
 		parser.add_option('--regex', action='store_true', dest='regex', 
 			help='allow regex patterns in search filter') 
+		parser.add_option('-l', '--library', action='store', dest='library',
+			help='scan a sf2 library (all sub dirs) in the background', default='') 
+		parser.add_option('--lazy-load', action='store_true', dest='lazyLoad', 
+			help='do not load a font until one of its presets is picked') 
+		parser.add_option('--max-rate', action='store', type='float', dest='maxRate',
+			help='max updates per second sent by each level slider (0 = no limit)', default=20) 
+		parser.add_option('--prefetch', action='store', type='int', dest='prefetch',
+			help='load N fonts above and below the selected font in the background', default=0) 
+		addApiOptions(parser)
 		options, args = parser.parse_args()
 
 		# init api
-		fluidsynth = FluidSynthApi(options,args)
+		# connects in the background once the gui is shown
+		fluidsynth = openApi(options,args,connect=False)
 
 		# wrap api with gui
 		app = wx.App(clearSigInt=True)
 		gui = FluidSynthGui(None, title='FluidSynth Gui v1.0',api=fluidsynth)
 		app.MainLoop()
 
+		if options.stats:
+			print(fluidsynth.stats.getText())
+			print(fluidsynth.settings.getSummary())
+
 	except Exception as e:
 		print('exiting...')
 		print(e)
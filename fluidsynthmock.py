@@ -0,0 +1,434 @@
+#!/usr/bin/python
+#
+# Kevin Seifert - GPL 2015
+#
+# A stand-in for the fluidsynth socket shell, for testing and benchmarking
+# without fluidsynth, jack or a sound card.  It speaks the same commands
+# FluidSynthApi uses, and keeps the same state (fonts, channels, settings),
+# but plays no sound and reads no .sf2 files.
+#
+# Run:
+#
+#    python fluidsynthmock.py --port 9800
+#    python fluidsynthgui.py
+#
+# Or answer on stdin/stdout, like `fluidsynth` without -i (--transport pipe):
+#
+#    python fluidsynthgui.py --transport pipe -c "python fluidsynthmock.py --stdio"
+#
+# Simulate a slow engine and a flaky connection:
+#
+#    python fluidsynthmock.py --latency load=800,inst=20 --warn-rate .1 \
+#        --stall-rate .01 --chunk 16
+#
+# Commands:
+#
+#    echo, load, unload, fonts, inst, select, get, set, gain, reverb, chorus, cc,
+#    rev_setroomsize, rev_setdamp, rev_setwidth, rev_setlevel,
+#    cho_set_nr, cho_set_level, cho_set_speed, cho_set_depth, reset
+#
+# Classes defined below:
+#
+#   MockFluidSynthEngine - the synth state, shared by all connections.
+#
+#   MockFluidSynthServer - accepts connections and answers commands, with
+#                   optional latency and fault injection.
+#
+#   MockStdio - stdin/stdout with the methods of a socket.
+#
+# Note on whitespace:
+#    I'm using tabs for indentation, with my tab width set at 4 spaces.
+
+
+import sys
+import time
+import socket
+import threading
+import os
+import optparse
+import random
+
+
+# the synth state: loaded fonts, channel presets and settings.
+# every method returns the text fluidsynth would print.
+class MockFluidSynthEngine:
+
+	def __init__(self, presets=128):
+		self.presets = presets         # presets listed by `inst` per font.
+		self.fonts = {}                # font_id: font_file.
+		self.lastFontId = 0            # ids are never reused, like fluidsynth.
+		self.channels = [None] * 16    # (font_id, bank, prog). position is channel.
+		self.settings = {              # `get`/`set` values.
+			'synth.gain': '0.2',
+			'synth.reverb.active': '1',
+			'synth.chorus.active': '1',
+			'synth.midi-channels': '16',
+		}
+		self.levels = {}               # last value of gain, rev_*, cho_* commands.
+		self.controls = {}             # (channel, controller): last cc value.
+		self.counts = {}               # command: number of calls.
+		self.lock = threading.Lock()
+
+
+	# run one line of the shell.
+	# returns the output text (may be '')
+	def run(self, line):
+		parts = line.split(None, 1)
+		if len(parts) == 0:
+			return ''
+		name = parts[0]
+		arg = parts[1] if len(parts) > 1 else ''
+
+		with self.lock:
+			self.counts[name] = self.counts.get(name, 0) + 1
+			handler = getattr(self, 'cmd_' + name, None)
+			if handler == None:
+				if name.startswith('rev_') or name.startswith('cho_'):
+					return self.setLevel(name, arg)
+				return 'unknown command: ' + name + ' (try help)\n'
+			return handler(arg)
+
+
+	def cmd_echo(self, arg):
+		return arg.replace('""', '') + '\n'
+
+
+	# > load "/home/Music/sf2/Brass 4.SF2"
+	# loaded SoundFont has ID 1
+	def cmd_load(self, arg):
+		path = arg.strip().strip('"')
+		if path == '':
+			return 'Failed to load the SoundFont\n'
+		self.lastFontId += 1
+		self.fonts[self.lastFontId] = path
+		return 'loaded SoundFont has ID ' + str(self.lastFontId) + '\n'
+
+
+	def cmd_unload(self, arg):
+		id = self.parseInt(arg)
+		if self.fonts.pop(id, None) == None:
+			return 'Failed to unload the SoundFont\n'
+		for chan in range(len(self.channels)):
+			if self.channels[chan] != None and self.channels[chan][0] == id:
+				self.channels[chan] = None
+		return ''
+
+
+	# > fonts
+	# ID  Name
+	#  1  /home/Music/sf2/Brass 4.SF2
+	def cmd_fonts(self, arg):
+		lines = ['ID  Name\n']
+		for id in sorted(self.fonts.keys()):
+			lines.append('%3d  %s\n' % (id, self.fonts[id]))
+		return ''.join(lines)
+
+
+	# > inst 1
+	# 000-000 Preset 0
+	def cmd_inst(self, arg):
+		id = self.parseInt(arg)
+		if id not in self.fonts:
+			return 'No SoundFont with id = ' + arg.strip() + '\n'
+		return ''.join(['%03d-%03d Preset %d\n' % (i / 128, i % 128, i)
+			for i in range(self.presets)])
+
+
+	# > select chan sfont bank prog
+	def cmd_select(self, arg):
+		parts = [self.parseInt(part) for part in arg.split()]
+		if len(parts) != 4 or parts[0] < 0 or parts[0] >= len(self.channels):
+			return 'select: invalid argument\n'
+		(chan, id, bank, prog) = parts
+		if id not in self.fonts:
+			return 'fluidsynth: error: There is no soundfont with id ' + str(id) + '\n'
+		self.channels[chan] = (id, bank, prog)
+		return ''
+
+
+	def cmd_get(self, arg):
+		key = arg.strip()
+		if key not in self.settings:
+			return 'get: unknown setting: ' + key + '\n'
+		return self.settings[key] + '\n'
+
+
+	def cmd_set(self, arg):
+		parts = arg.split(None, 1)
+		if len(parts) != 2:
+			return 'set: too few arguments\n'
+		self.settings[parts[0]] = parts[1].strip()
+		return ''
+
+
+	def cmd_gain(self, arg):
+		return self.setLevel('gain', arg)
+
+
+	def cmd_reverb(self, arg):
+		return self.setLevel('reverb', arg)
+
+
+	def cmd_chorus(self, arg):
+		return self.setLevel('chorus', arg)
+
+
+	# > cc chan ctrl value
+	def cmd_cc(self, arg):
+		parts = [self.parseInt(part) for part in arg.split()]
+		if len(parts) != 3 or parts[0] < 0 or parts[0] >= len(self.channels):
+			return 'cc: invalid argument\n'
+		self.controls[(parts[0], parts[1])] = parts[2]
+		return ''
+
+
+	# all notes off.  like fluidsynth's system reset, the controllers go
+	# back to their defaults (cc 7 = 100).
+	def cmd_reset(self, arg):
+		self.controls.clear()
+		return ''
+
+
+	def setLevel(self, name, arg):
+		self.levels[name] = arg.strip()
+		return ''
+
+
+	def parseInt(self, text):
+		try:
+			return int(text.strip())
+		except Exception as e:
+			return -1
+
+
+# end class
+
+
+# accepts connections on a port, and answers each line with the engine.
+# one thread per connection.  all connections share the engine, like they
+# share one synth in fluidsynth.
+#
+#    server = MockFluidSynthServer(port=0, latency={'load': .5})
+#    server.start()
+#    api.port = server.port
+#
+# latency:    command: seconds to wait before replying ('*' = any command)
+# warnRate:   chance of an extra warning line before a reply, like the
+#             `fluidsynth: warning: ...` lines the real engine prints.
+# dropRate:   chance of closing the connection instead of replying.
+# stallRate:  chance of waiting stallTime seconds before replying.
+# chunk:      write replies in pieces of this many bytes (0 = whole).
+# prompt:     printed after each command, like the interactive shell
+#             prints it before reading the next one (for example '> ').
+class MockFluidSynthServer(threading.Thread):
+
+	def __init__(self, host='localhost', port=9800, presets=128, latency={},
+			warnRate=0, dropRate=0, stallRate=0, stallTime=10, chunk=0, seed=None,
+			prompt=''):
+		threading.Thread.__init__(self, name='fluidsynth-mock')
+		self.daemon = True
+		self.engine = MockFluidSynthEngine(presets)
+		self.latency = latency
+		self.warnRate = warnRate
+		self.dropRate = dropRate
+		self.stallRate = stallRate
+		self.stallTime = stallTime
+		self.chunk = chunk
+		self.prompt = prompt
+		self.random = random.Random(seed)
+		self.connections = []          # open client sockets.
+		self.closed = False
+
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server.bind((host, port))
+		self.server.listen(5)
+		self.port = self.server.getsockname()[1]
+
+
+	# accept connections until closed
+	def run(self):
+		while not self.closed:
+			try:
+				(conn, address) = self.server.accept()
+			except Exception as e:
+				return
+			self.connections.append(conn)
+			thread = threading.Thread(target=self.serve, args=(conn,))
+			thread.daemon = True
+			thread.start()
+
+
+	# stop listening, and close every connection
+	def close(self):
+		self.closed = True
+		for sock in [self.server] + self.connections:
+			try:
+				sock.shutdown(socket.SHUT_RDWR)
+			except Exception as e:
+				pass
+			sock.close()
+
+
+	# answer one connection, line by line.
+	# output is collected, and written before any delay or at the end of
+	# the data received, so a pipelined client sees few large writes.
+	def serve(self, conn):
+		data = ''
+		try:
+			while True:
+				part = conn.recv(4096)
+				if part == '':
+					return
+				data += part
+				lines = data.split('\n')
+				data = lines.pop()
+				out = []
+				for line in lines:
+					if self.chance(self.dropRate):
+						print('mock: drop connection')
+						return
+					delay = self.getDelay(line)
+					if delay > 0:
+						self.write(conn, ''.join(out))
+						out = []
+						time.sleep(delay)
+					if self.chance(self.warnRate):
+						out.append('fluidsynth: warning: No preset found on channel 9 [bank=128 prog=0]\n')
+					out.append(self.engine.run(line))
+					out.append(self.prompt)
+				self.write(conn, ''.join(out))
+
+		except Exception as e:
+			if not self.closed:
+				print('mock: connection error')
+				print(e)
+		finally:
+			conn.close()
+			if conn in self.connections:
+				self.connections.remove(conn)
+
+
+	# seconds to wait before answering a line
+	def getDelay(self, line):
+		parts = line.split(None, 1)
+		name = parts[0] if len(parts) > 0 else ''
+		delay = self.latency.get(name, self.latency.get('*', 0))
+		if self.chance(self.stallRate):
+			print('mock: stall ' + str(self.stallTime) + 's on: ' + line)
+			delay += self.stallTime
+		return delay
+
+
+	def chance(self, rate):
+		return rate > 0 and self.random.random() < rate
+
+
+	# write data, in pieces if chunk is set (partial writes)
+	def write(self, conn, data):
+		if data == '':
+			return
+		if self.chunk <= 0:
+			conn.sendall(data)
+			return
+		for i in range(0, len(data), self.chunk):
+			conn.sendall(data[i:i+self.chunk])
+			time.sleep(0.0001)
+
+
+# end class
+
+
+# stdin/stdout with the methods of a socket, so serve() can answer on them
+class MockStdio:
+
+	def __init__(self):
+		self.inFd = sys.stdin.fileno()
+		self.outFd = sys.stdout.fileno()
+
+
+	def recv(self, size):
+		return os.read(self.inFd, size)
+
+
+	def sendall(self, data):
+		while data != '':
+			data = data[os.write(self.outFd, data):]
+
+
+	def close(self):
+		pass
+
+
+# end class
+
+
+# parse latency option, for example: load=800,inst=20,*=1
+# values are in ms.  returns command: seconds
+def parseLatency(text):
+	latency = {}
+	for item in text.split(','):
+		if item.strip() == '':
+			continue
+		(name, ms) = item.split('=')
+		latency[name.strip()] = float(ms) / 1000
+	return latency
+
+
+# main
+if __name__ == '__main__':
+
+	parser = optparse.OptionParser()
+	parser.add_option('--host', action='store', dest='host',
+		help='interface to listen on', default='localhost')
+	parser.add_option('--port', action='store', type='int', dest='port',
+		help='port to listen on (fluidsynth uses 9800)', default=9800)
+	parser.add_option('--presets', action='store', type='int', dest='presets',
+		help='presets listed by inst, for each font', default=128)
+	parser.add_option('--latency', action='store', dest='latency',
+		help='ms before each reply, by command. for example: load=800,inst=20,*=1', default='')
+	parser.add_option('--warn-rate', action='store', type='float', dest='warnRate',
+		help='chance of a warning line before a reply', default=0)
+	parser.add_option('--drop-rate', action='store', type='float', dest='dropRate',
+		help='chance of closing the connection on a command', default=0)
+	parser.add_option('--stall-rate', action='store', type='float', dest='stallRate',
+		help='chance of a stall before a reply', default=0)
+	parser.add_option('--stall-time', action='store', type='float', dest='stallTime',
+		help='seconds of each stall', default=10)
+	parser.add_option('--chunk', action='store', type='int', dest='chunk',
+		help='write replies in pieces of N bytes (0 = whole reply)', default=0)
+	parser.add_option('--seed', action='store', type='int', dest='seed',
+		help='random seed, to repeat the same faults', default=None)
+	parser.add_option('--stdio', action='store_true', dest='stdio',
+		help='answer on stdin/stdout instead of a port, with a "> " prompt')
+	options, args = parser.parse_args()
+
+	if options.stdio:
+		options.port = 0 # not used
+
+	server = MockFluidSynthServer(options.host, options.port, options.presets,
+		parseLatency(options.latency), options.warnRate, options.dropRate,
+		options.stallRate, options.stallTime, options.chunk, options.seed,
+		'> ' if options.stdio else '')
+
+	if options.stdio:
+		stdio = MockStdio()
+		sys.stdout = sys.stderr # keep messages out of the replies
+		stdio.sendall('FluidSynth mock, reading commands from stdin\n\n> ')
+		server.serve(stdio)
+		sys.exit(0)
+
+	server.start()
+	print('FluidSynth mock, listening on port: ' + str(server.port))
+	sys.stdout.flush() # the gui may be watching for this line
+
+	try:
+		while server.isAlive():
+			server.join(1)
+	except KeyboardInterrupt:
+		print('')
+		print('commands: ' + str(server.engine.counts))
+		server.close()
+
+# end main
+
@@ -0,0 +1,516 @@
+#!/usr/bin/python
+#
+# Kevin Seifert - GPL 2015
+#
+# Lets many programs share one fluidsynth.
+#
+# fluidsynth can only open a few shell sockets (see FluidSynthApi.connect).
+# The proxy holds the only connection to fluidsynth, and accepts any number
+# of clients.  Clients speak the same line protocol as the fluidsynth shell,
+# so the gui, fluidsynthcli.py and netcat all work unchanged:
+#
+#    python fluidsynthproxy.py --listen 9801
+#    python fluidsynthgui.py --port 9801
+#    python fluidsynthcli.py --port 9801 "load 1 /home/Music/sf2/Piano.sf2"
+#    nc localhost 9801
+#
+# Or on a unix socket (no tcp port):
+#
+#    python fluidsynthproxy.py --unix /tmp/fluidsynth.sock
+#    nc -U /tmp/fluidsynth.sock
+#
+# Each read from a client (up to 16 lines) is one request.  The requests
+# of all clients are sent to fluidsynth in turn (one request per client per
+# turn), so a busy client cannot starve the others.  A reset (panic) from
+# any client skips the queue.  Each reply goes back to the client that sent
+# the request, in the order that client sent them.
+#
+# Classes defined below:
+#
+#   FluidSynthProxyRequest - lines from one client, and the reply.
+#
+#   FluidSynthProxyClient - one client connection.
+#
+#   FluidSynthProxy - accepts clients, and sends their requests to fluidsynth.
+#
+# Note on whitespace:
+#    I'm using tabs for indentation, with my tab width set at 4 spaces.
+
+
+import sys
+import os
+import time
+import errno
+import select
+import socket
+import optparse
+import threading
+import collections
+
+from fluidsynthapi import addApiOptions
+from fluidsynthapi import openApi
+
+
+# lines from one client, sent to fluidsynth as one command.
+class FluidSynthProxyRequest:
+
+	def __init__(self, client, packet, urgent=False):
+		self.client = client           # FluidSynthProxyClient that sent it.
+		self.packet = packet           # command lines, without the last newline.
+		self.urgent = urgent           # skips the queue (for example, reset).
+		self.lines = packet.count('\n') + 1 # fluidsynth commands in the packet.
+		self.reply = None              # FluidSynthReply, once sent.
+		self.data = None               # the reply text, once read.
+		self.close = False             # close the client after this reply (quit).
+
+
+# end class
+
+
+# one client connection.
+class FluidSynthProxyClient:
+
+	def __init__(self, conn, name):
+		self.conn = conn               # client socket (non-blocking).
+		self.name = name               # address, for logging.
+		self.buffer = ''               # received text, up to an incomplete line.
+		self.queue = collections.deque()   # FluidSynthProxyRequest, not sent yet.
+		self.replies = collections.deque() # FluidSynthProxyRequest, in the order received.
+		self.out = ''                  # reply text not written yet.
+		self.quit = False              # sent quit, ignore anything after it.
+		self.closing = False           # close once the replies are written.
+		self.closed = False
+
+
+	# text of the replies that are ready, in order.
+	# stops at the first reply still waiting on fluidsynth.
+	def takeReplies(self):
+		while len(self.replies) > 0 and self.replies[0].data != None:
+			request = self.replies.popleft()
+			self.out += request.data
+			if request.close:
+				self.closing = True
+
+
+	# has nothing more to write?
+	def isIdle(self):
+		return self.out == '' and len(self.replies) == 0
+
+
+# end class
+
+
+# accepts clients, and sends their requests over one FluidSynthApi.
+#
+# three threads:
+#   io - accepts clients, reads requests, writes replies (one select loop).
+#   send - picks the next request, and sends it to fluidsynth.
+#   receive - reads the replies from fluidsynth, in order.
+class FluidSynthProxy:
+
+	maxLines = 16                  # max lines per request.
+	urgentCommands = ['reset']     # commands that skip the queue (panic).
+
+	def __init__(self, api, port=9801, unixPath='', host='localhost', maxInFlight=32):
+		self.api = api                 # FluidSynthApi, connected.
+		self.maxInFlight = maxInFlight # max command lines sent, and not answered yet.
+		self.unixPath = unixPath       # unix socket file ('' = none).
+		self.listeners = []            # listening sockets.
+		self.clients = {}              # socket -> FluidSynthProxyClient.
+		self.urgent = collections.deque()  # FluidSynthProxyRequest that skip the queue.
+		self.ready = collections.deque()   # FluidSynthProxyClient with requests queued.
+		self.inFlight = collections.deque()# FluidSynthProxyRequest sent, in order.
+		self.inFlightLines = 0         # command lines in inFlight.
+		self.answered = set()          # FluidSynthProxyClient with new replies.
+		self.lock = threading.Condition()  # guards the queues above, and the clients.
+		self.closed = False
+		self.threads = []
+
+		# counters (see getText)
+		self.clientCount = 0           # clients accepted.
+		self.clientPeak = 0            # most clients connected at once.
+		self.requestCount = 0          # requests sent to fluidsynth.
+		self.urgentCount = 0           # requests that skipped the queue.
+		self.queuePeak = 0             # most requests waiting at once.
+
+		if port != None and port >= 0:
+			server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			server.bind((host, port))
+			server.listen(128)
+			self.port = server.getsockname()[1]
+			self.listeners.append(server)
+
+		if unixPath != '':
+			if os.path.exists(unixPath):
+				os.remove(unixPath) # left over from an earlier run
+			server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			server.bind(unixPath)
+			server.listen(128)
+			self.listeners.append(server)
+
+		# written to by the other threads, to wake up the io thread
+		(self.wakeRead, self.wakeWrite) = os.pipe()
+
+
+	def start(self):
+		for (name, target) in [('proxy-io', self.runIo),
+				('proxy-send', self.runSend), ('proxy-receive', self.runReceive)]:
+			thread = threading.Thread(target=target, name=name)
+			thread.daemon = True
+			thread.start()
+			self.threads.append(thread)
+
+
+	# stop listening, and close every client
+	def close(self):
+		with self.lock:
+			self.closed = True
+			self.lock.notifyAll()
+		self.wake()
+		for thread in self.threads:
+			thread.join(2)
+		for sock in self.listeners + self.clients.keys():
+			sock.close()
+		self.clients = {}
+		if self.unixPath != '' and os.path.exists(self.unixPath):
+			os.remove(self.unixPath)
+
+
+	def wake(self):
+		try:
+			os.write(self.wakeWrite, 'x')
+		except OSError:
+			pass
+
+
+	#######################################################################
+	# io thread
+	#######################################################################
+
+	def runIo(self):
+		while not self.closed:
+			with self.lock:
+				readers = self.listeners + self.clients.keys() + [self.wakeRead]
+				writers = [conn for (conn, client) in self.clients.items()
+					if client.out != '']
+
+			try:
+				(readable, writable, errors) = select.select(readers, writers, [], 1)
+			except (select.error, socket.error) as e:
+				if e.args[0] == errno.EINTR:
+					continue
+				if self.closed:
+					return
+				raise
+
+			for sock in readable:
+				if sock == self.wakeRead:
+					os.read(self.wakeRead, 4096)
+				elif sock in self.listeners:
+					self.accept(sock)
+				else:
+					self.receiveFromClient(sock)
+
+			for sock in writable:
+				self.writeToClient(sock)
+
+			self.collectReplies()
+
+
+	def accept(self, server):
+		try:
+			(conn, address) = server.accept()
+		except socket.error as e:
+			print('proxy: accept failed')
+			print(e)
+			return
+
+		conn.setblocking(0)
+		if conn.family == socket.AF_INET:
+			conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		name = str(address) if address else 'unix'
+		with self.lock:
+			self.clients[conn] = FluidSynthProxyClient(conn, name)
+			self.clientCount += 1
+			self.clientPeak = max(self.clientPeak, len(self.clients))
+
+
+	# read what the client sent, and queue its requests
+	def receiveFromClient(self, conn):
+		client = self.clients.get(conn)
+		if client == None:
+			return
+		try:
+			data = conn.recv(4096)
+		except socket.error as e:
+			if e.args[0] in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+				return
+			data = ''
+		if data == '':
+			self.dropClient(client)
+			return
+		if client.quit:
+			return
+
+		lines = (client.buffer + data).split('\n')
+		client.buffer = lines.pop() # incomplete line
+		lines = [line.rstrip('\r') for line in lines]
+		lines = [line for line in lines if line.strip() != '']
+
+		requests = []
+		for i in range(0, len(lines), self.maxLines):
+			requests.extend(self.makeRequests(client, lines[i:i+self.maxLines]))
+
+		if len(requests) > 0:
+			self.queueRequests(client, requests)
+
+
+	# turn lines into requests.  lines with an urgent command are sent
+	# on their own, so they can skip the queue.  quit is not sent: it would
+	# close the connection to fluidsynth, for every client.
+	def makeRequests(self, client, lines):
+		requests = []
+		normal = []
+		for line in lines:
+			verb = line.split(None, 1)[0]
+			if verb == 'quit':
+				client.quit = True
+				break
+			if verb in self.urgentCommands:
+				if len(normal) > 0:
+					requests.append(FluidSynthProxyRequest(client, '\n'.join(normal)))
+					normal = []
+				requests.append(FluidSynthProxyRequest(client, line, True))
+			else:
+				normal.append(line)
+		if len(normal) > 0:
+			requests.append(FluidSynthProxyRequest(client, '\n'.join(normal)))
+
+		if client.quit:
+			# answered once the requests before it are
+			request = FluidSynthProxyRequest(client, '')
+			request.data = ''
+			request.close = True
+			requests.append(request)
+		return requests
+
+
+	def queueRequests(self, client, requests):
+		with self.lock:
+			for request in requests:
+				client.replies.append(request)
+				if request.data != None:
+					self.answered.add(client) # answered here (quit)
+					continue
+				if request.urgent:
+					self.urgent.append(request)
+				else:
+					if len(client.queue) == 0:
+						self.ready.append(client)
+					client.queue.append(request)
+			queued = len(self.urgent) + sum([len(c.queue) for c in self.ready])
+			self.queuePeak = max(self.queuePeak, queued)
+			self.lock.notifyAll()
+
+
+	def writeToClient(self, conn):
+		client = self.clients.get(conn)
+		if client == None:
+			return
+		try:
+			sent = conn.send(client.out)
+			client.out = client.out[sent:]
+		except socket.error as e:
+			if e.args[0] in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+				return
+			self.dropClient(client)
+			return
+		if client.closing and client.isIdle():
+			self.dropClient(client)
+
+
+	# move finished replies to the output of their clients, and start
+	# writing them
+	def collectReplies(self):
+		with self.lock:
+			clients = list(self.answered)
+			self.answered.clear()
+			for client in clients:
+				client.takeReplies()
+		for client in clients:
+			if client.closed:
+				continue
+			if client.out != '':
+				self.writeToClient(client.conn)
+			elif client.closing and client.isIdle():
+				self.dropClient(client)
+
+
+	# forget a client.  its requests still in flight are read, and dropped.
+	def dropClient(self, client):
+		with self.lock:
+			client.closed = True
+			client.queue.clear()
+			if client in self.ready:
+				self.ready.remove(client)
+			if client.conn in self.clients:
+				del self.clients[client.conn]
+		try:
+			client.conn.close()
+		except socket.error:
+			pass
+
+
+	#######################################################################
+	# send thread
+	#######################################################################
+
+	# the next request: urgent ones first, then one from each client in turn
+	def nextRequest(self):
+		while len(self.urgent) > 0:
+			request = self.urgent.popleft()
+			if not request.client.closed:
+				self.urgentCount += 1
+				return request
+
+		if len(self.ready) == 0:
+			return None
+		client = self.ready.popleft()
+		request = client.queue.popleft()
+		if len(client.queue) > 0:
+			self.ready.append(client) # back of the line
+		return request
+
+
+	# send requests whenever fewer than maxInFlight commands are waiting on 
+	# fluidsynth.  an urgent request only waits for those, so keep it small.
+	# all requests picked in one pass are written at once (see FluidSynthBatch)
+	def runSend(self):
+		while True:
+			with self.lock:
+				while not self.closed and (self.inFlightLines >= self.maxInFlight or
+						(len(self.urgent) == 0 and len(self.ready) == 0)):
+					self.lock.wait()
+				if self.closed:
+					return
+				requests = []
+				lines = self.inFlightLines
+				while lines < self.maxInFlight:
+					request = self.nextRequest()
+					if request == None:
+						break
+					requests.append(request)
+					lines += request.lines
+
+			# NOTE: not holding the lock, a full socket must not stop the 
+			# receive thread
+			try:
+				with self.api.batch():
+					for request in requests:
+						request.reply = self.api.cmdPipelined(request.packet)
+			except Exception as e:
+				print('proxy: could not send to fluidsynth')
+				print(e)
+				with self.lock:
+					for request in requests:
+						request.data = 'error: fluidsynth not connected\n'
+						self.answered.add(request.client)
+				self.wake()
+				continue
+
+			with self.lock:
+				self.inFlight.extend(requests)
+				self.inFlightLines += sum([request.lines for request in requests])
+				self.requestCount += len(requests)
+				self.lock.notifyAll()
+
+
+	#######################################################################
+	# receive thread
+	#######################################################################
+
+	# read replies in the order the requests were sent
+	def runReceive(self):
+		while True:
+			with self.lock:
+				while not self.closed and len(self.inFlight) == 0:
+					self.lock.wait()
+				if self.closed:
+					return
+				request = self.inFlight[0]
+
+			data = request.reply.result()
+
+			with self.lock:
+				request.data = data
+				self.inFlight.popleft()
+				self.inFlightLines -= request.lines
+				self.answered.add(request.client)
+				self.lock.notifyAll() # room for the send thread
+			self.wake()
+
+
+	#######################################################################
+	# counters
+	#######################################################################
+
+	def getText(self):
+		with self.lock:
+			return ('clients: ' + str(len(self.clients)) +
+				'  accepted: ' + str(self.clientCount) +
+				'  peak: ' + str(self.clientPeak) + '\n' +
+				'requests: ' + str(self.requestCount) +
+				'  urgent: ' + str(self.urgentCount) +
+				'  peak queue: ' + str(self.queuePeak) + '\n')
+
+
+# end class
+
+
+# main
+if __name__ == '__main__':
+
+	parser = optparse.OptionParser(usage='%prog [options] [fluidsynth command ...]')
+	parser.add_option('--listen', action='store', type='int', dest='listen',
+		help='tcp port for clients (default 9801, -1 = none)', default=9801)
+	parser.add_option('--listen-host', action='store', dest='listenHost',
+		help='address for clients (default localhost)', default='localhost')
+	parser.add_option('--unix', action='store', dest='unix',
+		help='also accept clients on this unix socket file', default='')
+	parser.add_option('--max-in-flight', action='store', type='int', dest='maxInFlight',
+		help='max commands waiting on fluidsynth at once (default 32). a reset waits for these', default=32)
+	addApiOptions(parser)
+	options, args = parser.parse_args()
+
+	if options.engines > 1:
+		print('error: the proxy uses one engine, --engines is not supported')
+		sys.exit(2)
+
+	api = openApi(options, args)
+	if not api.connected:
+		sys.exit(2)
+
+	proxy = FluidSynthProxy(api, options.listen, options.unix,
+		options.listenHost, options.maxInFlight)
+	proxy.start()
+	if options.listen >= 0:
+		print('proxy listening on port ' + str(proxy.port))
+	if options.unix != '':
+		print('proxy listening on ' + options.unix)
+
+	try:
+		while True:
+			time.sleep(60)
+			if options.debug:
+				print(proxy.getText())
+	except KeyboardInterrupt:
+		pass
+
+	proxy.close()
+	print(proxy.getText())
+	if options.stats:
+		print(api.stats.getText())
+	api.closeFluidSynth()
+
+# end main